@@ -0,0 +1,151 @@
+"""
+Persistent database of analysis results, so re-runs only analyze new or changed captures.
+
+Every packet result that analyze_signal() returns for a CSV file is stored in
+an SQLite file, keyed by the SHA-256 of the CSV's contents and the analysis
+settings (timing variation and the source of every module the analysis
+depends on, see analyze_signal.analysis_settings()). Each CSV path also remembers its mtime,
+size and hash, so an unchanged file is found without reading it; a file that
+was touched, copied or moved is hashed again and its stored results are still
+reused if its contents are the same.
+
+Packets are stored and read back one at a time, so analyze_signal.py can
+report a large capture as it is analyzed without holding all of its results.
+
+Tables:
+    files: path, mtime (ns), size, sha256 of the path's contents when last seen
+    analyses: sha256, settings, number of packets; written once all of them are stored
+    packets: sha256, settings, packet number, pickled packet result dict
+"""
+import hashlib
+import os
+import pickle
+import sqlite3
+
+ANALYSIS_DB_FILE = "analysis.db"
+HASH_BUFFER = 1 << 20  # Bytes hashed at a time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS analyses (
+    sha256 TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    packet_count INTEGER NOT NULL,
+    PRIMARY KEY (sha256, settings)
+);
+CREATE TABLE IF NOT EXISTS packets (
+    sha256 TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    packet BLOB NOT NULL,
+    PRIMARY KEY (sha256, settings, number)
+);
+"""
+
+
+def file_hash(path):
+    """Return the SHA-256 of a file's contents as a hex string"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BUFFER), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class AnalysisDatabase:
+    """Analysis results of CSV files, reused while the files and settings don't change.
+
+    Use as a context manager, or call close(); changes are committed on close.
+    """
+
+    def __init__(self, path=ANALYSIS_DB_FILE, settings=""):
+        """
+        Args:
+            path: SQLite file to open or create
+            settings: description of everything besides the CSV contents that the results depend on
+        """
+        self.settings = settings
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self.reused = 0  # Files whose results came from the database
+        self.stored = 0  # Files whose results were added to it
+
+    def _hash(self, csv_file):
+        """Return the SHA-256 of csv_file, from the files table if the file hasn't changed since"""
+        key = os.path.abspath(csv_file)
+        st = os.stat(csv_file)
+        row = self.connection.execute("SELECT mtime_ns, size, sha256 FROM files WHERE path = ?", (key,)).fetchone()
+        if row is not None and row[:2] == (st.st_mtime_ns, st.st_size):
+            return row[2]
+        sha256 = file_hash(csv_file)
+        self.connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                                (key, st.st_mtime_ns, st.st_size, sha256))
+        return sha256
+
+    def lookup(self, csv_file):
+        """Return the stored results for csv_file, or None if it is new or has changed.
+
+        Returns:
+            A generator of the packet result dicts, read from the database one at a time, or None.
+        """
+        try:
+            sha256 = self._hash(csv_file)
+        except OSError:
+            return None
+        row = self.connection.execute("SELECT packet_count FROM analyses WHERE sha256 = ? AND settings = ?",
+                                      (sha256, self.settings)).fetchone()
+        if row is None:
+            return None
+        self.reused += 1
+        return self._iter_packets(csv_file, sha256)
+
+    def _iter_packets(self, csv_file, sha256):
+        cursor = self.connection.execute("SELECT packet FROM packets WHERE sha256 = ? AND settings = ? "
+                                         "ORDER BY number", (sha256, self.settings))
+        for (blob,) in cursor:
+            packet = pickle.loads(blob)
+            packet['csv_file'] = csv_file  # The same contents may have been stored under another name
+            yield packet
+
+    def storing(self, csv_file, packets):
+        """Pass the packets of csv_file through unchanged while storing them.
+
+        The results are only reused once the packets have been read to the end;
+        if the analysis fails part way, nothing is reused.
+        """
+        try:
+            sha256 = self._hash(csv_file)
+        except OSError:
+            yield from packets
+            return
+        key = (sha256, self.settings)
+        self.connection.execute("DELETE FROM analyses WHERE sha256 = ? AND settings = ?", key)
+        self.connection.execute("DELETE FROM packets WHERE sha256 = ? AND settings = ?", key)
+        count = 0
+        for packet in packets:
+            self.connection.execute("INSERT INTO packets VALUES (?, ?, ?, ?)",
+                                    key + (count, pickle.dumps(packet, pickle.HIGHEST_PROTOCOL)))
+            count += 1
+            yield packet
+        self.connection.execute("INSERT INTO analyses VALUES (?, ?, ?)", key + (count,))
+        self.stored += 1
+
+    def store(self, csv_file, packets):
+        """Store the results of analyzing csv_file"""
+        for _ in self.storing(csv_file, packets):
+            pass
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,35 +1,40 @@
 #!/usr/bin/env python3
 import csv
+import hashlib
 import os
+import glob
 import argparse
+import contextlib
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import edge_cache
+import ir_decoder
+import saleae_binary
+from ir_decoder import decode_packet, decode_repetition, format_frame
+from edge_cache import cached_edges, caching_edges, load_edge_cache_numpy, write_edge_cache_numpy
+from analysis_db import ANALYSIS_DB_FILE, AnalysisDatabase
+from saleae_binary import BINARY_SUFFIX, is_binary_export, load_binary_edges_numpy, read_binary_edges
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "firmware"))
+import ir_protocols  # noqa: E402
+from ir_protocols import IR_PROTOCOLS, ProtocolIndex  # noqa: E402
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # Configurable settings
 TIMING_VARIATION_PCT = 25  # Default allowable variation in timing (percentage)
+PACKET_GAP_S = 0.1  # A gap longer than this (seconds) separates packets
+REPETITION_GAP_S = 0.01  # A gap longer than this (seconds) separates repetitions within a packet
+CSV_READ_BUFFER = 1 << 20  # Bytes read from the CSV file at a time
+ANALYSIS_ERRORS = (OSError, ValueError, csv.Error)  # A file that raises one of these is reported as failed
+MIN_PROTOCOL_SCORE = 0.25  # Packets whose best protocol scores lower (see score_protocol()) are low confidence
 
-# Define IR protocols based on irmpSelectMain15Protocols.h from IRMP GitHub repository
-# Format: (protocol_name, carrier_frequency, pulse_1, pause_1, pulse_0, pause_0, header_pulse, header_pause, address_bits, command_bits, stop_bit, lsb_first, flags)
-# All times in microseconds
-IR_PROTOCOLS = [
-    # Protocol name, carrier, pulse1, pause1, pulse0, pause0, header_pulse, header_pause, address_bits, command_bits, stop_bit, lsb_first, flags
-    ("SIRCS", 40000, 1200, 600, 600, 600, 2400, 600, 12, 12, False, False, None),  # Corrected SIRCS (Sony) values
-    ("NEC", 38000, 560, 1690, 560, 560, 9000, 4500, 16, 16, True, True, None),
-    ("APPLE", 38000, 560, 1690, 560, 560, 9000, 4500, 8, 16, True, False, None),
-    ("SAMSUNG", 38000, 550, 1650, 550, 550, 4500, 4500, 16, 16, True, True, None),
-    ("MATSUSHITA", 36000, 400, 1200, 400, 400, 3500, 3500, 12, 12, True, False, None),
-    ("KASEIKYO", 37000, 500, 1500, 500, 500, 3400, 1700, 16, 16, True, False, None),
-    ("RECS80", 38000, 158, 7432, 158, 4902, 0, 0, 4, 6, False, False, None),
-    ("RC5", 36000, 889, 889, 889, 889, 889, 889, 5, 6, False, False, "RC5"),
-    ("DENON", 38000, 275, 1900, 275, 775, 0, 0, 5, 10, False, False, None),
-    ("RC6", 36000, 444, 444, 444, 444, 2666, 889, 8, 8, True, True, "RC6"),
-    ("SAMSUNG32", 38000, 500, 1500, 500, 500, 4500, 4500, 16, 16, True, True, None),
-    ("RECS80EXT", 38000, 158, 7432, 158, 4902, 0, 0, 4, 6, False, False, None),
-    # ("NUBERT", 38000, 340, 1700, 340, 680, 0, 0, 0, 10, False, False, None),
-    # ("BANG_OLUFSEN", 38000, 200, 3125, 200, 9375, 0, 0, 16, 8, False, False, None),
-    # ("GRUNDIG", 38000, 528, 528, 528, 1056, 6336, 3168, 0, 8, True, False, None),
-    # added protocols
-    # ("THOMSON", 36000, 500, 1500, 500, 500, 8000, 2500, 8, 8, True, True, None),
-    ("NEC16", 38000, 560, 1690, 560, 560, 9000, 4500, 8, 8, True, True, None),
-]
+# IR_PROTOCOLS, the table of known protocols and their timings, is in firmware/ir_protocols.py
 
 
 def calculate_variation(measured, reference):
@@ -39,77 +44,138 @@ def calculate_variation(measured, reference):
     return (measured - reference) / reference * 100  # Return signed variation
 
 
+_protocol_index = None
+
+
+def get_protocol_index():
+    """Return the ProtocolIndex for IR_PROTOCOLS and TIMING_VARIATION_PCT, rebuilding it if either changed"""
+    global _protocol_index
+    index = _protocol_index
+    if (index is None or index.variation_pct != TIMING_VARIATION_PCT or
+            index.protocols is not IR_PROTOCOLS or len(index.windows) != len(IR_PROTOCOLS)):
+        index = _protocol_index = ProtocolIndex(IR_PROTOCOLS, TIMING_VARIATION_PCT)
+    return index
+
+
 def match_protocol(pulse_min, pulse_max, pause_min, pause_max, header_pulse=None, header_pause=None):
-    """Match timing values to known IR protocols, allowing configurable variation"""
-    matches = []
+    """Match timing values to known IR protocols, allowing configurable variation.
+
+    Matching is done by ir_protocols.ProtocolIndex, as on the device.
+    Returns:
+        (names of the matching protocols, {name: header variations (%) or None each})
+    """
+    index = get_protocol_index()
+    matches = index.match(pulse_min, pulse_max, pause_min, pause_max, header_pulse, header_pause)
     variations = {}
+    for name in matches:
+        header_pulse_variation = None
+        header_pause_variation = None
+        avg_variation = None
+        _, _, _, _, _, _, hp, hpa, _, _, _, _, _ = index.by_name[name]
+        if header_pulse is not None and header_pause is not None and hp > 0 and hpa > 0:
+            header_pulse_variation = calculate_variation(header_pulse, hp)
+            header_pause_variation = calculate_variation(header_pause, hpa)
+            avg_variation = (abs(header_pulse_variation) + abs(header_pause_variation)) / 2
+        variations[name] = {
+            'header_pulse_variation': header_pulse_variation,
+            'header_pause_variation': header_pause_variation,
+            'avg_header_variation': avg_variation
+        }
+    return matches, variations
 
-    for protocol in IR_PROTOCOLS:
-        name, _, pulse1, pause1, pulse0, pause0, hp, hpa, _, _, _, _, _ = protocol
-
-        # Check if pulse and pause ranges overlap with protocol values (allowing configured variation)
-        variation_factor = TIMING_VARIATION_PCT / 100.0
-
-        pulse1_min = pulse1 * (1 - variation_factor)
-        pulse1_max = pulse1 * (1 + variation_factor)
-        pause1_min = pause1 * (1 - variation_factor)
-        pause1_max = pause1 * (1 + variation_factor)
-        pulse0_min = pulse0 * (1 - variation_factor)
-        pulse0_max = pulse0 * (1 + variation_factor)
-        pause0_min = pause0 * (1 - variation_factor)
-        pause0_max = pulse0 * (1 + variation_factor)
-
-        # Check for pulse/pause pattern matches
-        pulse_match = False
-        pause_match = False
-
-        # Check if our measured pulse range overlaps with either pulse0 or pulse1 range
-        if (pulse_min <= pulse1_max and pulse_max >= pulse1_min) or (pulse_min <= pulse0_max and pulse_max >= pulse0_min):
-            pulse_match = True
-
-        # Check if our measured pause range overlaps with either pause0 or pause1 range
-        if (pause_min <= pause1_max and pause_max >= pause1_min) or (pause_min <= pause0_max and pause_max >= pause0_min):
-            pause_match = True
-
-        # If both pulse and pause match, check header if provided
-        if pulse_match and pause_match:
-            header_match = True
-            header_pulse_variation = None
-            header_pause_variation = None
-
-            # If header values are provided, check them too
-            if header_pulse is not None and header_pause is not None and hp > 0 and hpa > 0:
-                hp_min = hp * (1 - variation_factor)
-                hp_max = hp * (1 + variation_factor)
-                hpa_min = hpa * (1 - variation_factor)
-                hpa_max = hpa * (1 + variation_factor)
-
-                if not (header_pulse >= hp_min and header_pulse <= hp_max and
-                        header_pause >= hpa_min and header_pause <= hpa_max):
-                    header_match = False
-                else:
-                    # Calculate actual variations for header pulse and pause
-                    header_pulse_variation = calculate_variation(
-                        header_pulse, hp)
-                    header_pause_variation = calculate_variation(
-                        header_pause, hpa)
-
-            if header_match:
-                matches.append(name)
-
-                # Calculate average variation
-                avg_variation = None
-                if header_pulse_variation is not None and header_pause_variation is not None:
-                    avg_variation = (abs(header_pulse_variation) +
-                                     abs(header_pause_variation)) / 2
-
-                variations[name] = {
-                    'header_pulse_variation': header_pulse_variation,
-                    'header_pause_variation': header_pause_variation,
-                    'avg_header_variation': avg_variation
-                }
 
-    return matches, variations
+def symbol_durations(protocol):
+    """Return the durations (µs) that the marks and the spaces of a protocol's frames are made of, after the header"""
+    _, _, pulse1, pause1, pulse0, pause0, _, _, _, _, _, _, flags = protocol
+    if flags == "RC5":
+        return (pulse1, 2 * pulse1), (pulse1, 2 * pulse1)
+    if flags is not None and flags.startswith("RC6"):
+        # Half-bits merge into one or two units, or three next to the double-length toggle bit
+        units = (pulse1, 2 * pulse1, 3 * pulse1)
+        return units, units
+    return (pulse0, pulse1), (pause0, pause1)
+
+
+def score_protocol(durations, protocol):
+    """Score how well the first repetition of a packet fits a protocol.
+
+    The timing error is the mean relative error of every mark and space from the
+    nearest duration the protocol uses (its header, then its bit symbols); it
+    scales the score by variation / (variation + error), so an error as large
+    as TIMING_VARIATION_PCT halves it. The bit agreement compares the number of
+    bits decoded with the protocol's address_bits + command_bits (the decoder
+    counts the trailing mark as a stop pulse or as a data bit, according to
+    stop_bit). The table's bit counts are nominal (real SIRCS and KASEIKYO
+    codes come in several lengths), so a different count halves the score at
+    most, and a repetition that can't be decoded as the protocol quarters it.
+
+    Args:
+        durations: mark/space durations (µs) of the first repetition, starting with a mark
+        protocol: an IR_PROTOCOLS entry
+    Returns:
+        dict with 'score' (0..1, higher is better), 'timing_error_pct' and 'bits'
+    """
+    hp, hpa = protocol[6], protocol[7]
+    marks, spaces = symbol_durations(protocol)
+    errors = []
+    start = 0
+    if hp > 0 and hpa > 0 and protocol[12] != "RC5" and len(durations) > 2:
+        errors.append(abs(durations[0] - hp) / hp)
+        errors.append(abs(durations[1] - hpa) / hpa)
+        start = 2
+    for k in range(start, len(durations)):
+        symbols = marks if k % 2 == 0 else spaces
+        errors.append(min(abs(durations[k] - symbol) / symbol for symbol in symbols))
+    timing_error = sum(errors) / len(errors) if errors else 1.0
+
+    frame = decode_repetition(durations, protocol, TIMING_VARIATION_PCT)
+    bits = frame.bits if frame is not None else 0
+    expected = protocol[8] + protocol[9]
+    if frame is None:
+        agreement = 0.25
+    elif frame.repeat and not frame.bits:
+        agreement = 1.0  # A short repeat code carries no bits to count
+    else:
+        agreement = 0.5 + 0.5 * max(0.0, 1 - abs(bits - expected) / expected)
+    variation = TIMING_VARIATION_PCT / 100
+    timing = variation / (variation + timing_error)
+    return {'score': agreement * timing, 'timing_error_pct': timing_error * 100, 'bits': bits}
+
+
+def rank_protocols(names, durations):
+    """Sort the protocols that match a packet by how well its first repetition fits them (see score_protocol()).
+
+    Args:
+        names: names of the matching protocols, as match_protocol() returns them
+        durations: mark/space durations (µs) of the first repetition
+    Returns:
+        (names sorted best first, {name: score dict})
+    """
+    by_name = get_protocol_index().by_name
+    scores = {name: score_protocol(durations, by_name[name]) for name in names}
+    return sorted(names, key=lambda name: -scores[name]['score']), scores
+
+
+def linear_match_baseline(pulse_min, pulse_max, pause_min, pause_max, header_pulse=None, header_pause=None,
+                          protocols=None):
+    """Match timing values to protocols by checking every one of them in turn.
+
+    Only a baseline for benchmark_matcher(), which checks that it gives the
+    same names as ProtocolIndex.match(); the analysis never uses it.
+    """
+    low = 1 - TIMING_VARIATION_PCT / 100
+    high = 1 + TIMING_VARIATION_PCT / 100
+    matches = []
+    for name, _, pulse1, pause1, pulse0, pause0, hp, hpa, _, _, _, _, _ in protocols or IR_PROTOCOLS:
+        if not any(pulse_min <= reference * high and pulse_max >= reference * low for reference in (pulse1, pulse0)):
+            continue
+        if not any(pause_min <= reference * high and pause_max >= reference * low for reference in (pause1, pause0)):
+            continue
+        if header_pulse is not None and header_pause is not None and hp > 0 and hpa > 0:
+            if not (hp * low <= header_pulse <= hp * high and hpa * low <= header_pause <= hpa * high):
+                continue
+        matches.append(name)
+    return matches
 
 
 def bits_to_hex(bits):
@@ -131,6 +197,16 @@ def bits_to_hex(bits):
     
     return hex_str
 
+def first_repetition_durations(packet):
+    """Return the edge durations (µs) of the first repetition of an analyzed packet"""
+    durations = packet['durations_us']
+    gap_us = REPETITION_GAP_S * 1_000_000
+    for i, duration in enumerate(durations):
+        if duration > gap_us:  # Gap > 10ms indicates end of repetition
+            return durations[:i]
+    return durations
+
+
 def extract_bits_from_first_repetition(packet):
     """Extract bits from the first repetition based on pause durations"""
     # If no header or timing info, return empty list
@@ -139,62 +215,12 @@ def extract_bits_from_first_repetition(packet):
         packet['max_pause_us'] == 'N/A'):
         return []
     
-    # Get the original CSV data for this packet
-    with open(packet['csv_file'], 'r') as f:
-        reader = csv.reader(f)
-        rows = list(reader)
-    
-    # Find the packet boundaries
-    start_time = packet['start_time']
-    
-    # Find the start index in the CSV data
-    start_idx = None
-    for i, row in enumerate(rows):
-        if len(row) >= 2:
-            try:
-                time = float(row[0])
-                if time == start_time:
-                    start_idx = i
-                    break
-            except ValueError:
-                continue
-    
-    if start_idx is None:
-        return []  # Can't find the start
+    durations = first_repetition_durations(packet)
     
-    # Find the end of the first repetition
-    end_idx = len(rows)
-    for i in range(start_idx + 1, len(rows)):
-        if len(rows[i]) >= 2:
-            try:
-                time_diff = float(rows[i][0]) - float(rows[i-1][0])
-                if time_diff > 0.01:  # Gap > 10ms indicates end of repetition
-                    end_idx = i
-                    break
-            except ValueError:
-                continue
-    
-    # Extract the timing values for the first repetition
-    times = []
-    states = []
-    
-    for i in range(start_idx, end_idx):
-        if len(rows[i]) >= 2:
-            try:
-                times.append(float(rows[i][0]))
-                states.append(int(rows[i][1]))
-            except ValueError:
-                continue
-    
-    # Skip if too short
-    if len(times) < 4:
+    # Skip if too short (fewer than 4 edges)
+    if len(durations) < 3:
         return []
     
-    # Calculate durations
-    durations = []
-    for i in range(1, len(times)):
-        durations.append((times[i] - times[i-1]) * 1_000_000)  # Convert to microseconds
-    
     # Skip header if present
     start_idx = 0
     if packet['header_pulse'] is not None:
@@ -214,166 +240,407 @@ def extract_bits_from_first_repetition(packet):
     
     return bits
 
-def analyze_signal(csv_file):
-    # Load the CSV file
-    times = []
-    states = []
-    with open(csv_file, 'r') as f:
+def read_edges(csv_file):
+    """Yield (row_index, time, state) for each edge in a Saleae CSV export.
+
+    row_index is the 0-based row number in the CSV file (the header is row 0).
+    The file is read through a large buffer and parsed row by row, so memory
+    use does not depend on the size of the capture.
+    """
+    with open(csv_file, 'r', buffering=CSV_READ_BUFFER, newline='') as f:
         reader = csv.reader(f)
-        for row in reader:
+        for row_index, row in enumerate(reader):
             if len(row) >= 2:
                 if row[0].startswith("Time") or float(row[0]) < 0:
                     continue
-                times.append(float(row[0]))
-                states.append(int(row[1]))
-
-    # Calculate time differences
-    time_diffs = [0]
-    for i in range(1, len(times)):
-        time_diffs.append(times[i] - times[i-1])
-
-    # Find packet boundaries (gaps > 100ms)
-    packet_starts = []
-    for i in range(1, len(times)):
-        if time_diffs[i] > 0.1 and states[i] == 0:
-            packet_starts.append(i)
-
-    # Add the first packet start if it's not already included
-    if 0 not in packet_starts and states[0] == 0:
-        packet_starts = [0] + packet_starts
-
-    # Process each packet
-    results = []
-    for i, start_idx in enumerate(packet_starts):
-        end_idx = packet_starts[i +
-                                1] if i < len(packet_starts)-1 else len(times)
-
-        packet_times = times[start_idx:end_idx]
-        packet_states = states[start_idx:end_idx]
-
-        # Skip if packet is too small
-        if len(packet_times) < 4:  # Need at least 2 bits (4 records)
+                yield row_index, float(row[0]), int(row[1])
+
+
+def split_packets(edges):
+    """Group an edge stream into packets as soon as their gaps are seen.
+
+    A packet starts on a falling edge (state 0) preceded by a gap > 100ms, or on
+    the very first edge if it is a falling edge. Edges before the first packet
+    start are dropped. Within a packet, a falling edge preceded by a gap of
+    10ms..100ms starts a new repetition.
+
+    Args:
+        edges: iterable of (row_index, time, state) tuples, such as read_edges() returns.
+    Yields:
+        (packet_number, rows, times, states, repetition_starts) for each packet.
+        packet_number is 1-based; rows is the (start, end) range of CSV rows
+        holding the packet, end exclusive; repetition_starts are indices into times.
+    """
+    number = 0
+    times = states = repetition_starts = None
+    start_row = end_row = None
+    prev_time = None
+    for row_index, time, state in edges:
+        gap = None if prev_time is None else time - prev_time
+        prev_time = time
+        if state == 0 and (gap is None or gap > PACKET_GAP_S):
+            if times is not None:
+                yield number, (start_row, end_row), times, states, repetition_starts
+            number += 1
+            times, states, repetition_starts = [], [], [0]
+            start_row = row_index
+        elif times is None:
             continue
+        elif state == 0 and REPETITION_GAP_S < gap < PACKET_GAP_S:
+            repetition_starts.append(len(times))
+        times.append(time)
+        states.append(state)
+        end_row = row_index + 1
+    if times is not None:
+        yield number, (start_row, end_row), times, states, repetition_starts
+
+
+def load_edges_numpy(csv_file):
+    """Load a Saleae CSV export into NumPy arrays.
+
+    Returns:
+        (rows, times, states) arrays, with the same filtering as read_edges().
+    """
+    data = np.loadtxt(csv_file, delimiter=',', skiprows=1, usecols=(0, 1), ndmin=2)
+    keep = data[:, 0] >= 0
+    rows = np.flatnonzero(keep) + 1  # Row 0 is the header
+    return rows, data[keep, 0], data[keep, 1].astype(np.int8)
+
+
+def split_packets_numpy(rows, times, states):
+    """Vectorized equivalent of split_packets() for edges held in NumPy arrays.
+
+    The edge gaps are computed once with np.diff, and packet and repetition
+    boundaries are found with boolean masks. Yields the same tuples as
+    split_packets().
+    """
+    if len(times) == 0:
+        return
+    gaps = np.diff(times)
+    falling = states == 0
+    packet_mask = falling.copy()
+    packet_mask[1:] &= gaps > PACKET_GAP_S
+    repetition_mask = np.zeros_like(falling)
+    repetition_mask[1:] = falling[1:] & (gaps > REPETITION_GAP_S) & (gaps < PACKET_GAP_S)
+
+    packet_starts = np.flatnonzero(packet_mask)
+    packet_ends = np.append(packet_starts[1:], len(times))
+    repetition_idx = np.flatnonzero(repetition_mask)
+    # Split the repetition starts up by the packet they fall in
+    splits = np.searchsorted(repetition_idx, packet_starts)
+    splits = np.append(splits, len(repetition_idx))
+
+    for number, (start, end) in enumerate(zip(packet_starts.tolist(), packet_ends.tolist()), 1):
+        packet_reps = repetition_idx[splits[number - 1]:splits[number]] - start
+        yield (number, (int(rows[start]), int(rows[end - 1]) + 1),
+               times[start:end].tolist(), states[start:end].tolist(),
+               [0] + packet_reps.tolist())
+
 
-        # Get the start time of the packet
-        start_time = packet_times[0]
-
-        # Find repetition boundaries within the packet (gaps > 10ms but < 100ms)
-        repetition_starts = [0]  # Always include the start of the packet
-        for j in range(1, len(packet_times)):
-            if packet_states[j] == 0 and packet_times[j] - packet_times[j-1] > 0.01 and packet_times[j] - packet_times[j-1] < 0.1:
-                repetition_starts.append(j)
-
-        # Calculate repetition spacings
-        repetition_spacings = []
-        for j in range(1, len(repetition_starts)):
-            prev_end_idx = repetition_starts[j] - 1
-            spacing = packet_times[repetition_starts[j]] - packet_times[prev_end_idx]
-            repetition_spacings.append(spacing * 1_000_000)  # Convert to microseconds
-
-        first_header_pulse = None
-        first_header_pause = None
-
-        # Process each repetition to extract bits
-        all_repetition_bits = []
-        for j, rep_start_idx in enumerate(repetition_starts):
-            rep_end_idx = repetition_starts[j+1] if j+1 < len(repetition_starts) else len(packet_times)
-
-            rep_times = packet_times[rep_start_idx:rep_end_idx]
-            rep_states = packet_states[rep_start_idx:rep_end_idx]
-
-            # Check for header (first pulse and pause if they're significantly longer)
-            header_pulse = None
-            header_pause = None
-            if len(rep_times) >= 4:
-                first_pulse = (rep_times[1] - rep_times[0]) * 1_000_000
-                first_pause = (rep_times[2] - rep_times[1]) * 1_000_000
-
-                # Look at subsequent pulses to determine if this is a header
-                other_pulses = []
-                for k in range(2, len(rep_times)-1, 2):
-                    if k+1 < len(rep_times) and rep_states[k] == 0 and rep_states[k+1] == 1:
-                        other_pulses.append(
-                            (rep_times[k+1] - rep_times[k]) * 1_000_000)
-
-                if other_pulses and (first_pulse > 2 * min(other_pulses) or first_pause > 2 * min(other_pulses)):
-                    header_pulse = first_pulse
-                    header_pause = first_pause
-
-            # Group into bits (each bit is a 0 followed by a 1)
-            bits = []
-            start_k = 0 if header_pulse is None else 2  # Skip header if present
-
-            for k in range(start_k, len(rep_times)-1, 2):
+def use_numpy(backend):
+    """Decide whether the NumPy backend should be used for the given backend name"""
+    if backend == 'numpy':
+        if np is None:
+            raise ImportError("The numpy backend requires NumPy to be installed")
+        return True
+    return False
+
+
+def analyze_signal(csv_file, backend='python', use_cache=True):
+    """Analyze every packet in a Saleae CSV export and return a list of result dicts
+
+    Args:
+        csv_file: Saleae CSV export to analyze
+        backend: 'python' (streaming) or 'numpy' (requires NumPy)
+        use_cache: use (and create) the binary edge cache next to csv_file
+    """
+    return list(iter_analyze_signal(csv_file, backend, use_cache))
+
+
+def load_edges(csv_file, backend='python', use_cache=True):
+    """Load the edges of a capture, from its binary edge cache if it has a valid one.
+
+    Logic 2 binary exports (.bin, see saleae_binary.py) are read directly and
+    need no cache.
+
+    Args:
+        csv_file: Saleae CSV or binary export
+        backend: 'python' or 'numpy', as for analyze_signal()
+        use_cache: read and write the edge cache sidecar next to csv_file
+    Returns:
+        (rows, times, states) arrays for the NumPy backend, otherwise an
+        iterable of (row_index, time, state) tuples.
+    """
+    if is_binary_export(csv_file):
+        return load_binary_edges_numpy(csv_file) if use_numpy(backend) else read_binary_edges(csv_file)
+    if use_numpy(backend):
+        edges = load_edge_cache_numpy(csv_file) if use_cache else None
+        if edges is None:
+            edges = load_edges_numpy(csv_file)
+            if use_cache:
+                write_edge_cache_numpy(csv_file, *edges)
+        return edges
+    edges = cached_edges(csv_file) if use_cache else None
+    if edges is None:
+        edges = read_edges(csv_file)
+        if use_cache:
+            edges = caching_edges(csv_file, edges)
+    return edges
+
+
+def iter_analyze_signal(csv_file, backend='python', use_cache=True):
+    """Analyze a Saleae CSV export one packet at a time, yielding a result dict per packet.
+
+    With the default 'python' backend memory use is bounded by the largest
+    packet, not by the size of the file. The 'numpy' backend loads all the
+    edges into arrays (much smaller than Python lists) and segments them in
+    vectorized form; it is only used when asked for.
+    Either way, the parsed edges are kept in a binary sidecar (see edge_cache)
+    so later runs don't have to parse the CSV again.
+    """
+    if use_numpy(backend):
+        packets = split_packets_numpy(*load_edges(csv_file, backend, use_cache))
+    else:
+        packets = split_packets(load_edges(csv_file, backend, use_cache))
+    for i, rows, packet_times, packet_states, repetition_starts in packets:
+        result = analyze_packet(csv_file, i, packet_times, packet_states, repetition_starts, rows)
+        if result is not None:
+            yield result
+
+
+def durations_to_edges(durations_us):
+    """Yield (row_index, time, state) edges, like read_edges(), for a code given as
+    mark/space durations in microseconds (starting with a mark), as an IR receiver
+    module (low while it sees the carrier) would have recorded it."""
+    time = 0.0
+    state = 0
+    yield 0, time, state
+    for row_index, duration in enumerate(durations_us, 1):
+        time += duration / 1_000_000
+        state ^= 1
+        yield row_index, time, state
+
+
+def analyze_durations(durations_us, name='code'):
+    """Analyze a code given as durations, such as a CODES entry without its name.
+
+    Returns:
+        The result dict for the code's first packet, or None if it can't be analyzed.
+    """
+    for i, rows, packet_times, packet_states, repetition_starts in split_packets(durations_to_edges(durations_us)):
+        return analyze_packet(name, i, packet_times, packet_states, repetition_starts, rows)
+    return None
+
+
+def protocol_carrier(protocol_name):
+    """Return the carrier frequency (Hz) of a protocol in IR_PROTOCOLS"""
+    return get_protocol_index().by_name[protocol_name][1]
+
+
+def analyze_packet(csv_file, packet_number, packet_times, packet_states, repetition_starts, rows=(None, None)):
+    """Analyze a single packet.
+
+    Args:
+        csv_file: name of the CSV file the packet came from
+        packet_number: 1-based packet number within the file
+        packet_times: edge times in seconds
+        packet_states: edge states (0 or 1)
+        repetition_starts: indices into packet_times where each repetition begins
+        rows: (start, end) range of CSV rows holding the packet, end exclusive
+    Returns:
+        A result dict, or None if the packet is too short to analyze.
+    """
+    # Skip if packet is too small
+    if len(packet_times) < 4:  # Need at least 2 bits (4 records)
+        return None
+
+    # Get the start time of the packet
+    start_time = packet_times[0]
+
+    # Edge durations for the whole packet, kept so that hex extraction and
+    # Python export don't have to re-read the CSV file
+    durations_us = [(packet_times[k] - packet_times[k-1]) * 1_000_000 for k in range(1, len(packet_times))]
+
+    # Calculate repetition spacings
+    repetition_spacings = []
+    for j in range(1, len(repetition_starts)):
+        prev_end_idx = repetition_starts[j] - 1
+        spacing = packet_times[repetition_starts[j]] - packet_times[prev_end_idx]
+        repetition_spacings.append(spacing * 1_000_000)  # Convert to microseconds
+
+    first_header_pulse = None
+    first_header_pause = None
+
+    # Process each repetition to extract bits
+    all_repetition_bits = []
+    for j, rep_start_idx in enumerate(repetition_starts):
+        rep_end_idx = repetition_starts[j+1] if j+1 < len(repetition_starts) else len(packet_times)
+
+        rep_times = packet_times[rep_start_idx:rep_end_idx]
+        rep_states = packet_states[rep_start_idx:rep_end_idx]
+
+        # Check for header (first pulse and pause if they're significantly longer)
+        header_pulse = None
+        header_pause = None
+        if len(rep_times) >= 4:
+            first_pulse = (rep_times[1] - rep_times[0]) * 1_000_000
+            first_pause = (rep_times[2] - rep_times[1]) * 1_000_000
+
+            # Look at subsequent pulses to determine if this is a header
+            other_pulses = []
+            for k in range(2, len(rep_times)-1, 2):
                 if k+1 < len(rep_times) and rep_states[k] == 0 and rep_states[k+1] == 1:
-                    pulse_time = rep_times[k+1] - rep_times[k]
-
-                    # Only calculate pause time if we're not at the end of the repetition
-                    # and the next state is 0 (start of next bit)
-                    if k+2 < len(rep_times) and rep_states[k+2] == 0:
-                        pause_time = rep_times[k+2] - rep_times[k+1]
-                    else:
-                        pause_time = None  # Mark as no pause (end of repetition)
-
-                    bits.append((pulse_time, pause_time))
-
-            all_repetition_bits.append(bits)
-
-            # Store the first header pulse and pause times
-            if j == 0 and header_pulse is not None:
-                first_header_pulse = header_pulse
-                first_header_pause = header_pause
-
-        # For statistics and protocol matching, only use the first repetition
-        first_rep_bits = all_repetition_bits[0] if all_repetition_bits else []
-
-        # Bit statistics for the first repetition only
-        if first_rep_bits:
-            # Only include valid pauses (not None and not 0)
-            first_rep_pulses = [bit[0] * 1_000_000 for bit in first_rep_bits]  # Convert to microseconds
-            first_rep_pauses = [bit[1] * 1_000_000 for bit in first_rep_bits if bit[1] is not None]  # Convert to microseconds
-
-            min_pulse = min(first_rep_pulses) if first_rep_pulses else 'N/A'
-            max_pulse = max(first_rep_pulses) if first_rep_pulses else 'N/A'
-            min_pause = min(first_rep_pauses) if first_rep_pauses else 'N/A'
-            max_pause = max(first_rep_pauses) if first_rep_pauses else 'N/A'
-
-            # Try to identify protocol using only the first repetition
-            possible_protocols = []
-            protocol_variations = {}
-            if isinstance(min_pulse, float) and isinstance(max_pulse, float) and \
-               isinstance(min_pause, float) and isinstance(max_pause, float):
-                possible_protocols, protocol_variations = match_protocol(
-                    min_pulse, max_pulse, min_pause, max_pause, first_header_pulse, first_header_pause
-                )
-        else:
-            min_pulse = max_pulse = min_pause = max_pause = 'N/A'
-            possible_protocols = []
-            protocol_variations = {}
-
-        # Calculate total bits across all repetitions (for display only)
-        total_bits = sum(len(bits) for bits in all_repetition_bits)
-
-        results.append({
-            'csv_file': csv_file,  # Store the CSV filename
-            'packet': i+1,
-            'start_time': start_time,
-            'repetitions': len(repetition_starts),
-            'repetition_spacings': repetition_spacings,
-            'header_pulse': first_header_pulse,
-            'header_pause': first_header_pause,
-            'total_bits': total_bits,
-            'first_rep_bits': len(first_rep_bits),
-            'bits_per_repetition': [len(bits) for bits in all_repetition_bits],
-            'min_pulse_us': min_pulse,  # First repetition only
-            'max_pulse_us': max_pulse,  # First repetition only
-            'min_pause_us': min_pause,  # First repetition only
-            'max_pause_us': max_pause,  # First repetition only
-            'possible_protocols': possible_protocols,
-            'protocol_variations': protocol_variations
-        })
-
-    return results
+                    other_pulses.append(
+                        (rep_times[k+1] - rep_times[k]) * 1_000_000)
+
+            if other_pulses and (first_pulse > 2 * min(other_pulses) or first_pause > 2 * min(other_pulses)):
+                header_pulse = first_pulse
+                header_pause = first_pause
+
+        # Group into bits (each bit is a 0 followed by a 1)
+        bits = []
+        start_k = 0 if header_pulse is None else 2  # Skip header if present
+
+        for k in range(start_k, len(rep_times)-1, 2):
+            if k+1 < len(rep_times) and rep_states[k] == 0 and rep_states[k+1] == 1:
+                pulse_time = rep_times[k+1] - rep_times[k]
+
+                # Only calculate pause time if we're not at the end of the repetition
+                # and the next state is 0 (start of next bit)
+                if k+2 < len(rep_times) and rep_states[k+2] == 0:
+                    pause_time = rep_times[k+2] - rep_times[k+1]
+                else:
+                    pause_time = None  # Mark as no pause (end of repetition)
+
+                bits.append((pulse_time, pause_time))
+
+        all_repetition_bits.append(bits)
+
+        # Store the first header pulse and pause times
+        if j == 0 and header_pulse is not None:
+            first_header_pulse = header_pulse
+            first_header_pause = header_pause
+
+    # For statistics and protocol matching, only use the first repetition
+    first_rep_bits = all_repetition_bits[0] if all_repetition_bits else []
+
+    # Bit statistics for the first repetition only
+    if first_rep_bits:
+        # Only include valid pauses (not None and not 0)
+        first_rep_pulses = [bit[0] * 1_000_000 for bit in first_rep_bits]  # Convert to microseconds
+        first_rep_pauses = [bit[1] * 1_000_000 for bit in first_rep_bits if bit[1] is not None]  # Convert to microseconds
+
+        min_pulse = min(first_rep_pulses) if first_rep_pulses else 'N/A'
+        max_pulse = max(first_rep_pulses) if first_rep_pulses else 'N/A'
+        min_pause = min(first_rep_pauses) if first_rep_pauses else 'N/A'
+        max_pause = max(first_rep_pauses) if first_rep_pauses else 'N/A'
+
+        # Try to identify protocol using only the first repetition
+        possible_protocols = []
+        protocol_variations = {}
+        if isinstance(min_pulse, float) and isinstance(max_pulse, float) and \
+           isinstance(min_pause, float) and isinstance(max_pause, float):
+            possible_protocols, protocol_variations = match_protocol(
+                min_pulse, max_pulse, min_pause, max_pause, first_header_pulse, first_header_pause
+            )
+    else:
+        min_pulse = max_pulse = min_pause = max_pause = 'N/A'
+        possible_protocols = []
+        protocol_variations = {}
+
+    # Rank the candidates, then decode address and command of each repetition using the best one
+    protocol_scores = {}
+    decoded_frames = []
+    if possible_protocols:
+        first_end = repetition_starts[1] - 1 if len(repetition_starts) > 1 else len(durations_us)
+        first_repetition = durations_us[:first_end]
+        if len(first_repetition) % 2 == 0:
+            first_repetition = first_repetition[:-1]  # Drop the idle time to the end of the capture
+        possible_protocols, protocol_scores = rank_protocols(possible_protocols, first_repetition)
+        protocol = get_protocol_index().by_name[possible_protocols[0]]
+        decoded_frames = decode_packet(durations_us, repetition_starts, protocol, TIMING_VARIATION_PCT)
+
+    # Calculate total bits across all repetitions (for display only)
+    total_bits = sum(len(bits) for bits in all_repetition_bits)
+
+    return {
+        'csv_file': csv_file,  # Store the CSV filename
+        'packet': packet_number,
+        'start_time': start_time,
+        'repetitions': len(repetition_starts),
+        'repetition_spacings': repetition_spacings,
+        'header_pulse': first_header_pulse,
+        'header_pause': first_header_pause,
+        'total_bits': total_bits,
+        'first_rep_bits': len(first_rep_bits),
+        'bits_per_repetition': [len(bits) for bits in all_repetition_bits],
+        'min_pulse_us': min_pulse,  # First repetition only
+        'max_pulse_us': max_pulse,  # First repetition only
+        'min_pause_us': min_pause,  # First repetition only
+        'max_pause_us': max_pause,  # First repetition only
+        'possible_protocols': possible_protocols,
+        'protocol_variations': protocol_variations,
+        'protocol_scores': protocol_scores,  # score_protocol() result for each possible protocol
+        'decoded_frames': decoded_frames,  # ir_decoder.Frame (or None) per repetition
+        'start_row': rows[0],  # First CSV row of the packet
+        'end_row': rows[1],  # CSV row after the last row of the packet
+        'repetition_starts': repetition_starts,  # Edge indices where each repetition begins
+        'durations_us': durations_us,  # Duration of each edge in the packet
+    }
+
+
+
+def benchmark_backends(csv_files, repeat=5):
+    """Time the pure-Python and NumPy backends on the given CSV files and check that they agree"""
+    if np is None:
+        print("NumPy is not installed; only the python backend is available")
+        return
+    timings = {}
+    results = {}
+    for backend in ('python', 'numpy'):
+        start = perf_counter()
+        for _ in range(repeat):
+            results[backend] = [analyze_signal(csv_file, backend, use_cache=False) for csv_file in csv_files]
+        timings[backend] = (perf_counter() - start) / repeat
+    print(f"Benchmark over {len(csv_files)} files ({repeat} runs each):")
+    for backend, seconds in timings.items():
+        print(f"  {backend:6s}: {seconds * 1000:.1f}ms per pass")
+    print(f"  speedup: {timings['python'] / timings['numpy']:.2f}x")
+    print(f"  results identical: {results['python'] == results['numpy']}")
+
+
+def benchmark_matcher(csv_files, repeat=200):
+    """Time the indexed protocol matcher against the linear scan, using the full IRMP protocol table"""
+    from create_irmp_protocols_csv import IR_PROTOCOLS as IRMP_PROTOCOLS
+
+    queries = [(p['min_pulse_us'], p['max_pulse_us'], p['min_pause_us'], p['max_pause_us'],
+                p['header_pulse'], p['header_pause'])
+               for csv_file in csv_files for p in analyze_signal(csv_file)
+               if isinstance(p['min_pulse_us'], float) and isinstance(p['min_pause_us'], float)]
+    if not queries:
+        print("No packets to match")
+        return
+
+    start = perf_counter()
+    index = ProtocolIndex(IRMP_PROTOCOLS, TIMING_VARIATION_PCT)
+    build_time = perf_counter() - start
+
+    start = perf_counter()
+    for _ in range(repeat):
+        linear = [linear_match_baseline(*query, protocols=IRMP_PROTOCOLS) for query in queries]
+    linear_time = (perf_counter() - start) / (repeat * len(queries))
+
+    start = perf_counter()
+    for _ in range(repeat):
+        indexed = [index.match(*query) for query in queries]
+    indexed_time = (perf_counter() - start) / (repeat * len(queries))
+
+    print(f"Matcher benchmark: {len(queries)} packets x {repeat} runs against {len(IRMP_PROTOCOLS)} protocols")
+    print(f"  index build: {build_time * 1e6:.1f}µs")
+    print(f"  linear : {linear_time * 1e6:.2f}µs per packet")
+    print(f"  indexed: {indexed_time * 1e6:.2f}µs per packet")
+    print(f"  speedup: {linear_time / indexed_time:.2f}x")
+    print(f"  results identical: {linear == indexed}")
 
 
 def format_us(value):
@@ -395,62 +662,114 @@ def format_variation(value):
     return f"{value:+.1f}%".replace(".0%", "%")  # Remove trailing zeros
 
 
-def main():
-    # Set up command line argument parsing
-    parser = argparse.ArgumentParser(description='Analyze IR signal from CSV file')
-    parser.add_argument('csv_file', nargs='?', default='digital.csv', help='CSV file containing IR signal data')
-    parser.add_argument('--variation', '-v', type=int, default=25, 
-                        help='Allowable timing variation percentage (default: 25%%)')
-    parser.add_argument('--unknown', '-u', action='store_true', 
-                        help='Show only packets with unidentified protocols')
-    parser.add_argument('--output', '-o', type=str, 
-                        help='Output file for recognized packets as Python array')
-    parser.add_argument('--hex', '-x', action='store_true',
-                        help='Print filename and hex representation of first repetition')
-    args = parser.parse_args()
-    
-    # Set the global timing variation percentage
+def expand_csv_paths(paths):
+    """Expand directories and glob patterns into a sorted list of CSV files (and Logic 2 binary exports).
+
+    Plain file names are kept in the order given.
+    """
+    csv_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            csv_files.extend(sorted(glob.glob(os.path.join(path, '*.csv')) +
+                                    glob.glob(os.path.join(path, '*' + BINARY_SUFFIX))))
+        elif glob.has_magic(path):
+            csv_files.extend(sorted(glob.glob(path)))
+        else:
+            csv_files.append(path)
+    return csv_files
+
+
+def _analyze_file_worker(job):
+    """Process pool entry point: analyze one file with the caller's settings.
+
+    Returns:
+        (csv_file, results, error): results is None and error describes why if the file couldn't be analyzed
+    """
     global TIMING_VARIATION_PCT
-    TIMING_VARIATION_PCT = args.variation
-    
-    # Analyze the signal
-    results = analyze_signal(args.csv_file)
-    
-    # If --hex option is specified, print filename and hex representation
-    if args.hex:
-        for packet in results:
-            if packet['possible_protocols']:
-                # Extract bits from the first repetition
-                bits = extract_bits_from_first_repetition(packet)
-                hex_value = bits_to_hex(bits)
-                protocol = packet['possible_protocols'][0]
-                print(f"{args.csv_file}\t{hex_value}")
-        return
-    
-    # Print results
-    print(f"Found {len(results)} packets in the signal (max allowed variation: {TIMING_VARIATION_PCT}%)")
-    print("-" * 100)
-    
-    # Count identified and unidentified packets
-    identified_count = sum(1 for packet in results if packet['possible_protocols'])
-    unidentified_count = len(results) - identified_count
-    
-    # Filter results if --unknown flag is set
-    display_results = results
-    if args.unknown:
-        display_results = [packet for packet in results if not packet['possible_protocols']]
-        if not display_results:
-            print("No unidentified packets found.")
-            return
-        print(f"Showing only unidentified packets ({unidentified_count} of {len(results)})")
-        print("-" * 100)
-    
-    for packet in display_results:
+    csv_file, variation, backend, use_cache = job
+    TIMING_VARIATION_PCT = variation  # Worker processes don't share the parent's globals
+    try:
+        return csv_file, analyze_signal(csv_file, backend, use_cache), None
+    except ANALYSIS_ERRORS as error:
+        return csv_file, None, f"{type(error).__name__}: {error}"
+
+
+def analyze_files(csv_files, backend='python', jobs=None, use_cache=True):
+    """Analyze many CSV files across a process pool.
+
+    Args:
+        csv_files: list of Saleae CSV exports
+        backend: analysis backend, as for analyze_signal()
+        jobs: number of worker processes (default: one per CPU)
+        use_cache: use the binary edge cache, as for analyze_signal()
+    Returns:
+        list of (csv_file, results) in the same order as csv_files; results is None
+        for a file that couldn't be read or parsed (the error is printed to stderr)
+        and the other files are still analyzed.
+    """
+    work = [(csv_file, TIMING_VARIATION_PCT, backend, use_cache) for csv_file in csv_files]
+    if jobs == 1 or len(csv_files) < 2:
+        outcomes = [_analyze_file_worker(job) for job in work]
+    else:
+        jobs = jobs or os.cpu_count() or 1
+        chunksize = max(1, len(work) // (4 * jobs))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            outcomes = list(executor.map(_analyze_file_worker, work, chunksize=chunksize))
+    for csv_file, _, error in outcomes:
+        if error is not None:
+            print(f"Could not analyze {csv_file}: {error}", file=sys.stderr)
+    return [(csv_file, results) for csv_file, results, _ in outcomes]
+
+
+def analysis_settings():
+    """Describe everything besides a CSV file's contents that its analysis depends on, for the analysis database"""
+    modules = (sys.modules[__name__], ir_decoder, ir_protocols, edge_cache, saleae_binary)
+    return f"variation={TIMING_VARIATION_PCT} sources={hash_source(*modules)}"
+
+
+def hash_source(*modules):
+    """Return a short hash of the source files of modules, so that editing any of them invalidates stored results"""
+    digest = hashlib.sha256()
+    for module in modules:
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def analyze_files_incremental(csv_files, database, backend='python', jobs=None, use_cache=True):
+    """Analyze many CSV files like analyze_files(), reusing the results stored in an analysis database.
+
+    Only files that are new, or whose contents have changed, are analyzed; their results are stored.
+
+    Args:
+        csv_files: list of Saleae CSV exports
+        database: an analysis_db.AnalysisDatabase opened with analysis_settings()
+        backend, jobs, use_cache: as for analyze_files()
+    Returns:
+        list of (csv_file, results) in the same order as csv_files, results None for files that failed
+    """
+    results = {}
+    for csv_file in csv_files:
+        packets = database.lookup(csv_file)
+        results[csv_file] = None if packets is None else list(packets)
+    changed = [csv_file for csv_file, packets in results.items() if packets is None]
+    for csv_file, packets in analyze_files(changed, backend, jobs, use_cache):
+        if packets is not None:
+            database.store(csv_file, packets)
+        results[csv_file] = packets
+    return [(csv_file, results[csv_file]) for csv_file in csv_files]
+
+
+def print_packets(packets):
+    """Print the details of each analyzed packet"""
+    for packet in packets:
         print(f"Packet {packet['packet']} (start time: {packet['start_time']:.6f}s):")
         
         # Print protocol information if available
         if packet['possible_protocols']:
-            print(f"  Possible protocols: {', '.join(packet['possible_protocols'])}")
+            scores = packet['protocol_scores']
+            ranked = [f"{name} ({scores[name]['score']:.2f})" for name in packet['possible_protocols']]
+            print(f"  Possible protocols: {', '.join(ranked)}")
             
             # Format protocol variations for better readability
             formatted_variations = {}
@@ -461,6 +780,9 @@ def main():
                     'avg': format_variation(variation['avg_header_variation'])
                 }
             print(f"  Protocol variations: {formatted_variations}")
+            if packet['decoded_frames']:
+                print(f"  Decoded ({packet['possible_protocols'][0]}): "
+                      f"{'; '.join(format_frame(frame) for frame in packet['decoded_frames'])}")
         else:
             print("  Protocol: UNKNOWN")
         
@@ -487,100 +809,234 @@ def main():
               f"max={format_us(packet['max_pause_us'])})")
         
         print("-" * 100)
-    
-    # Output recognized packets to a Python file if requested
-    if args.output:
+
+
+def report_packets(results, unknown=False):
+    """Print the analysis report for one file as its packets arrive, passing each packet on.
+
+    Only one packet is held at a time, so a file's report can be streamed
+    straight from iter_analyze_signal() (or the analysis database).
+
+    Args:
+        results: analyzed packets of one file, as any iterable
+        unknown: print only the packets with unidentified protocols (--unknown)
+    Yields:
+        every packet in results, after printing it
+    """
+    print("-" * 100)
+    count = identified_count = 0
+    for packet in results:
+        count += 1
+        if packet['possible_protocols']:
+            identified_count += 1
+        if not unknown or not packet['possible_protocols']:
+            print_packets([packet])
+        yield packet
+
+    print(f"Found {count} packets in the signal (max allowed variation: {TIMING_VARIATION_PCT}%)")
+    if unknown:
+        if identified_count == count:
+            print("No unidentified packets found.")
+        else:
+            print(f"Showed only unidentified packets ({count - identified_count} of {count})")
+
+
+def write_recognized_packets(output, results, source, include_low_confidence=False):
+    """Write the recognized packets in results to a Python file as `recognized_packets`.
+
+    Packets that don't really fit even their best protocol (score below
+    MIN_PROTOCOL_SCORE) are left out with a warning, unless
+    include_low_confidence is set, in which case they are written marked low confidence.
+    The packets are written as they arrive, so results can be a stream; the
+    file is only created once there is a recognized packet to write.
+
+    Args:
+        output: name of the Python file to write
+        results: analyzed packets, from one or more CSV files, as any iterable
+        source: description of where the packets came from, for the header comment
+        include_low_confidence: also write the packets that fit their best protocol poorly
+    """
+    f = None
+    written = 0
+    left_out = 0
+    try:
         # Filter for recognized packets
-        recognized_packets = [packet for packet in results if packet['possible_protocols']]
-        
-        if not recognized_packets:
-            print(f"No recognized packets to write to {args.output}")
-            return
-        
-        # Extract the raw timing data for each packet
-        packet_timings = []
-        
-        for packet in recognized_packets:
-            # Get the original CSV data for this packet
-            with open(args.csv_file, 'r') as f:
-                reader = csv.reader(f)
-                rows = list(reader)
-            
-            # Find the packet boundaries
-            packet_idx = packet['packet']  # 1-based index as shown in output
-            start_time = packet['start_time']
-            
-            # Find the start and end indices in the CSV data
-            start_idx = None
-            end_idx = None
-            
-            for i, row in enumerate(rows):
-                if len(row) >= 2:
-                    try:
-                        time = float(row[0])
-                        if time == start_time:
-                            start_idx = i
-                            break
-                    except ValueError:
-                        continue
-            
-            if start_idx is None:
-                continue  # Skip if we can't find the start
-            
-            # Find the end of the packet (next packet start or end of file)
-            end_idx = len(rows)
-            for i in range(start_idx + 1, len(rows)):
-                if len(rows[i]) >= 2:
-                    try:
-                        time_diff = float(rows[i][0]) - float(rows[i-1][0])
-                        if time_diff > 0.1 and int(rows[i][1]) == 0:
-                            end_idx = i
-                            break
-                    except ValueError:
-                        continue
-            
-            # Extract the timing values
-            packet_times = []
-            packet_states = []
-            
-            for i in range(start_idx, end_idx):
-                if len(rows[i]) >= 2:
-                    try:
-                        packet_times.append(float(rows[i][0]))
-                        packet_states.append(int(rows[i][1]))
-                    except ValueError:
-                        continue
-            
-            # Convert to microsecond durations
-            durations = []
-            for i in range(1, len(packet_times)):
-                duration = int((packet_times[i] - packet_times[i-1]) * 1_000_000)  # Convert to microseconds
-                durations.append(duration)
-            
-            # Add the protocol name as a comment
-            protocol_name = packet['possible_protocols'][0] if packet['possible_protocols'] else "UNKNOWN"
-            
-            # Store as (packet_idx, start_time, protocol_name, durations)
-            packet_timings.append((packet_idx, start_time, protocol_name, durations))
-        
-        # Write to the output file
-        with open(args.output, 'w') as f:
-            basename, _ = os.path.splitext(os.path.basename(args.csv_file))
-            f.write(f"# Recognized IR packets extracted from CSV file {args.csv_file}\n")
-            f.write("# Format: list of (basename, pulse_duration, pause_duration, ...)\n")
-            f.write("# All durations in microseconds\n\n")
-            f.write("recognized_packets = [\n")
-
-            for packet_idx, start_time, protocol_name, durations in packet_timings:
-                f.write(
-                    f"    # Packet {packet_idx} (start time: {start_time:.6f}s) - {protocol_name} protocol\n")
-                f.write(f"    {tuple([basename] + durations[:-1])},\n")
+        for packet in results:
+            if not packet['possible_protocols']:
+                continue
+            protocol_name = packet['possible_protocols'][0]
+            score = packet['protocol_scores'][protocol_name]['score']
+            confidence = ""
+            if score < MIN_PROTOCOL_SCORE:
+                if not include_low_confidence:
+                    print(f"Warning: {packet['csv_file']} packet {packet['packet']} fits {protocol_name} poorly "
+                          f"(score {score:.2f}); left out of {output} (see --include-low-confidence)")
+                    left_out += 1
+                    continue
+                confidence = f" (low confidence, score {score:.2f})"
+                print(f"Warning: {packet['csv_file']} packet {packet['packet']} fits {protocol_name} poorly "
+                      f"(score {score:.2f}); written to {output} marked low confidence")
+            if f is None:
+                f = open(output, 'w')
+                f.write(f"# Recognized IR packets extracted from {source}\n")
+                f.write("# Format: list of (basename, pulse_duration, pause_duration, ...)\n")
+                f.write("# All durations in microseconds\n\n")
+                f.write("recognized_packets = [\n")
 
+            basename, _ = os.path.splitext(os.path.basename(packet['csv_file']))
+            # Convert to integer microsecond durations
+            durations = [int(duration) for duration in packet['durations_us']]
+            f.write(f"    # Packet {packet['packet']} (start time: {packet['start_time']:.6f}s) - "
+                    f"{protocol_name} protocol{confidence}\n")
+            f.write(f"    {tuple([basename] + durations[:-1])},\n")
+            written += 1
+        if f is not None:
             f.write("]\n")
+    finally:
+        if f is not None:
+            f.close()
+
+    if not written:
+        print(f"No recognized packets to write to {output}")
+        return
+    print(f"Wrote {written} recognized packets to {output}"
+          + (f" ({left_out} low confidence packets left out)" if left_out else ""))
+
+
+def main():
+    # Set up command line argument parsing
+    parser = argparse.ArgumentParser(description='Analyze IR signal from CSV file')
+    parser.add_argument('csv_files', nargs='*', default=['digital.csv'], metavar='csv_file',
+                        help='CSV file (or Logic 2 binary .bin export) containing IR signal data; several files, '
+                             'directories or glob patterns are analyzed in parallel and reported together')
+    parser.add_argument('--variation', '-v', type=int, default=25, 
+                        help='Allowable timing variation percentage (default: 25%%)')
+    parser.add_argument('--unknown', '-u', action='store_true', 
+                        help='Show only packets with unidentified protocols')
+    parser.add_argument('--output', '-o', type=str, 
+                        help='Output file for recognized packets as Python array')
+    parser.add_argument('--include-low-confidence', action='store_true',
+                        help='Also write packets that fit their best protocol poorly to --output, marked low confidence')
+    parser.add_argument('--hex', '-x', action='store_true',
+                        help='Print filename and hex representation of first repetition')
+    parser.add_argument('--backend', '-b', choices=('python', 'numpy'), default='python',
+                        help='Analysis backend (default: python, which streams packets in bounded memory)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always parse the CSV text; do not read or write the binary .edges cache')
+    parser.add_argument('--propose', '-p', action='store_true',
+                        help='Cluster the timings of unknown packets and propose IR_PROTOCOLS entries for them')
+    parser.add_argument('--db', default=ANALYSIS_DB_FILE, metavar='FILE',
+                        help=f'Analysis database: files analyzed before with the same settings are not analyzed '
+                             f'again unless they change (default: {ANALYSIS_DB_FILE})')
+    parser.add_argument('--no-db', action='store_true',
+                        help='Analyze every file; do not read or write the analysis database')
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help='Number of worker processes for batch analysis (default: one per CPU)')
+    parser.add_argument('--benchmark', nargs='?', const='good', metavar='DIR',
+                        help='Compare the python and numpy backends on the CSV files in DIR (default: good)')
+    parser.add_argument('--benchmark-matcher', nargs='?', const='good', metavar='DIR',
+                        help='Compare the indexed and linear protocol matchers on the CSV files in DIR (default: good)')
+    args = parser.parse_args()
+    
+    # Set the global timing variation percentage
+    global TIMING_VARIATION_PCT
+    TIMING_VARIATION_PCT = args.variation
+
+    if args.benchmark:
+        benchmark_backends(sorted(glob.glob(os.path.join(args.benchmark, '*.csv'))))
+        return
+
+    if args.benchmark_matcher:
+        benchmark_matcher(sorted(glob.glob(os.path.join(args.benchmark_matcher, '*.csv'))))
+        return
+    
+    csv_files = expand_csv_paths(args.csv_files)
+    if not csv_files:
+        print(f"No CSV files found in {', '.join(args.csv_files)}")
+        return
+    batch = len(csv_files) > 1
+    
+    # Analyze the signal(s), reporting each packet as it arrives
+    database = None
+    if not args.no_db:
+        database = AnalysisDatabase(args.db, analysis_settings())
+    with database if database is not None else contextlib.nullcontext():
+        if batch:
+            if database is not None:
+                results_by_file = analyze_files_incremental(csv_files, database, args.backend, args.jobs,
+                                                            not args.no_cache)
+            else:
+                results_by_file = analyze_files(csv_files, args.backend, args.jobs, not args.no_cache)
+        else:
+            # One file is streamed from the analysis (or the database) rather than collected first
+            csv_file = csv_files[0]
+            packets = database.lookup(csv_file) if database is not None else None
+            if packets is None:
+                packets = iter_analyze_signal(csv_file, args.backend, not args.no_cache)
+                if database is not None:
+                    packets = database.storing(csv_file, packets)
+            results_by_file = [(csv_file, packets)]
+
+        failed = []
+        counts = {'packets': 0, 'identified': 0}
+        unknown_packets = []  # Kept for --propose
+
+        def analyzed_packets():
+            for csv_file, file_results in results_by_file:
+                if file_results is None:
+                    failed.append(csv_file)
+                    continue
+                if batch and not args.hex:
+                    print(f"File {csv_file}:")
+                try:
+                    for packet in file_results if args.hex else report_packets(file_results, args.unknown):
+                        counts['packets'] += 1
+                        if packet['possible_protocols']:
+                            counts['identified'] += 1
+                        elif args.propose:
+                            unknown_packets.append(packet)
+                        yield packet
+                except ANALYSIS_ERRORS as error:
+                    print(f"Could not analyze {csv_file}: {type(error).__name__}: {error}", file=sys.stderr)
+                    failed.append(csv_file)
+
+        packets = analyzed_packets()
+        if args.hex:
+            # Print filename and hex representation of the first repetition
+            for packet in packets:
+                if packet['possible_protocols']:
+                    hex_value = bits_to_hex(extract_bits_from_first_repetition(packet))
+                    print(f"{packet['csv_file']}\t{hex_value}")
+            return 1 if failed else 0
+
+        # Output recognized packets to a Python file if requested
+        if args.output:
+            if batch:
+                source = f"{len(csv_files)} CSV files"
+            else:
+                source = f"CSV file {csv_files[0]}"
+            write_recognized_packets(args.output, packets, source, args.include_low_confidence)
+        else:
+            for _ in packets:
+                pass
 
-        print(
-            f"Wrote {len(packet_timings)} recognized packets to {args.output}")
+    if batch:
+        for csv_file in failed:
+            print(f"File {csv_file}: could not be analyzed")
+        print(f"Analyzed {len(csv_files) - len(failed)} files: {counts['packets']} packets, "
+              f"{counts['identified']} identified, {counts['packets'] - counts['identified']} unknown"
+              + (f"; {len(failed)} files failed" if failed else ""))
+        if database is not None:
+            print(f"Reused the results of {database.reused} unchanged files from {args.db}, "
+                  f"analyzed {database.stored}")
 
+    # Propose protocol table entries for the packets that weren't identified
+    if args.propose:
+        from protocol_discovery import print_proposals, propose_protocols
+        proposals, unsupported = propose_protocols(unknown_packets, TIMING_VARIATION_PCT)
+        print(f"Proposed IR_PROTOCOLS entries for {len(unknown_packets)} unknown packets:")
+        print_proposals(proposals, unsupported)
+    return 1 if failed else 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
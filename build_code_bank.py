@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Convert firmware/codes.py and captured codes into a binary code bank.
+
+The firmware loads the bank (firmware/codebank.py) instead of compiling the
+CODES literal at boot. Each code's carrier frequency is taken from the
+protocol that analyze_signal.py matches it to; codes of unknown protocols get
+the firmware's default carrier. Copy the output file to the ESP32's root
+directory along with the rest of the firmware.
+
+Codes that the analyzer decodes (NEC, SAMSUNG, SIRCS, RC5, RC6, ...) are
+stored as their protocol, address and command, and synthesized with ideal
+timings when they are sent (firmware/ir_encoder.py), if the synthesized code
+matches the original within the analyzer's timing tolerance. Other codes are
+stored as raw timings.
+
+Each code's priority (which codes the firmware sends first) comes from the
+market share of its brand, found in a brands file: lines of a code name
+followed by text that mentions the brand, like processed_codes.txt
+("0001 Samsung", with an optional leading "-" and trailing "*" on the name).
+
+Usage: python3 build_code_bank.py [-o firmware/codes.bin] [--codes firmware/codes.py] [--captured captured]
+                                  [--brands processed_codes.txt] [--raw]
+"""
+import argparse
+import ast
+import glob
+import os
+import re
+import sys
+import tracemalloc
+from collections import Counter
+from time import perf_counter
+
+from analyze_signal import TIMING_VARIATION_PCT, analyze_durations, get_protocol_index, protocol_carrier
+from ir_decoder import decode_repetition
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "firmware"))
+
+from codebank import CodeBank, MAX_REPEATS, PULSE_MAX, SCALE_FACTOR  # noqa: E402
+from ir_encoder import encode_frame  # noqa: E402
+
+# Rough share (percent) of TVs in use by brand; only the ratios matter. Edit to suit your region.
+BRAND_SHARE = {
+    "samsung": 25,
+    "lg": 12,
+    "tcl": 12,
+    "vizio": 11,
+    "hisense": 7,
+    "sony": 6,
+    "onn": 4,
+    "toshiba": 3,
+    "panasonic": 2,
+    "philips": 2,
+    "sharp": 2,
+    "hitachi": 1,
+    "mitsubishi": 1,
+}
+
+BRANDS_LINE_RE = re.compile(r"^(-?)\s*(\w+)(\*?)\s+(.*)")
+
+
+def read_codes(codes_file):
+    """Return the CODES list from a codes.py file"""
+    with open(codes_file) as f:
+        tree = ast.parse(f.read(), codes_file)
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "CODES" for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise ValueError(f"{codes_file} has no CODES list")
+
+
+def read_captured_codes(directory):
+    """Return the codes saved by the firmware's capture mode (one tuple per .py file)"""
+    codes = []
+    for filename in sorted(glob.glob(os.path.join(directory, "*.py"))):
+        with open(filename) as f:
+            codes.append(ast.literal_eval(f.read()))
+    return codes
+
+
+def read_brands(brands_file):
+    """Return {code name: brand} from a brands file (see the module docstring)"""
+    brands = {}
+    with open(brands_file) as f:
+        for line in f:
+            m = BRANDS_LINE_RE.match(line)
+            if not m:
+                continue
+            words = re.findall(r"\w+", m.group(4).lower())
+            known = [word for word in words if word in BRAND_SHARE]
+            if known:
+                brands[m.group(2)] = max(known, key=BRAND_SHARE.get)
+    return brands
+
+
+def brand_priority(brand):
+    """Return a code priority (0..255) for a brand's market share, 0 if the brand is unknown"""
+    if brand is None:
+        return 0
+    return max(1, round(255 * BRAND_SHARE[brand] / max(BRAND_SHARE.values())))
+
+
+def code_name(code):
+    """Return the name of a code, or None if it has none"""
+    return code[0] if isinstance(code[0], str) else None
+
+
+def analyze_code(code):
+    """Return the analyzer's result dict for a code, or None if it can't be analyzed"""
+    if isinstance(code[0], str):
+        return analyze_durations(code[1:], code[0])
+    return analyze_durations(code)
+
+
+def code_carrier(code, result=None):
+    """Return (carrier in Hz or 0 for the default, protocol name or None) for a code"""
+    if result is None:
+        result = analyze_code(code)
+    if result is None or not result['possible_protocols']:
+        return 0, None
+    protocol = result['possible_protocols'][0]
+    return protocol_carrier(protocol), protocol
+
+
+def _within(value, reference):
+    """True if value is within the analyzer's timing tolerance of reference"""
+    return abs(value - reference) <= reference * TIMING_VARIATION_PCT / 100
+
+
+def synthesize(result):
+    """Describe an analyzed code as frames of its protocol, for CodeBank.add_synthesized().
+
+    Each repetition is decoded, and re-encoded to check that the synthesized
+    frame has the same marks and spaces as the original, within the
+    analyzer's timing tolerance. The code must be a frame followed by repeats
+    of one frame (as NEC's repeat codes, or the same frame again), with
+    steady gaps between the repeats.
+    Returns:
+        dict: add_synthesized() arguments, or None if the code can't be synthesized faithfully.
+    """
+    if result is None or not result['possible_protocols']:
+        return None
+    protocol = get_protocol_index().by_name[result['possible_protocols'][0]]
+    durations = result['durations_us']
+    starts = result['repetition_starts']
+    frames = []
+    for j, start in enumerate(starts):
+        end = starts[j + 1] - 1 if j + 1 < len(starts) else len(durations)
+        repetition = durations[start:end]
+        if len(repetition) % 2 == 0:
+            repetition = repetition[:-1]  # Idle time to the end of the capture
+        frame = decode_repetition(repetition, protocol, TIMING_VARIATION_PCT)
+        if frame is None:
+            return None
+        fields = (frame.address or 0, frame.command or 0, frame.bits, frame.toggle or 0)
+        try:
+            synthesized = encode_frame(protocol, *fields, [])
+        except ValueError:
+            return None
+        if len(synthesized) != len(repetition) or not all(map(_within, synthesized, repetition)):
+            return None
+        frames.append(fields)
+    gaps = result['repetition_spacings']
+    if any(frame != frames[1] for frame in frames[2:]) or any(not _within(gap, gaps[1]) for gap in gaps[2:]):
+        return None
+    if len(frames) - 1 > MAX_REPEATS or round(max(gaps, default=0) / SCALE_FACTOR) > PULSE_MAX:
+        return None
+    return {
+        'protocol': protocol,
+        'base': frames[0],
+        'repeat': frames[1] if len(frames) > 1 else None,
+        'repeats': len(frames) - 1,
+        'first_gap': gaps[0] if gaps else 0,
+        'repeat_gap': gaps[1] if len(gaps) > 1 else 0,
+    }
+
+
+def add_codes(bank, codes, duty=0, brands=None, synthesized=True):
+    """Add codes to the bank with the carrier of their protocol and the priority of their brand.
+    Args:
+        synthesized (bool): store codes of known protocols as parameters where possible (see synthesize()).
+    Returns:
+        Counter: number of codes per (protocol, carrier, synthesized).
+    """
+    protocols = Counter()
+    for code in codes:
+        result = analyze_code(code)
+        carrier, protocol = code_carrier(code, result)
+        priority = brand_priority((brands or {}).get(code_name(code)))
+        frames = synthesize(result) if synthesized else None
+        if frames is None:
+            bank.add(code, carrier, duty, priority)
+        else:
+            name = code_name(code) or f"{len(bank)}"
+            bank.add_synthesized(name, carrier=carrier, duty=duty, priority=priority, **frames)
+        protocols[(protocol, carrier, frames is not None)] += 1
+    return protocols
+
+
+def check_bank(bank):
+    """Print any pulse longer than the RMT can send.
+    Returns:
+        bool: True if all codes are valid.
+    """
+    retval = True
+    buffer = []
+    for i, name in enumerate(bank.names):
+        for frame in range(bank.frame_count(i)):
+            for tick in bank.fill_frame(i, frame, buffer):
+                if tick > PULSE_MAX:
+                    print(f"code {name}: Pulse {tick * SCALE_FACTOR} exceeds {PULSE_MAX * SCALE_FACTOR}")
+                    retval = False
+    return retval
+
+
+def measure(load):
+    """Return (seconds, peak bytes allocated) for one call of load()"""
+    tracemalloc.start()
+    start = perf_counter()
+    load()
+    elapsed = perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def compare_load(codes_file, bank_file):
+    """Compare compiling codes.py with loading the bank (on this host, as a rough guide)"""
+    with open(codes_file) as f:
+        source = f.read()
+    codes_time, codes_peak = measure(lambda: exec(compile(source, codes_file, "exec"), {}))
+    bank_time, bank_peak = measure(lambda: CodeBank.load(bank_file))
+    print(f"Loading {codes_file}: {codes_time * 1000:.2f} ms, {codes_peak} bytes peak")
+    print(f"Loading {bank_file}: {bank_time * 1000:.2f} ms, {bank_peak} bytes peak")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert IR codes into a binary code bank for the firmware')
+    parser.add_argument('-o', '--output', default=os.path.join('firmware', 'codes.bin'),
+                        help='Code bank file to write (default firmware/codes.bin)')
+    parser.add_argument('--codes', default=os.path.join('firmware', 'codes.py'),
+                        help='Python file with the CODES list (default firmware/codes.py)')
+    parser.add_argument('--captured', default='captured',
+                        help='Directory of captured codes (.py files) to add (default captured)')
+    parser.add_argument('--duty', type=int, default=0,
+                        help='Carrier duty cycle in percent for every code (default 0: the firmware\'s DUTY_CYCLE)')
+    parser.add_argument('--brands', default='processed_codes.txt',
+                        help='File naming the brand of each code, to prioritize them (default processed_codes.txt)')
+    parser.add_argument('--raw', action='store_true',
+                        help='Store every code as raw timings, even those of known protocols')
+    args = parser.parse_args()
+
+    brands = read_brands(args.brands) if os.path.exists(args.brands) else {}
+    bank = CodeBank()
+    protocols = add_codes(bank, read_codes(args.codes), args.duty, brands, not args.raw)
+    from_codes = len(bank)
+    if os.path.isdir(args.captured):
+        protocols += add_codes(bank, read_captured_codes(args.captured), args.duty, brands, not args.raw)
+    for (protocol, carrier, synthesized), count in sorted(protocols.items(), key=lambda item: -item[1]):
+        print(f"{count:4d} {protocol or 'unknown'} codes at {f'{carrier} Hz' if carrier else 'the default carrier'}"
+              f"{', synthesized' if synthesized else ''}")
+    print(f"{sum(1 for p in bank.priorities if p)} codes prioritized by brand from {args.brands}")
+    print(f"{sum(1 for r in bank.repeats if r)} codes stored as a frame and its repeats, "
+          f"longest frame {bank.max_frame_length()} pulses")
+    if not check_bank(bank):
+        return 1
+    bank.save(args.output)
+    print(f"Wrote {len(bank)} codes ({from_codes} from {args.codes}, {len(bank) - from_codes} captured), "
+          f"{len(bank.ticks)} stored values, {os.path.getsize(args.output)} bytes to {args.output}")
+    compare_load(args.codes, args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,24 +5,31 @@ import os.path
 
 IN_CHANNEL=2
 EXPORT_NAME = "digital.csv"
+BINARY_EXPORT_NAME = f"digital_{IN_CHANNEL}.bin"  # Logic 2 writes one binary file per channel
+LOGIC2_PORT = 10430
 
-def capture_ir_data(filename):
+def device_configuration():
+    # Configure the capturing device to record on digital channel IN_CHANNEL,
+    # with a sampling rate of 1 MSa/s, and a logic level of 3.3V.
+    # The settings chosen here will depend on your device's capabilities and what
+    # you can configure in the Logic 2 UI.
+    return automation.LogicDeviceConfiguration(
+        enabled_digital_channels=[IN_CHANNEL],
+        digital_sample_rate=1_000_000,
+        digital_threshold_volts=3.3,
+    )
+
+def capture_ir_data(filename, binary=True):
+    """Capture an IR signal and export it to captures/<filename>.bin (a Logic 2 binary export,
+    which analyze_signal.py reads without parsing, see saleae_binary.py), or to
+    captures/<filename>.csv if binary is False.
+    """
     # Connect to the running Logic 2 Application on port `10430`.
     # Alternatively you can use automation.Manager.launch() to launch a new Logic 2 process - see
     # the API documentation for more details.
     # Using the `with` statement will automatically call manager.close() when exiting the scope. If you
     # want to use `automation.Manager` outside of a `with` block, you will need to call `manager.close()` manually.
-    with automation.Manager.connect(port=10430) as manager:
-
-        # Configure the capturing device to record on digital channels 0, 1, 2, and 3,
-        # with a sampling rate of 10 MSa/s, and a logic level of 3.3V.
-        # The settings chosen here will depend on your device's capabilities and what
-        # you can configure in the Logic 2 UI.
-        device_configuration = automation.LogicDeviceConfiguration(
-            enabled_digital_channels=[IN_CHANNEL],
-            digital_sample_rate=1_000_000,
-            digital_threshold_volts=3.3,
-        )
+    with automation.Manager.connect(port=LOGIC2_PORT) as manager:
 
         capture_configuration = automation.CaptureConfiguration(
             capture_mode=automation.DigitalTriggerCaptureMode(
@@ -34,7 +41,7 @@ def capture_ir_data(filename):
 
         # Start a capture - the capture will be automatically closed when leaving the `with` block
         with manager.start_capture(
-                device_configuration=device_configuration,
+                device_configuration=device_configuration(),
                 capture_configuration=capture_configuration) as capture:
 
             # Wait until the capture has finished
@@ -43,16 +50,21 @@ def capture_ir_data(filename):
             output_dir = os.path.join(os.getcwd(), 'captures')
             os.makedirs(output_dir, exist_ok=True)
 
-            # Export raw digital data to EXPORT_NAME
-            capture.export_raw_data_csv(directory=output_dir, digital_channels=[IN_CHANNEL])
-            # rename EXPORT_NAME to the command line arguments
-            os.rename(os.path.join(output_dir, EXPORT_NAME), os.path.join(output_dir, filename + ".csv"))
+            if binary:
+                capture.export_raw_data_binary(directory=output_dir, digital_channels=[IN_CHANNEL])
+                os.rename(os.path.join(output_dir, BINARY_EXPORT_NAME), os.path.join(output_dir, filename + ".bin"))
+            else:
+                # Export raw digital data to EXPORT_NAME
+                capture.export_raw_data_csv(directory=output_dir, digital_channels=[IN_CHANNEL])
+                # rename EXPORT_NAME to the command line arguments
+                os.rename(os.path.join(output_dir, EXPORT_NAME), os.path.join(output_dir, filename + ".csv"))
 
 if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser(description="Capture IR data using Saleae Logic 2.")
     parser.add_argument("filename", type=str, help="The name of the file to save the captured data as.")
+    parser.add_argument("--csv", action="store_true", help="Export CSV text instead of Logic 2 binary data.")
     args = parser.parse_args()
 
-    capture_ir_data(args.filename)
\ No newline at end of file
+    capture_ir_data(args.filename, binary=not args.csv)
\ No newline at end of file
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Capture many IR codes in one long-running Logic 2 session.
+
+prompt_captures.py starts a new capture_saleae.py process, Logic 2
+connection and triggered capture for every code. This keeps one connection
+open and records back-to-back timed captures ("chunks") of CHUNK_SECONDS.
+As each chunk arrives it is exported as binary data (see saleae_binary.py)
+and split into packets by the analyzer's rule: a gap longer than
+PACKET_GAP_S (100ms) separates packets (see analyze_signal.split_packets()).
+
+The codes in processed_codes.txt that still need capturing (see
+prompt_captures.py) are captured in order, one per chunk: each chunk is
+announced with the button to press, and the first packet in it is saved as
+captures/<number>.bin. Press the button once and wait for it to be reported
+as saved before pressing the next one.
+
+Logic 2 doesn't record while a chunk is exported and the next one starts,
+so a packet that starts or ends within PACKET_GAP_S of the edge of a chunk
+may be incomplete. If the first packet of a chunk was cut off, nothing in
+that chunk is saved and you are asked to press the same button again, so a
+later packet can't be saved under the wrong number. A press between chunks
+isn't seen at all, so the same button is simply asked for again. Any
+packets after the first one in a chunk are ignored.
+
+Usage: python3 capture_session.py [--codes processed_codes.txt] [--chunk 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+from saleae import automation
+
+from analyze_signal import PACKET_GAP_S, split_packets
+from capture_saleae import BINARY_EXPORT_NAME, IN_CHANNEL, LOGIC2_PORT, device_configuration
+from prompt_captures import CAPTURES, CODES_FILE, pending_codes
+from saleae_binary import read_binary_edges, read_binary_header, write_binary_export
+
+CHUNK_SECONDS = 3  # Length of each timed capture, time enough for one press
+
+
+def chunk_packets(path):
+    """Split a chunk's binary export into packets.
+
+    Args:
+        path: binary export of the chunk
+    Returns:
+        list of (times, complete) for each packet in the order recorded: its transition
+        times (s), and False if it may have been cut off by the start or end of the chunk.
+    """
+    initial_state, begin_time, end_time, count = read_binary_header(path)
+    # Only the transitions, not the rows at the start and end of the capture
+    edges = [edge for edge in read_binary_edges(path) if edge[0] not in (1, count + 2)]
+    packets = []
+    for _, _, times, _, _ in split_packets(edges):
+        if times[0] - begin_time <= PACKET_GAP_S:
+            continue  # Part of the packet cut off at the start, added below
+        # More edges may have followed after the chunk ended
+        packets.append((times, end_time - times[-1] > PACKET_GAP_S))
+    if edges and (initial_state == 0 or edges[0][1] - begin_time <= PACKET_GAP_S):
+        # The signal was already active, or may have been, when the chunk started
+        first = packets[0][0][0] if packets else end_time
+        packets.insert(0, ([time for _, time, _ in edges if time < first], False))
+    return packets
+
+
+def save_packet(filename, times):
+    """Save a packet's transition times as a binary export, as capture_saleae.py would have captured it alone"""
+    start = times[0]
+    write_binary_export(filename, [round(t - start, 9) for t in times], initial_state=1,
+                        begin_time=-PACKET_GAP_S, end_time=round(times[-1] - start + PACKET_GAP_S, 9))
+
+
+class CaptureSession:
+    """Back-to-back timed captures on one Logic 2 connection, saved a packet at a time.
+
+    Args:
+        manager: a connected saleae.automation.Manager
+        output_dir: directory to save the packets in
+        chunk_seconds: length of each timed capture
+    """
+
+    def __init__(self, manager, output_dir=CAPTURES, chunk_seconds=CHUNK_SECONDS):
+        self.manager = manager
+        self.output_dir = output_dir
+        self.chunk_seconds = chunk_seconds
+        self.chunks = 0
+        self.cut = 0  # Chunks whose first packet was cut off at their edges
+        self.ignored = 0  # Packets after the first one in a chunk
+        self.saved = []  # Files saved so far
+
+    def capture_chunk(self, directory):
+        """Record one chunk and export it to directory.
+        Returns:
+            the name of the binary export.
+        """
+        capture_configuration = automation.CaptureConfiguration(
+            capture_mode=automation.TimedCaptureMode(duration_seconds=self.chunk_seconds))
+        with self.manager.start_capture(device_configuration=device_configuration(),
+                                        capture_configuration=capture_configuration) as capture:
+            capture.wait()
+            capture.export_raw_data_binary(directory=directory, digital_channels=[IN_CHANNEL])
+        self.chunks += 1
+        return os.path.join(directory, BINARY_EXPORT_NAME)
+
+    def run(self, codes, max_chunks=None):
+        """Capture and save a packet for each code, in order, one chunk at a time.
+
+        The first packet of a chunk is saved as the code asked for. If it was cut
+        off, or there was none, the same code is asked for again in the next chunk.
+
+        Args:
+            codes: (number, description) of each code to capture, as pending_codes() returns them
+            max_chunks: stop after this many chunks even if codes are left (default: run until done)
+        Returns:
+            list of the files saved (also kept in self.saved, should run() be interrupted).
+        """
+        pending = list(codes)
+        os.makedirs(self.output_dir, exist_ok=True)
+        with tempfile.TemporaryDirectory() as workdir:
+            while pending and (max_chunks is None or self.chunks < max_chunks):
+                number, description = pending[0]
+                print(f"Recording: press {number} ({description}) once")
+                packets = chunk_packets(self.capture_chunk(workdir))
+                if not packets:
+                    print(f"Nothing was recorded for {number}")
+                    continue
+                times, complete = packets[0]
+                self.ignored += len(packets) - 1
+                if not complete:
+                    # Whatever followed can't be told apart from the press that was cut off
+                    self.cut += 1
+                    print(f"{number} was cut off at the edge of a capture; press it again")
+                    continue
+                pending.pop(0)
+                filename = os.path.join(self.output_dir, number + ".bin")
+                save_packet(filename, times)
+                self.saved.append(filename)
+                print(f"Saved {filename} ({len(times)} edges) for {number} ({description})")
+                if len(packets) > 1:
+                    print(f"Ignored {len(packets) - 1} more packets; wait for each code to be saved "
+                          f"before pressing the next button")
+        return self.saved
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Capture IR codes continuously with Saleae Logic 2')
+    parser.add_argument('--codes', default=CODES_FILE,
+                        help=f'Codes to capture, as for prompt_captures.py (default: {CODES_FILE})')
+    parser.add_argument('--chunk', type=float, default=CHUNK_SECONDS,
+                        help=f'Length of each capture in seconds (default: {CHUNK_SECONDS})')
+    args = parser.parse_args()
+
+    codes = pending_codes(args.codes)
+    start = perf_counter()
+    with automation.Manager.connect(port=LOGIC2_PORT) as manager:
+        session = CaptureSession(manager, chunk_seconds=args.chunk)
+        try:
+            session.run(codes)
+        except KeyboardInterrupt:
+            pass
+    saved = session.saved
+    minutes = (perf_counter() - start) / 60
+    print(f"Captured {len(saved)} codes in {session.chunks} captures ({len(saved) / minutes:.1f} per minute)")
+
+    # Analyze all the new captures in one batch run
+    if saved:
+        os.system(f"python3 analyze_signal.py {' '.join(saved)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Combine several Saleae captures of the same remote button into one clean code.
+
+Every packet in the given CSV files is taken as a press ("shot") of the same
+button. The shots are lined up edge by edge, shots that don't agree with the
+others are rejected, and each mark and space is the median over the rest
+(see firmware/consensus.py, which the firmware uses for CAPTURE_SHOTS).
+
+The code is printed, or written to a file, as a Python tuple with its name
+first, like the codes that capture_ir_code() saves on the device.
+
+Usage: python3 consensus_code.py capture1.csv capture2.csv ... [-n name] [-o code.py] [--tolerance 25]
+"""
+import argparse
+import os
+import sys
+
+from analyze_signal import analyze_signal, expand_csv_paths
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "firmware"))
+from consensus import MIN_SHOTS, TOLERANCE_PCT, aligned_medians, consensus, disagreement  # noqa: E402
+
+
+def load_shots(csv_files):
+    """Return the durations (us, without the trailing gap) of every packet in csv_files, and where each came from"""
+    shots = []
+    sources = []
+    for csv_file in csv_files:
+        for packet in analyze_signal(csv_file):
+            shots.append([int(duration) for duration in packet['durations_us'][:-1]])
+            sources.append(f"{csv_file} packet {packet['packet']}")
+    return shots, sources
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Combine several captures of one button into a clean code')
+    parser.add_argument('csv_files', nargs='+', metavar='csv_file',
+                        help='Saleae CSV exports, directories or glob patterns; every packet is a shot')
+    parser.add_argument('--name', '-n', default='captured', help='Name of the code')
+    parser.add_argument('--output', '-o', help='Python file to write the code to (default: print it)')
+    parser.add_argument('--tolerance', '-t', type=int, default=TOLERANCE_PCT,
+                        help=f'Largest difference from the median for a shot to agree, in percent '
+                             f'(default: {TOLERANCE_PCT})')
+    args = parser.parse_args()
+
+    shots, sources = load_shots(expand_csv_paths(args.csv_files))
+    result = consensus(shots, args.tolerance)
+    medians = aligned_medians(shots) if shots else []
+    for source, shot in zip(sources, shots):
+        reason = disagreement(shot, medians, args.tolerance)
+        if reason is not None:
+            print(f"Rejected {source}: {reason}", file=sys.stderr)
+    if result is None:
+        print(f"Error: Fewer than {MIN_SHOTS} of {len(shots)} shots agree", file=sys.stderr)
+        return 1
+    durations, kept = result
+    print(f"Combined {len(kept)} of {len(shots)} shots into {len(durations)} durations", file=sys.stderr)
+
+    code = str(tuple([args.name] + durations))
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(code)
+        print(f"Wrote {args.name} to {args.output}", file=sys.stderr)
+    else:
+        print(code)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+Binary edge cache for parsed Saleae CSV captures.
+
+The first time a capture is parsed, its edges are written to a sidecar file
+next to the CSV (`capture.csv` -> `capture.csv.edges`). Later runs map the
+sidecar instead of parsing the text again. The sidecar records the CSV's
+mtime and size, and is ignored (and rewritten) when either changes.
+
+Sidecar layout (little-endian):
+    header: magic, version, CSV mtime (ns), CSV size, edge count, row of first edge
+    records: one (time: float64 seconds, state: uint8) per edge
+
+Times are kept as the exact float64 values parsed from the CSV, so analysis of
+cached edges gives exactly the same results as parsing the CSV.
+"""
+import mmap
+import os
+import struct
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EDGE_CACHE_SUFFIX = ".edges"
+EDGE_CACHE_MAGIC = b"IREC"
+EDGE_CACHE_VERSION = 1
+HEADER_FORMAT = "<4sIqqII"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+RECORD_FORMAT = "<dB"
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+
+if np is not None:
+    RECORD_DTYPE = np.dtype([('time', '<f8'), ('state', 'u1')])
+
+
+def edge_cache_path(csv_file):
+    """Return the name of the sidecar cache file for csv_file"""
+    return csv_file + EDGE_CACHE_SUFFIX
+
+
+def _csv_signature(csv_file):
+    """Return the (mtime_ns, size) pair that a valid cache must match"""
+    st = os.stat(csv_file)
+    return st.st_mtime_ns, st.st_size
+
+
+def _read_header(csv_file):
+    """Return (count, first_row) for a valid sidecar of csv_file, or None if there is none"""
+    try:
+        signature = _csv_signature(csv_file)
+        with open(edge_cache_path(csv_file), "rb") as f:
+            header = f.read(HEADER_SIZE)
+            size = os.fstat(f.fileno()).st_size
+    except OSError:
+        return None
+    if len(header) != HEADER_SIZE:
+        return None
+    magic, version, mtime_ns, csv_size, count, first_row = struct.unpack(HEADER_FORMAT, header)
+    if (magic != EDGE_CACHE_MAGIC or version != EDGE_CACHE_VERSION or
+            (mtime_ns, csv_size) != signature or size != HEADER_SIZE + count * RECORD_SIZE):
+        return None
+    return count, first_row
+
+
+def cached_edges(csv_file):
+    """Yield (row_index, time, state) from a valid sidecar, like analyze_signal.read_edges().
+
+    Returns:
+        A generator, or None if there is no valid sidecar for csv_file.
+    """
+    header = _read_header(csv_file)
+    if header is None:
+        return None
+    count, first_row = header
+    return _iter_cached_edges(edge_cache_path(csv_file), count, first_row)
+
+
+def _iter_cached_edges(path, count, first_row):
+    if count == 0:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        records = memoryview(mm)[HEADER_SIZE:]
+        unpacker = struct.iter_unpack(RECORD_FORMAT, records)
+        try:
+            for row_index, (time, state) in enumerate(unpacker, first_row):
+                yield row_index, time, state
+        finally:
+            del unpacker  # Drop the buffer export so the map can be closed
+            records.release()
+
+
+def load_edge_cache_numpy(csv_file):
+    """Map a valid sidecar as NumPy arrays without copying.
+
+    Returns:
+        (rows, times, states) like analyze_signal.load_edges_numpy(), or None
+        if there is no valid sidecar for csv_file.
+    """
+    header = _read_header(csv_file)
+    if header is None:
+        return None
+    count, first_row = header
+    if count == 0:
+        records = np.zeros(0, dtype=RECORD_DTYPE)
+    else:
+        records = np.memmap(edge_cache_path(csv_file), dtype=RECORD_DTYPE, mode='r',
+                            offset=HEADER_SIZE, shape=(count,))
+    return np.arange(first_row, first_row + count), records['time'], records['state']
+
+
+def _write(f, data):
+    """Write data to f, returning False instead of raising if the write fails"""
+    try:
+        f.write(data)
+    except OSError:
+        return False
+    return True
+
+
+def caching_edges(csv_file, edges):
+    """Pass an edge stream through unchanged while writing it to the sidecar.
+
+    The sidecar is written to a temporary file and only moved into place once
+    the stream has been read to the end. If the rows are not contiguous, or the
+    sidecar can't be written, no cache is left behind.
+    """
+    path = edge_cache_path(csv_file)
+    tmp_path = path + ".tmp"
+    try:
+        signature = _csv_signature(csv_file)
+        f = open(tmp_path, "wb")
+    except OSError:
+        yield from edges
+        return
+
+    ok = True
+    complete = False
+    count = 0
+    first_row = 0
+    pack = struct.Struct(RECORD_FORMAT).pack
+    chunk = []
+    try:
+        ok = _write(f, bytes(HEADER_SIZE))  # Filled in once the count is known
+        for row_index, time, state in edges:
+            if count == 0:
+                first_row = row_index
+            elif row_index != first_row + count:
+                ok = False  # Row numbers can't be reconstructed from the cache
+            if ok:
+                chunk.append(pack(time, state))
+                if len(chunk) >= 4096:
+                    ok = _write(f, b"".join(chunk))
+                    chunk.clear()
+            count += 1
+            yield row_index, time, state
+        if ok and _write(f, b"".join(chunk)):
+            f.seek(0)
+            complete = _write(f, struct.pack(HEADER_FORMAT, EDGE_CACHE_MAGIC, EDGE_CACHE_VERSION,
+                                             signature[0], signature[1], count, first_row))
+    finally:
+        f.close()
+        try:
+            if complete:
+                os.replace(tmp_path, path)
+            else:
+                os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def write_edge_cache_numpy(csv_file, rows, times, states):
+    """Write the sidecar for edges already loaded into NumPy arrays.
+
+    Returns:
+        True if the sidecar was written.
+    """
+    if len(rows) and rows[-1] - rows[0] + 1 != len(rows):
+        return False  # Row numbers can't be reconstructed from the cache
+    path = edge_cache_path(csv_file)
+    tmp_path = path + ".tmp"
+    records = np.empty(len(times), dtype=RECORD_DTYPE)
+    records['time'] = times
+    records['state'] = states
+    try:
+        signature = _csv_signature(csv_file)
+        with open(tmp_path, "wb") as f:
+            f.write(struct.pack(HEADER_FORMAT, EDGE_CACHE_MAGIC, EDGE_CACHE_VERSION,
+                                signature[0], signature[1], len(records), int(rows[0]) if len(rows) else 0))
+            records.tofile(f)
+        os.replace(tmp_path, path)
+    except OSError:
+        return False
+    return True
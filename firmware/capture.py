@@ -1,4 +1,17 @@
-"""Script to allow IR code capture using a GPIO pin."""
+"""Script to allow IR code capture using a GPIO pin.
+
+CAPTURE_BACKEND (see config.py) picks how the IR receiver's edges are timed:
+  - "irq": a pin interrupt handler reads ticks_us() at every edge. It needs no
+    extra hardware, but each edge is timed when MicroPython gets round to
+    calling the handler, so short pulses jitter and edges can be lost.
+  - "i2s": an I2S receiver samples the pin (1us per sample by default) into a
+    DMA ring buffer, and the samples are turned into marks and spaces as they
+    are read. The timing comes from the I2S clock rather than the interpreter.
+    It needs two unused GPIOs for the I2S clocks (CAPTURE_SCK_PIN,
+    CAPTURE_WS_PIN). MicroPython's esp32.RMT can only transmit, so I2S is the
+    hardware-timed capture that MicroPython offers.
+Both end a capture after a 100ms gap, and keep up to CAPTURE_MAX_EDGES edges.
+"""
 import os
 from time import ticks_us, ticks_diff, sleep_ms
 from array import array
@@ -7,64 +20,105 @@ import micropython
 from micropython import const
 
 from config import INPUT_PIN, INPUT_ACTIVE_LEVEL, CAPTURE_DIRECTORY, INPUT_POWER_PIN
+from config import CAPTURE_BACKEND, CAPTURE_MAX_EDGES, CAPTURE_I2S_ID, CAPTURE_SCK_PIN, CAPTURE_WS_PIN
+from config import CAPTURE_SAMPLE_RATE, CAPTURE_REJECT_UNCLEAN, CAPTURE_SHOTS
 
 MAX_GAP_US = const(100_000)  # 100ms gap to end capture
-MAX_EDGES = const(300)  # Maximum number of edges to capture
+MAX_EDGES = CAPTURE_MAX_EDGES  # Maximum number of edges to capture
 MIN_EDGES = const(4)
+I2S_WORDS = const(256)  # 32-bit words of samples per I2S read (8ms at 1us per sample)
+I2S_IBUF = const(16384)  # Bytes of I2S DMA ring buffer (131ms at 1us per sample)
+SAMPLE_US = 1_000_000 / (CAPTURE_SAMPLE_RATE * 64)  # "i2s": 2 channels of 32 bits per frame
+IRQ_RESOLUTION_US = const(100)  # "irq": marks and spaces shorter than this can't be timed reliably
 
 input_pin = Pin(INPUT_PIN, Pin.IN)
 times = None
 edge = 0  # Current edge number, index into times
 last_time = 0   # Last edge time
 done = False  # Flag to indicate if capture is done
+level = 0  # "i2s": level of the current run of samples
+run = 0  # "i2s": length of the current run of samples
+late = 0  # "irq": edges whose handler ran after the pin had changed again
+handler_us_total = 0  # "irq": total time spent in the handler
+handler_us_max = 0  # "irq": longest time spent in the handler
 
 
 @micropython.native
 def _pin_callback(_):
     """Callback function to handle pin state changes."""
-    global edge, last_time, done
+    global edge, last_time, done, late, handler_us_total, handler_us_max
     t = ticks_us()
+    # The pin should still be at the level this edge set: active after the first, third, ... edge
+    if input_pin.value() != (INPUT_ACTIVE_LEVEL if edge % 2 == 0 else 1 - INPUT_ACTIVE_LEVEL):
+        late += 1
     if edge == 0:
         last_time = t
         times[0] = 0
         edge = 1
-        return
-    lt = last_time
-    last_time = t
-    delta = ticks_diff(t, lt)
-    if delta > MAX_GAP_US:
-        done = True
-        return
-    if edge < MAX_EDGES:
-        times[edge] = delta
-        edge += 1
     else:
-        done = True
+        lt = last_time
+        last_time = t
+        delta = ticks_diff(t, lt)
+        if delta > MAX_GAP_US:
+            done = True
+        elif edge < MAX_EDGES:
+            times[edge] = delta
+            edge += 1
+        else:
+            done = True
+    elapsed = ticks_diff(ticks_us(), t)
+    handler_us_total += elapsed
+    if elapsed > handler_us_max:
+        handler_us_max = elapsed
 
 
-def capture_ir_code(filename, name="captured"):
-    """Capture IR codes from a GPIO pin and save them to a file
-    as a Python tuple named `code`
+@micropython.native
+def _count_runs(samples, count, idle, gap):
+    """Turn I2S samples into run lengths in times, for the "i2s" backend.
 
-    Args:
-        filename (str): The name of the file to save the captured codes.
-        name (str, optional): An optional name for the captured code. Defaults to "captured".
-    Returns:
-        True if capture is successful, False otherwise.
+    Each 32-bit word holds 32 samples, most significant bit first; samples is
+    an array('H') of its halves (little-endian, so the later half first),
+    which keeps every value a small int. Runs before the first mark are
+    skipped, and the capture is done after an idle run longer than gap samples.
     """
-    global edge, last_time, done, times
+    global edge, level, run, done
+    for k in range(0, count, 2):
+        for j in range(k + 1, k - 1, -1):
+            half = samples[j]
+            if half == (0xFFFF if level else 0):
+                run += 16
+                continue
+            for b in range(15, -1, -1):
+                bit = (half >> b) & 1
+                if bit == level:
+                    run += 1
+                    continue
+                if level != idle or edge > 0:
+                    if edge >= MAX_EDGES:
+                        done = True
+                        return
+                    times[edge] = run
+                    edge += 1
+                level = bit
+                run = 1
+        if level == idle and edge > 0 and run > gap:
+            done = True
+            return
 
-    input_pin.irq(handler=None)
 
-    # Verify that pin is not at INPUT_ACTIVE_LEVEL
-    if input_pin.value() == INPUT_ACTIVE_LEVEL:
-        print(
-            f"Error: pin {INPUT_PIN} is already at level {INPUT_ACTIVE_LEVEL}")
-        return False
+def _capture_irq():
+    """Capture one code with the "irq" backend.
+    Returns:
+        list: the code's durations in microseconds, or None if it didn't fit.
+    """
+    global edge, last_time, done, times, late, handler_us_total, handler_us_max
 
     edge = 0
     last_time = 0
     done = False
+    late = 0
+    handler_us_total = 0
+    handler_us_max = 0
     times = array("i", (0 for _ in range(MAX_EDGES)))  # Reset the times array
     input_pin.irq(handler=_pin_callback,
                   trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING)
@@ -85,17 +139,151 @@ def capture_ir_code(filename, name="captured"):
 
     # check for overrun
     if edge >= MAX_EDGES:
+        return None
+    return list(times[1:edge])
+
+
+def _capture_i2s():
+    """Capture one code with the "i2s" backend.
+    Returns:
+        list: the code's durations in microseconds, or None if it didn't fit.
+    """
+    global edge, level, run, done, times
+    from machine import I2S
+
+    idle = int(not INPUT_ACTIVE_LEVEL)
+    edge = 0
+    level = idle
+    run = 0
+    done = False
+    times = array("i", (0 for _ in range(MAX_EDGES)))
+    samples = array("H", (0 for _ in range(2 * I2S_WORDS)))
+    i2s = I2S(CAPTURE_I2S_ID, sck=Pin(CAPTURE_SCK_PIN), ws=Pin(CAPTURE_WS_PIN), sd=input_pin,
+              mode=I2S.RX, bits=32, format=I2S.STEREO, rate=CAPTURE_SAMPLE_RATE, ibuf=I2S_IBUF)
+    try:
+        started = False
+        while not done:
+            count = i2s.readinto(samples) // 2
+            _count_runs(samples, count, idle, int(MAX_GAP_US / SAMPLE_US))
+            if not started and (edge > 0 or level != idle):
+                print("First edge detected.")
+                started = True
+    finally:
+        i2s.deinit()
+
+    # check for overrun
+    if edge >= MAX_EDGES:
+        return None
+    return [round(t * SAMPLE_US) for t in times[:edge]]
+
+
+def capture_code():
+    """Wait for a code on the input pin and capture it with CAPTURE_BACKEND.
+    Returns:
+        list: the code's durations in microseconds (starting with a mark), or None if the capture failed.
+    """
+    input_pin.irq(handler=None)
+
+    # Verify that pin is not at INPUT_ACTIVE_LEVEL
+    if input_pin.value() == INPUT_ACTIVE_LEVEL:
+        print(
+            f"Error: pin {INPUT_PIN} is already at level {INPUT_ACTIVE_LEVEL}")
+        return None
+
+    if CAPTURE_BACKEND == "i2s":
+        durations = _capture_i2s()
+    else:
+        durations = _capture_irq()
+
+    if durations is None:
         print("Error: Capture overrun")
-        return False
+        return None
 
     # check for minimum edges
-    if edge < MIN_EDGES:
+    if len(durations) + 1 < MIN_EDGES:
         print("Error: Capture too short")
+        return None
+    return durations
+
+
+def capture_quality(durations):
+    """Measure the quality of the last capture (see capture_quality.py).
+    Returns:
+        dict: the measurements.
+    """
+    from capture_quality import assess
+    if CAPTURE_BACKEND == "i2s":
+        return assess(durations, round(2 * SAMPLE_US))
+    return assess(durations, IRQ_RESOLUTION_US, late, (handler_us_total / edge, handler_us_max))
+
+
+def capture_clean_code():
+    """Capture a code, print its quality, and reject it if it can't be trusted (see CAPTURE_REJECT_UNCLEAN).
+    Returns:
+        list: the code's durations in microseconds, or None if the capture failed or was rejected.
+    """
+    from capture_quality import print_quality, problems
+
+    durations = capture_code()
+    if durations is None:
+        return None
+    quality = capture_quality(durations)
+    print_quality(quality)
+    if CAPTURE_REJECT_UNCLEAN and problems(quality):
+        print("Error: Capture rejected, please try again")
+        return None
+    return durations
+
+
+def capture_consensus_code(shots):
+    """Capture a code several times and combine the captures into one (see consensus.py).
+    Each capture that fails or is rejected can be retried once.
+    Args:
+        shots (int): number of captures to make.
+    Returns:
+        list: the combined durations in microseconds, or None if too few captures agree.
+    """
+    from consensus import consensus
+
+    captured = []
+    attempts = 0
+    while len(captured) < shots and attempts < 2 * shots:
+        attempts += 1
+        print(f"Press the button ({len(captured) + 1} of {shots})")
+        durations = capture_clean_code()
+        if durations is not None:
+            captured.append(durations)
+    result = consensus(captured)
+    if result is None:
+        print("Error: The captures don't agree, please try again")
+        return None
+    durations, kept = result
+    print(f"Combined {len(kept)} of {len(captured)} captures")
+    return durations
+
+
+def capture_ir_code(filename, name="captured", shots=CAPTURE_SHOTS):
+    """Capture IR codes from a GPIO pin and save them to a file
+    as a Python tuple named `code`
+
+    Args:
+        filename (str): The name of the file to save the captured codes.
+        name (str, optional): An optional name for the captured code. Defaults to "captured".
+        shots (int, optional): Number of presses to capture and combine. Defaults to CAPTURE_SHOTS.
+    Returns:
+        True if capture is successful, False otherwise.
+    """
+    if shots > 1:
+        durations = capture_consensus_code(shots)
+    else:
+        durations = capture_clean_code()
+    if durations is None:
         return False
+    edge = len(durations) + 1
 
     # add name to codes
     codes = [name]
-    codes.extend(times[1:edge])
+    codes.extend(durations)
 
     # Save the captured code to a file
     try:
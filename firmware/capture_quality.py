@@ -0,0 +1,118 @@
+"""
+Check the quality of a captured IR code as soon as it is captured.
+
+assess() reports:
+  - the shortest mark or space, and how many are shorter than the capture
+    backend can time reliably
+  - a jitter estimate: IR protocols only use a few different lengths, so the
+    marks and spaces are grouped into clusters of similar lengths, and the
+    jitter is their RMS deviation from the mean of their cluster
+  - the protocols that the first repetition matches, with the same matcher
+    as analyze_signal.py (ir_protocols.ProtocolIndex: the range of its marks
+    and spaces, and its header, against each protocol's timings)
+  - for the "irq" backend, how long the interrupt handler took and how many
+    edges it saw late (the pin had already changed again when it ran)
+
+Works under both MicroPython and CPython.
+"""
+from math import sqrt
+
+from ir_protocols import IR_PROTOCOLS, ProtocolIndex
+
+TIMING_VARIATION_PCT = 25  # Allowable variation from a protocol's timings, as in analyze_signal.py
+REPETITION_GAP_US = 10_000  # A longer space separates repetitions, as in analyze_signal.py
+CLUSTER_PCT = 25  # Durations within this percentage of a cluster's shortest one are in the same cluster
+
+
+def first_repetition(durations):
+    """Return the durations of the first repetition of a code (up to its first long space)"""
+    for k in range(1, len(durations), 2):
+        if durations[k] > REPETITION_GAP_US:
+            return durations[:k]
+    return durations
+
+
+def match_protocols(durations, variation_pct=TIMING_VARIATION_PCT):
+    """Return the names of the protocols in IR_PROTOCOLS that a code's first repetition matches"""
+    repetition = first_repetition(durations)
+    if len(repetition) < 3:
+        return []
+    # The first mark and space are a header if either is much longer than the other marks
+    shortest_mark = min(repetition[2::2])
+    header = repetition[0] > 2 * shortest_mark or repetition[1] > 2 * shortest_mark
+    start = 2 if header else 0
+    marks = repetition[start::2]
+    spaces = repetition[start + 1::2]
+    if not spaces:
+        return []
+    header_pulse, header_pause = (repetition[0], repetition[1]) if header else (None, None)
+    return ProtocolIndex(IR_PROTOCOLS, variation_pct).match(min(marks), max(marks), min(spaces), max(spaces),
+                                                            header_pulse, header_pause)
+
+
+def jitter(durations):
+    """Estimate the timing jitter of a code.
+    Returns:
+        (RMS deviation, largest deviation) of the marks and spaces from the mean of their cluster, in us.
+    """
+    values = sorted(d for d in durations if d <= REPETITION_GAP_US)
+    squares = 0
+    largest = 0
+    k = 0
+    while k < len(values):
+        end = k
+        limit = values[k] * (100 + CLUSTER_PCT) / 100
+        while end < len(values) and values[end] <= limit:
+            end += 1
+        mean = sum(values[k:end]) / (end - k)
+        for value in values[k:end]:
+            squares += (value - mean) ** 2
+            largest = max(largest, abs(value - mean))
+        k = end
+    return (sqrt(squares / len(values)) if values else 0), largest
+
+
+def assess(durations, resolution_us, late=None, handler_us=None):
+    """Measure the quality of a captured code.
+    Args:
+        durations (list): the code's marks and spaces in microseconds.
+        resolution_us (int): shortest mark or space the capture backend can time reliably.
+        late (int): number of edges the interrupt handler saw late ("irq" backend only).
+        handler_us (tuple): (mean, max) time the interrupt handler took ("irq" backend only).
+    Returns:
+        dict: the measurements (see the module docstring).
+    """
+    rms, largest = jitter(durations)
+    return {
+        'edges': len(durations) + 1,
+        'min_us': min(durations) if durations else 0,
+        'short': sum(1 for d in durations if d < resolution_us),
+        'resolution_us': resolution_us,
+        'jitter_us': rms,
+        'max_deviation_us': largest,
+        'protocols': match_protocols(durations),
+        'late': late,
+        'handler_us': handler_us,
+    }
+
+
+def problems(quality):
+    """Return the reasons (strings) why a capture can't be trusted, if any"""
+    reasons = []
+    if quality['late']:
+        reasons.append(f"{quality['late']} edges were timed after the pin had changed again")
+    if quality['short']:
+        reasons.append(f"{quality['short']} marks or spaces are shorter than {quality['resolution_us']}us")
+    return reasons
+
+
+def print_quality(quality):
+    """Print the measurements of a capture"""
+    print(f"Edges: {quality['edges']}, shortest mark or space: {quality['min_us']}us")
+    print(f"Jitter: {quality['jitter_us']:.1f}us RMS, {quality['max_deviation_us']:.0f}us max")
+    if quality['handler_us'] is not None:
+        mean, longest = quality['handler_us']
+        print(f"IRQ handler: {mean:.0f}us mean, {longest}us max, {quality['late']} late edges")
+    print(f"Protocol: {', '.join(quality['protocols']) or 'unknown'}")
+    for reason in problems(quality):
+        print(f"Warning: {reason}")
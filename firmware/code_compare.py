@@ -1,3 +1,14 @@
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SIGNATURE_LENGTH = 4  # Number of leading values used to group similar codes
+MATRIX_CHUNK_VALUES = 1 << 18  # Most per-value deviations deviation_matrix() holds at once (2MB, fits in cache)
+
+
 def is_similar(code1, code2, tolerance_percent=10, max_gap_us=20000):
     """
     Compare two IR codes for similarity up to the first gap > max_gap_us.
@@ -11,98 +22,235 @@ def is_similar(code1, code2, tolerance_percent=10, max_gap_us=20000):
     Returns:
         bool: True if codes are similar within the given tolerance
     """
-    # Extract timing values (skip the name if the first element is a string)
-    values1 = code1[1:] if isinstance(code1[0], str) else code1
-    values2 = code2[1:] if isinstance(code2[0], str) else code2
-    
-    # Find the length of the shorter code
-    min_length = min(len(values1), len(values2))
-    
-    # Find the index of the first gap > max_gap_us in each code
-    end_idx1 = min_length
-    end_idx2 = min_length
-    
-    for i, val in enumerate(values1):
-        if val > max_gap_us:
-            end_idx1 = i
-            break
-            
-    for i, val in enumerate(values2):
+    values1 = code_values(code1)
+    values2 = code_values(code2)
+    end_idx = min(first_gap_index(values1, max_gap_us), first_gap_index(values2, max_gap_us))
+    return values_similar(values1, values2, end_idx, tolerance_percent)
+
+
+def code_values(code):
+    """Return the timing values of a code, without its name"""
+    return code[1:] if isinstance(code[0], str) else code
+
+
+def first_gap_index(values, max_gap_us):
+    """Return the index of the first value > max_gap_us, or len(values) if there is none"""
+    for i, val in enumerate(values):
         if val > max_gap_us:
-            end_idx2 = i
-            break
-    
-    # Use the smaller of the two end indices
-    end_idx = min(end_idx1, end_idx2)
-    
-    # If end_idx is 0, there's no data to compare before the first large gap
+            return i
+    return len(values)
+
+
+def values_similar(values1, values2, end_idx, tolerance_percent):
+    """
+    Compare the first end_idx values of two codes.
+
+    Returns:
+        bool: True if every pair of values is within tolerance_percent
+    """
     if end_idx == 0:
         return False
-    
-    # Compare each pair of values up to the end index
     for i in range(end_idx):
-        if i >= len(values1) or i >= len(values2):
-            break
-            
         val1 = values1[i]
         val2 = values2[i]
-        
-        # Calculate the percentage difference
         max_val = max(val1, val2)
-        min_val = min(val1, val2)
-        
-        if max_val == 0 and min_val == 0:
+        if max_val == 0:
             # Both values are zero, consider them similar
             continue
-            
-        percent_diff = ((max_val - min_val) / max_val) * 100
-        
+        percent_diff = ((max_val - min(val1, val2)) / max_val) * 100
         if percent_diff > tolerance_percent:
             return False
-    
     return True
 
-def find_similar_codes(codes, tolerance_percent=10, max_gap_us=20000):
+
+def canonical_signature(values, bucket_width):
+    """
+    Quantize the first SIGNATURE_LENGTH values of a code into log-scale buckets.
+
+    Two values within the comparison tolerance are never more than one bucket
+    apart, so similar codes have signatures that differ by at most one in each place.
+
+    Args:
+        values: timing values of the code, at least SIGNATURE_LENGTH long
+        bucket_width: bucket width in natural log units
+
+    Returns:
+        tuple: bucket numbers
+    """
+    return tuple(int(math.log(v) // bucket_width) if v > 0 else -1
+                 for v in values[:SIGNATURE_LENGTH])
+
+
+def _neighbor_signatures(signature):
+    """Yield every signature that differs from signature by at most one in each place"""
+    keys = [()]
+    for bucket in signature:
+        keys = [key + (b,) for key in keys for b in (bucket - 1, bucket, bucket + 1)]
+    return keys
+
+
+def use_numpy(backend):
+    """Decide whether the NumPy engine should be used for the given backend name"""
+    if backend == 'numpy':
+        if np is None:
+            raise ImportError("The numpy backend requires NumPy to be installed")
+        return True
+    if backend == 'python':
+        return False
+    return np is not None  # 'auto'
+
+
+def _deviations(values, end_indices):
+    """
+    Compute the largest percentage difference between the values of every pair of codes.
+
+    The codes are padded into one 2-D array, sorted by length, so that the
+    values compared for a pair are the first end_index values of the shorter
+    code. The differences are computed in one broadcast operation per chunk
+    of rows, against the codes at and after those rows (the matrix is
+    symmetric), with at most MATRIX_CHUNK_VALUES values per chunk.
+
+    Args:
+        values: timing values of each code
+        end_indices: number of values of each code to compare (up to its first gap)
+
+    Returns:
+        numpy array: n x n percentages, inf for pairs without values to compare
+    """
+    n = len(values)
+    ends = np.array(end_indices, dtype=np.intp).reshape(n)
+    order = np.argsort(ends, kind='stable')
+    ends = ends[order]
+    length = int(ends[-1]) if n else 0
+    padded = np.zeros((n, length))
+    for row, i in enumerate(order):
+        padded[row, :ends[row]] = values[i][:ends[row]]
+    positions = np.arange(length)
+
+    deviations = np.full((n, n), np.inf)
+    start = 0
+    while start < n:
+        rows = max(1, MATRIX_CHUNK_VALUES // ((n - start) * max(length, 1)))
+        stop = min(n, start + rows)
+        # Every code from start on is at least as long as these rows, so a pair's
+        # matching length is the row's own; compare no further than the longest row
+        compared = int(ends[stop - 1])
+        if compared:
+            a = padded[start:stop, None, :compared]
+            b = padded[None, start:, :compared]
+            block = np.abs(a - b)
+            high = np.maximum(a, b)
+            np.divide(block, high, out=block, where=high > 0)  # Both values are zero where it isn't
+            block *= (positions[:compared] < ends[start:stop, None])[:, None, :]
+            block = block.max(axis=2) * 100
+            block[ends[start:stop] == 0] = np.inf
+            # Within the chunk, a row after the column is the longer code of the pair: use the mirror image
+            lower = np.tril_indices(stop - start, -1)
+            block[lower] = block.T[lower]
+            deviations[start:stop, start:] = block
+            deviations[start:, start:stop] = block.T
+        start = stop
+
+    unsorted = np.empty_like(deviations)
+    unsorted[np.ix_(order, order)] = deviations
+    return unsorted
+
+
+def deviation_matrix(codes, max_gap_us=20000):
+    """
+    Compute the largest percentage difference between every pair of codes, up to the first gap > max_gap_us.
+
+    Needs NumPy. deviation_matrix(codes)[i, j] <= tolerance_percent exactly when
+    is_similar(codes[i], codes[j], tolerance_percent).
+
+    Args:
+        codes: List of code tuples
+        max_gap_us: Maximum gap in microseconds before stopping comparison
+
+    Returns:
+        numpy array: n x n percentages, inf for pairs without values to compare
+    """
+    values = [code_values(code) for code in codes]
+    return _deviations(values, [first_gap_index(v, max_gap_us) for v in values])
+
+
+def similarity_matrix(codes, tolerance_percent=10, max_gap_us=20000):
+    """
+    Compare every pair of codes at once, as is_similar() compares two of them.
+
+    Needs NumPy.
+
+    Returns:
+        numpy array: n x n booleans, True where the codes are similar
+    """
+    return deviation_matrix(codes, max_gap_us) <= tolerance_percent
+
+
+def find_similar_codes(codes, tolerance_percent=10, max_gap_us=20000, backend='auto'):
     """
     Find all pairs of similar codes in the provided list.
+
+    Each code is normalized once (name removed, truncated at its first gap).
+    With NumPy, every pair is compared at once in a similarity matrix.
+    Otherwise, codes are grouped by their canonical signature and only codes
+    with neighboring signatures are compared, so the work grows roughly
+    linearly with the number of codes.
     
     Args:
         codes: List of code tuples
         tolerance_percent: Maximum percentage difference allowed
         max_gap_us: Maximum gap in microseconds before stopping comparison
+        backend: 'python', 'numpy', or 'auto' (NumPy if it is installed)
         
     Returns:
         list: Pairs of similar codes as (name1, name2, matching_length)
     """
+    names = []
+    values = []
+    end_indices = []
+    for i, code in enumerate(codes):
+        names.append(code[0] if isinstance(code[0], str) else f"Code {i}")
+        values.append(code_values(code))
+        end_indices.append(first_gap_index(values[i], max_gap_us))
+
+    if use_numpy(backend):
+        similar = np.triu(_deviations(values, end_indices) <= tolerance_percent, 1)
+        return [(names[i], names[j], min(end_indices[i], end_indices[j]))
+                for i, j in zip(*np.nonzero(similar))]
+
+    candidates = set()
+    if tolerance_percent >= 100:
+        # Any two values are similar; there is nothing to group by
+        for i in range(len(codes)):
+            for j in range(i + 1, len(codes)):
+                candidates.add((i, j))
+    else:
+        # Slightly widened so rounding in log() can't push similar values two buckets apart
+        bucket_width = -math.log(1 - tolerance_percent / 100) * (1 + 1e-9)
+        index = {}
+        signatures = {}
+        short = []
+        for i in range(len(codes)):
+            if end_indices[i] < SIGNATURE_LENGTH:
+                short.append(i)  # Too short to sign; compared with everything
+                continue
+            signatures[i] = canonical_signature(values[i], bucket_width)
+            index.setdefault(signatures[i], []).append(i)
+        for i, signature in signatures.items():
+            for key in _neighbor_signatures(signature):
+                for j in index.get(key, ()):
+                    if j > i:
+                        candidates.add((i, j))
+        for i in short:
+            for j in range(len(codes)):
+                if j != i:
+                    candidates.add((min(i, j), max(i, j)))
+
     similar_pairs = []
-    
-    for i in range(len(codes)):
-        for j in range(i+1, len(codes)):
-            if is_similar(codes[i], codes[j], tolerance_percent, max_gap_us):
-                # Get code names for better reporting
-                name1 = codes[i][0] if isinstance(codes[i][0], str) else f"Code {i}"
-                name2 = codes[j][0] if isinstance(codes[j][0], str) else f"Code {j}"
-                
-                # Calculate the matching length (up to the first gap)
-                values1 = codes[i][1:] if isinstance(codes[i][0], str) else codes[i]
-                values2 = codes[j][1:] if isinstance(codes[j][0], str) else codes[j]
-                
-                # Find the index of the first gap > max_gap_us in each code
-                end_idx1 = len(values1)
-                for k, val in enumerate(values1):
-                    if val > max_gap_us:
-                        end_idx1 = k
-                        break
-                        
-                end_idx2 = len(values2)
-                for k, val in enumerate(values2):
-                    if val > max_gap_us:
-                        end_idx2 = k
-                        break
-                
-                matching_length = min(end_idx1, end_idx2)
-                
-                similar_pairs.append((name1, name2, matching_length))
+    for i, j in sorted(candidates):
+        matching_length = min(end_indices[i], end_indices[j])
+        if values_similar(values[i], values[j], matching_length, tolerance_percent):
+            similar_pairs.append((names[i], names[j], matching_length))
     
     return similar_pairs
 
@@ -0,0 +1,368 @@
+"""
+Compact storage for IR codes.
+
+A CodeBank holds every code as RMT ticks (microseconds / SCALE_FACTOR) in one
+array('H'), with a name, an offset, a carrier frequency, a duty cycle and a
+priority per code, instead of a tuple of boxed integers per code. It can be
+saved to and loaded from a binary file, so the firmware doesn't have to
+compile the large CODES literal at boot.
+
+Most codes are a frame followed by several repeats of one frame (the same
+frame, or a short repeat code as NEC sends). Those are stored compressed: the
+base frame, the repeat frame (unless it is the same as the base frame), the
+number of repeats, and the gaps after the base frame and between repeats.
+They are expanded one frame at a time when they are sent (see fill_frame()).
+
+Codes of a known protocol can instead be stored as parameters: the
+protocol's timings (an IR_PROTOCOLS entry, see ir_protocols.py) and, per
+frame, the address, command, number of bits and toggle bit. Their frames are
+synthesized with ir_encoder.py when they are sent, with ideal timings.
+
+Bank file layout (header little-endian, arrays in native byte order, which is
+little-endian on both the ESP32 and the usual PC):
+    header: magic b"IRCB", version (H), scale factor (H), code count (H),
+            name table size (H), tick count (I)
+    name table: per code, a length byte followed by the UTF-8 name
+    offsets: (count + 1) x uint32, index of each code's first tick
+    carriers: count x uint32, carrier frequency in Hz (0: the firmware's default)
+    duties: count x uint8, carrier duty cycle in percent (0: the firmware's default)
+    priorities: count x uint8, prior likelihood of the code working (0..255, e.g. from brand market share)
+    bases: count x uint16, number of ticks in the base frame
+    repeats: count x uint8, number of repeat frames (0: the code is stored as is)
+    first_gaps: count x uint16, gap in ticks after the base frame
+    repeat_gaps: count x uint16, gap in ticks between repeat frames
+    ticks: uint16 RMT ticks; per code, either the whole code padded to an even
+           length, or the base frame followed by the repeat frame (if different).
+           For a synthesized code, (address, command, bits, toggle) of the base
+           frame followed by those of the repeat frame (if different).
+    code protocols: count x uint8, 1 + index in the protocol table of a
+           synthesized code's protocol (0: the code is stored as ticks)
+    protocol table: a count byte, then per protocol: a length byte and the
+           name, PROTOCOL_FORMAT (carrier, pulse_1, pause_1, pulse_0, pause_0,
+           header_pulse, header_pause in microseconds, address_bits,
+           command_bits, stop_bit, lsb_first), a length byte and the flags
+           (empty for None)
+
+Version 1 files have no carriers or duties, versions 1 and 2 have no
+priorities, versions 1 to 3 have no compressed codes and versions 1 to 4 have
+no synthesized codes; their codes use the defaults (0).
+
+Works under both MicroPython and CPython (see build_code_bank.py).
+"""
+import struct
+from array import array
+
+from ir_encoder import encode_frame
+
+SCALE_FACTOR = 3  # Scale factor for pulse durations (microseconds per RMT tick)
+PULSE_MAX = 32767  # RMT.PULSE_MAX: longest pulse in ticks, also used to pad odd-length codes
+
+BANK_MAGIC = b"IRCB"
+BANK_VERSION = 5
+HEADER_FORMAT = "<4sHHHHI"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+PROTOCOL_FORMAT = "<IHHHHHHBBBB"
+PROTOCOL_SIZE = struct.calcsize(PROTOCOL_FORMAT)
+FRAME_SIZE = 4  # Ticks holding the (address, command, bits, toggle) of a synthesized frame
+
+# Repeat frame detection
+REPEAT_GAP = 10_000 // SCALE_FACTOR  # A pause longer than this (ticks) separates frames, as in analyze_signal.py
+REPEAT_TOLERANCE_PCT = 25  # Allowable difference between repeats, as a percentage...
+REPEAT_TOLERANCE_MIN = 100 // SCALE_FACTOR  # ...or in ticks, whichever is larger
+MAX_REPEATS = 255
+
+
+def _zeros(typecode, count):
+    """Return an array of count zeros"""
+    return array(typecode, (0 for _ in range(count)))
+
+
+def _close(value, reference):
+    """True if value is within the repeat tolerance of reference"""
+    return abs(value - reference) <= max(reference * REPEAT_TOLERANCE_PCT // 100, REPEAT_TOLERANCE_MIN)
+
+
+def _same_frame(ticks, frame1, frame2):
+    """True if two (start, end) slices of ticks are the same frame, within the repeat tolerance"""
+    if frame1[1] - frame1[0] != frame2[1] - frame2[0]:
+        return False
+    for k in range(frame1[1] - frame1[0]):
+        if not _close(ticks[frame1[0] + k], ticks[frame2[0] + k]):
+            return False
+    return True
+
+
+def _compress(ticks):
+    """Split a code into a base frame followed by repeats of one frame.
+    Args:
+        ticks (list): the code in ticks, starting with a mark.
+    Returns:
+        (stored ticks, base length, repeats, first gap, repeat gap), or None if
+        the code isn't made of repeats (or doesn't end with a mark).
+    """
+    if len(ticks) % 2 == 0:
+        return None
+    frames = []
+    gaps = []
+    start = 0
+    for k in range(1, len(ticks), 2):
+        if ticks[k] > REPEAT_GAP:
+            frames.append((start, k))
+            gaps.append(ticks[k])
+            start = k + 1
+    frames.append((start, len(ticks)))
+    repeats = len(frames) - 1
+    if repeats == 0 or repeats > MAX_REPEATS or max(gaps) > PULSE_MAX:
+        return None
+    repeat = frames[1]
+    for frame in frames[2:]:
+        if not _same_frame(ticks, frame, repeat):
+            return None
+    for gap in gaps[2:]:
+        if not _close(gap, gaps[1]):
+            return None
+    base = ticks[frames[0][0]:frames[0][1]]
+    stored = base
+    if not _same_frame(ticks, frames[0], repeat):
+        stored = base + ticks[repeat[0]:repeat[1]]
+    return stored, len(base), repeats, gaps[0], gaps[1] if repeats > 1 else 0
+
+
+class CodeBank:
+    """A collection of named IR codes stored as RMT ticks."""
+
+    def __init__(self):
+        self.names = []
+        self.offsets = array("I", [0])
+        self.carriers = array("I")
+        self.duties = array("B")
+        self.priorities = array("B")
+        self.bases = array("H")
+        self.repeats = array("B")
+        self.first_gaps = array("H")
+        self.repeat_gaps = array("H")
+        self.ticks = array("H")
+        self.code_protocols = array("B")
+        self.protocols = []  # IR_PROTOCOLS entries of the synthesized codes
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, code: tuple, carrier: int = 0, duty: int = 0, priority: int = 0, compress: bool = True):
+        """Add a code.
+        Args:
+            code (tuple): A tuple containing the pulse durations in microseconds.
+                          The first element can be a string representing the name of the code.
+            carrier (int): carrier frequency in Hz, or 0 for the firmware's default.
+            duty (int): carrier duty cycle in percent, or 0 for the firmware's default.
+            priority (int): prior likelihood of the code working, 0..255.
+            compress (bool): store repeated frames once (see _compress()).
+        Raises:
+            ValueError: if a pulse is too long to be stored.
+        """
+        name = f"{len(self.names)}"
+        if isinstance(code[0], str):
+            name = code[0]
+            code = code[1:]
+        scaled = [round(p / SCALE_FACTOR) for p in code]
+        for tick in scaled:
+            if tick > 0xFFFF:
+                raise ValueError(f"code {name}: Pulse {tick * SCALE_FACTOR} too long to store")
+        compressed = _compress(scaled) if compress else None
+        if compressed is None:
+            if len(scaled) % 2 == 1:
+                scaled.append(PULSE_MAX)
+            compressed = scaled, len(scaled), 0, 0, 0
+        self._append(name, *compressed, carrier, duty, priority, 0)
+
+    def add_synthesized(self, name: str, protocol: tuple, base: tuple, repeat: tuple = None, repeats: int = 0,
+                        first_gap: int = 0, repeat_gap: int = 0, carrier: int = 0, duty: int = 0,
+                        priority: int = 0):
+        """Add a code of a known protocol, to be synthesized when it is sent (see ir_encoder.py).
+        Args:
+            name (str): name of the code.
+            protocol (tuple): an IR_PROTOCOLS entry.
+            base (tuple): (address, command, bits, toggle) of the first frame.
+            repeat (tuple): (address, command, bits, toggle) of the repeat frames
+                            (default: the same as base; bits 0 for a short repeat code).
+            repeats (int): number of frames after the first.
+            first_gap (int): gap after the first frame in microseconds.
+            repeat_gap (int): gap between repeat frames in microseconds.
+            carrier, duty, priority (int): as for add().
+        Raises:
+            ValueError: if a field or gap is too large to be stored.
+        """
+        frames = list(base) if repeat is None or tuple(repeat) == tuple(base) else list(base) + list(repeat)
+        gaps = (round(first_gap / SCALE_FACTOR), round(repeat_gap / SCALE_FACTOR))
+        if max(frames) > 0xFFFF or min(frames) < 0 or max(gaps) > PULSE_MAX or repeats > MAX_REPEATS:
+            raise ValueError(f"code {name}: can't store {protocol[0]} {frames} with gaps {gaps}")
+        if protocol not in self.protocols:
+            self.protocols.append(protocol)
+        self._append(name, frames, FRAME_SIZE, repeats, *gaps, carrier, duty, priority,
+                     1 + self.protocols.index(protocol))
+
+    def _append(self, name, stored, base, repeats, first_gap, repeat_gap, carrier, duty, priority, protocol):
+        """Append a code's stored ticks and table entries"""
+        self.ticks.extend(array("H", stored))
+        self.offsets.append(len(self.ticks))
+        self.bases.append(base)
+        self.repeats.append(repeats)
+        self.first_gaps.append(first_gap)
+        self.repeat_gaps.append(repeat_gap)
+        self.carriers.append(carrier)
+        self.duties.append(duty)
+        self.priorities.append(priority)
+        self.code_protocols.append(protocol)
+        self.names.append(name)
+
+    def extend(self, codes):
+        """Add every code in codes"""
+        for code in codes:
+            self.add(code)
+
+    def pulses(self, index: int):
+        """Return a memoryview of the stored ticks of a code (see the module docstring)"""
+        return memoryview(self.ticks)[self.offsets[index]:self.offsets[index + 1]]
+
+    def frame_count(self, index: int):
+        """Return the number of frames to send for a code"""
+        return 1 + self.repeats[index]
+
+    def protocol(self, index: int):
+        """Return the IR_PROTOCOLS entry of a synthesized code, or None for a code stored as ticks"""
+        protocol = self.code_protocols[index]
+        return self.protocols[protocol - 1] if protocol else None
+
+    def frame_gap(self, index: int, frame: int):
+        """Return the gap (ticks) after a frame of a code, or None for a code stored as is"""
+        repeats = self.repeats[index]
+        if repeats == 0 and self.code_protocols[index] == 0:
+            return None
+        if frame == repeats:
+            return PULSE_MAX  # After the last frame, as for any odd-length code
+        return self.first_gaps[index] if frame == 0 else self.repeat_gaps[index]
+
+    def fill_frame(self, index: int, frame: int, buffer: list):
+        """Replace the contents of buffer with one frame of a code and the gap after it.
+
+        Frames are numbered from 0 to frame_count() - 1. If buffer already has
+        room for the frame (see max_frame_length()), this allocates nothing, so
+        one buffer can be reused for every frame of every code.
+        Returns:
+            list: buffer
+        """
+        del buffer[:]  # On MicroPython, unlike clear(), keeps the list's capacity (CPython frees it either way)
+        ticks = self.ticks
+        # The stored base frame, or the repeat frame if it is stored separately
+        start = self.offsets[index]
+        split = start + self.bases[index]
+        end = self.offsets[index + 1]
+        if frame == 0 or end == split:
+            end = split
+        else:
+            start = split
+        protocol = self.code_protocols[index]
+        if protocol:
+            encode_frame(self.protocols[protocol - 1], ticks[start], ticks[start + 1], ticks[start + 2],
+                         ticks[start + 3], buffer, SCALE_FACTOR)
+        else:
+            for k in range(start, end):
+                buffer.append(ticks[k])
+        gap = self.frame_gap(index, frame)
+        if gap is not None:
+            buffer.append(gap)
+        return buffer
+
+    def duration(self, index: int):
+        """Return the duration of a code in microseconds"""
+        buffer = []
+        return sum(sum(self.fill_frame(index, frame, buffer)) for frame in range(self.frame_count(index))) \
+            * SCALE_FACTOR
+
+    def max_frame_length(self):
+        """Return the number of ticks in the longest frame (with its gap)"""
+        buffer = []
+        longest = 0
+        for i in range(len(self.names)):
+            # Frames after the second are the same as the second
+            for frame in range(min(2, self.frame_count(i))):
+                longest = max(longest, len(self.fill_frame(i, frame, buffer)))
+        return longest
+
+    def save(self, filename: str):
+        """Write the bank to a binary file"""
+        names = b"".join(bytes([len(n)]) + n for n in (name.encode() for name in self.names))
+        with open(filename, "wb") as f:
+            f.write(struct.pack(HEADER_FORMAT, BANK_MAGIC, BANK_VERSION, SCALE_FACTOR,
+                                len(self.names), len(names), len(self.ticks)))
+            f.write(names)
+            f.write(bytes(self.offsets))
+            f.write(bytes(self.carriers))
+            f.write(bytes(self.duties))
+            f.write(bytes(self.priorities))
+            f.write(bytes(self.bases))
+            f.write(bytes(self.repeats))
+            f.write(bytes(self.first_gaps))
+            f.write(bytes(self.repeat_gaps))
+            f.write(bytes(self.ticks))
+            f.write(bytes(self.code_protocols))
+            f.write(bytes([len(self.protocols)]))
+            for protocol in self.protocols:
+                name = protocol[0].encode()
+                flags = (protocol[12] or "").encode()
+                f.write(bytes([len(name)]) + name)
+                f.write(struct.pack(PROTOCOL_FORMAT, *protocol[1:12]))
+                f.write(bytes([len(flags)]) + flags)
+
+    @classmethod
+    def load(cls, filename: str):
+        """Read a bank written by save().
+        Raises:
+            OSError: if the file can't be read.
+            ValueError: if the file is not a compatible code bank.
+        """
+        bank = cls()
+        with open(filename, "rb") as f:
+            magic, version, scale, count, names_size, tick_count = struct.unpack(
+                HEADER_FORMAT, f.read(HEADER_SIZE))
+            if magic != BANK_MAGIC or not 1 <= version <= BANK_VERSION or scale != SCALE_FACTOR:
+                raise ValueError(f"{filename} is not a version {BANK_VERSION} code bank")
+            names = f.read(names_size)
+            pos = 0
+            for _ in range(count):
+                length = names[pos]
+                bank.names.append(names[pos + 1:pos + 1 + length].decode())
+                pos += 1 + length
+            bank.offsets = _zeros("I", count + 1)
+            f.readinto(bank.offsets)
+            bank.carriers = _zeros("I", count)
+            bank.duties = _zeros("B", count)
+            bank.priorities = _zeros("B", count)
+            if version >= 2:
+                f.readinto(bank.carriers)
+                f.readinto(bank.duties)
+            if version >= 3:
+                f.readinto(bank.priorities)
+            bank.bases = _zeros("H", count)
+            bank.repeats = _zeros("B", count)
+            bank.first_gaps = _zeros("H", count)
+            bank.repeat_gaps = _zeros("H", count)
+            if version >= 4:
+                f.readinto(bank.bases)
+                f.readinto(bank.repeats)
+                f.readinto(bank.first_gaps)
+                f.readinto(bank.repeat_gaps)
+            else:
+                for i in range(count):
+                    bank.bases[i] = bank.offsets[i + 1] - bank.offsets[i]
+            bank.ticks = _zeros("H", tick_count)
+            f.readinto(bank.ticks)
+            bank.code_protocols = _zeros("B", count)
+            if version >= 5:
+                f.readinto(bank.code_protocols)
+                for _ in range(f.read(1)[0]):
+                    name = f.read(f.read(1)[0]).decode()
+                    fields = struct.unpack(PROTOCOL_FORMAT, f.read(PROTOCOL_SIZE))
+                    flags = f.read(f.read(1)[0]).decode() or None
+                    bank.protocols.append((name,) + fields[:9] + (bool(fields[9]), bool(fields[10]), flags))
+        return bank
@@ -28,12 +28,30 @@ GREEN = (0, 255, 0)
 # Directory to store .py files containing captured IR codes
 CAPTURE_DIRECTORY = "/captured"
 
+# Binary code bank written by build_code_bank.py (CODES in codes.py is used if it is missing)
+CODE_BANK_FILE = "/codes.bin"
+
+# Sweep scheduling
+HITS_FILE = "/hits.bin"  # Per-code counts of "this one worked"
+LONG_PRESS_MS = 1000  # Holding the button this long during a sweep marks the code being sent as working, and stops
+SWEEP_BUDGET_MS = None  # Only send the most likely codes that fit in this many ms (None to send every code)
+
 # optional input pin configuration for capturing IR signals
 INPUT_PIN = None  # GPIO pin for input (optional, None to disable)
 INPUT_ACTIVE_LEVEL = 0  # Active low (0V)
 # GPIO pin to power the IR receiver (optional, None to disable)
 INPUT_POWER_PIN = None
 
+# IR capture backend (see capture.py)
+CAPTURE_BACKEND = "irq"  # "irq": time each edge in a pin interrupt handler; "i2s": sample INPUT_PIN with I2S and DMA
+CAPTURE_MAX_EDGES = 1000  # Longest code that can be captured, in marks and spaces
+CAPTURE_I2S_ID = 0  # I2S peripheral for the "i2s" backend
+CAPTURE_SCK_PIN = None  # Unused GPIO for the I2S bit clock ("i2s" backend only)
+CAPTURE_WS_PIN = None  # Unused GPIO for the I2S word clock ("i2s" backend only)
+CAPTURE_SAMPLE_RATE = 15625  # I2S frames per second, 64 samples each: 1 us per sample
+CAPTURE_REJECT_UNCLEAN = True  # Don't save captures with edges that were timed late or are too short to time
+CAPTURE_SHOTS = 1  # Capture each code this many times and save the consensus of the captures (see consensus.py)
+
 # Change USE_XIAO_ESP32C6 to False if you have an ESP32-C6 that is not a XIAO ESP32-C6
 USE_XIAO_ESP32C6 = True
 try:
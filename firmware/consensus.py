@@ -0,0 +1,94 @@
+"""
+Combine several captures ("shots") of the same remote button into one clean code.
+
+Each shot has its own receiver jitter. consensus() lines the shots up edge by
+edge, rejects the shots that don't agree with the others, and takes the
+median of each mark and space over the shots that are left:
+  - Shots are aligned on the number of marks and spaces that most shots
+    have. Longer shots (e.g. the button was held for an extra repetition)
+    are cut to that length; shorter ones (missed edges) are rejected.
+  - A shot is an outlier if any of its marks or spaces differs from the
+    median of the aligned shots by more than tolerance_pct, or by more than
+    TOLERANCE_MIN_US for short ones (a different bit, a toggle bit, or a
+    glitch). Outliers are left out, and the medians
+    are taken again over the rest.
+
+Works under both MicroPython and CPython: the firmware uses it to capture a
+code from several presses (CAPTURE_SHOTS in config.py), and
+consensus_code.py uses it on Saleae captures.
+"""
+TOLERANCE_PCT = 25  # Allowable variation from the median, as analyze_signal.py allows from a protocol
+TOLERANCE_MIN_US = 200  # Always allow this much, so receiver jitter doesn't reject shots of codes with short pulses
+MIN_SHOTS = 2  # Fewest agreeing shots to make a consensus from
+
+
+def _median(values):
+    """Return the median of a list of numbers, rounded to an int"""
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return round((values[middle - 1] + values[middle]) / 2)
+
+
+def _medians(shots, length):
+    """Return the median of each of the first length durations of shots"""
+    return [_median([shot[k] for shot in shots]) for k in range(length)]
+
+
+def aligned_length(shots):
+    """Return the number of durations that most shots have (the longest, if several are as common)"""
+    counts = {}
+    for shot in shots:
+        counts[len(shot)] = counts.get(len(shot), 0) + 1
+    return max(counts, key=lambda length: (counts[length], length))
+
+
+def aligned_medians(shots):
+    """Return the median of each duration over the shots that are long enough to align, which shots are checked against"""
+    length = aligned_length(shots)
+    return _medians([shot for shot in shots if len(shot) >= length], length)
+
+
+def disagreement(shot, medians, tolerance_pct=TOLERANCE_PCT):
+    """Say why a shot doesn't agree with the medians.
+    Returns:
+        str: that the shot is too short, or which of its durations is furthest
+             out of tolerance and by how much; None if the shot agrees.
+    """
+    if len(shot) < len(medians):
+        return f"{len(shot)} durations, {len(medians)} expected"
+    worst = None
+    worst_ratio = 1
+    for k, median in enumerate(medians):
+        ratio = abs(shot[k] - median) / max(median * tolerance_pct / 100, TOLERANCE_MIN_US)
+        if ratio > worst_ratio:
+            worst = k
+            worst_ratio = ratio
+    if worst is None:
+        return None
+    return (f"duration {worst} is {shot[worst]}us, {abs(shot[worst] - medians[worst])}us from "
+            f"the median of {medians[worst]}us")
+
+
+def agrees(shot, medians, tolerance_pct=TOLERANCE_PCT):
+    """True if shot is as long as medians and every duration up to there is within tolerance of its median"""
+    return disagreement(shot, medians, tolerance_pct) is None
+
+
+def consensus(shots, tolerance_pct=TOLERANCE_PCT, min_shots=MIN_SHOTS):
+    """Make one code from several shots of the same button.
+    Args:
+        shots (list): each shot's durations in microseconds, starting with a mark.
+        tolerance_pct (int): largest difference from the median, in percent, for a shot to agree.
+        min_shots (int): fewest agreeing shots needed.
+    Returns:
+        (durations, indices of the shots used), or None if too few shots agree.
+    """
+    if not shots:
+        return None
+    medians = aligned_medians(shots)
+    kept = [i for i, shot in enumerate(shots) if agrees(shot, medians, tolerance_pct)]
+    if len(kept) < min_shots:
+        return None
+    return _medians([shots[i] for i in kept], len(medians)), kept
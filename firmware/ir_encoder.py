@@ -0,0 +1,170 @@
+"""
+Table-driven IR frame encoder, the inverse of ir_decoder.py.
+
+Generates the ideal mark/space durations of a frame from an IR_PROTOCOLS
+entry (see ir_protocols.py) and the fields ir_decoder.py decodes:
+    (protocol_name, carrier_frequency, pulse_1, pause_1, pulse_0, pause_0,
+     header_pulse, header_pause, address_bits, command_bits, stop_bit, lsb_first, flags)
+
+Pulse-distance and pulse-width protocols (NEC, SAMSUNG, SIRCS, ...) are sent
+as a header and a mark/space pair per bit. Protocols with an "RC5" or "RC6"
+flag are biphase (Manchester) coded: their half-bits are merged into marks
+and spaces as they are generated. Every frame starts and ends with a mark;
+the caller adds the gap after it.
+
+encode_frame() appends to a list without allocating (given a list with
+enough capacity), so the firmware can synthesize codes straight into its RMT
+pulse buffer (see codebank.py).
+
+Works under both MicroPython and CPython.
+"""
+RC6_MODE_BITS = 3
+DEFAULT_GAP_US = 40_000  # Gap between repeated frames when none is given
+
+
+def _scaled(duration_us: int, scale: int):
+    """Return a duration in units of scale microseconds, rounded"""
+    return (duration_us + scale // 2) // scale
+
+
+def _data_bit(protocol, address: int, command: int, bits: int, k: int):
+    """Return data bit k, in sending order, of a frame of bits bits: the address field, then the command field.
+    Fields are cut short as ir_decoder.py cuts them; bits beyond both fields are 0.
+    """
+    address_bits = min(bits, protocol[8])
+    if k < address_bits:
+        value = address
+        width = address_bits
+    else:
+        k -= address_bits
+        width = min(bits - address_bits, protocol[9])
+        if k >= width:
+            return 0
+        value = command
+    return (value >> (k if protocol[11] else width - 1 - k)) & 1
+
+
+def _encode_pulse_distance(protocol, address: int, command: int, bits: int, buffer: list, scale: int):
+    """Append a frame of a pulse-distance or pulse-width protocol"""
+    _, _, pulse1, pause1, pulse0, pause0, hp, hpa, _, _, stop_bit, _, _ = protocol
+    if hp > 0 and hpa > 0:
+        buffer.append(_scaled(hp, scale))
+        if bits == 0:
+            # Short repeat code (header pulse, half-length pause, stop pulse), as sent by NEC
+            buffer.append(_scaled(hpa // 2, scale))
+            buffer.append(_scaled(pulse0, scale))
+            return
+        buffer.append(_scaled(hpa, scale))
+    for k in range(bits):
+        if _data_bit(protocol, address, command, bits, k):
+            buffer.append(_scaled(pulse1, scale))
+            buffer.append(_scaled(pause1, scale))
+        else:
+            buffer.append(_scaled(pulse0, scale))
+            buffer.append(_scaled(pause0, scale))
+    if stop_bit or pulse1 == pulse0:
+        buffer.append(_scaled(pulse0, scale))  # Stop pulse, or the pulse that ends the last pause
+    else:
+        buffer.pop()  # Pulse-width coded: the last bit's pause is the gap after the frame
+
+
+def _half_bit(buffer: list, start: int, level: int, duration: int):
+    """Append half a Manchester bit, merging it with the previous duration if that is at the same level"""
+    n = len(buffer) - start  # Durations at even positions are marks
+    if n == 0:
+        if level:
+            buffer.append(duration)  # A frame starts with its first mark
+    elif (n % 2 == 1) == (level == 1):
+        buffer[-1] += duration
+    else:
+        buffer.append(duration)
+
+
+def _manchester_bit(buffer: list, start: int, first: int, duration: int):
+    """Append a Manchester bit whose first half is at level first"""
+    _half_bit(buffer, start, first, duration)
+    _half_bit(buffer, start, first ^ 1, duration)
+
+
+def _encode_rc5(protocol, address: int, command: int, bits: int, toggle: int, buffer: list, scale: int):
+    """Append an RC5 frame: 2 start bits, a toggle bit, then address and command.
+    RC5 sends a 1 as off-then-on.
+    """
+    start = len(buffer)
+    unit = _scaled(protocol[2], scale)
+    _manchester_bit(buffer, start, 0, unit)
+    _manchester_bit(buffer, start, 0, unit)
+    _manchester_bit(buffer, start, toggle ^ 1, unit)
+    for k in range(bits):
+        _manchester_bit(buffer, start, _data_bit(protocol, address, command, bits, k) ^ 1, unit)
+    if (len(buffer) - start) % 2 == 0:
+        buffer.pop()  # The second half of a final 0 bit is idle
+
+
+def _encode_rc6(protocol, address: int, command: int, bits: int, toggle: int, buffer: list, scale: int):
+    """Append an RC6 frame: header, start bit, mode bits (mode 0), double-length toggle bit, then data.
+    RC6 sends a 1 as on-then-off.
+    """
+    start = len(buffer)
+    unit = _scaled(protocol[2], scale)
+    buffer.append(_scaled(protocol[6], scale))
+    buffer.append(_scaled(protocol[7], scale))
+    _manchester_bit(buffer, start, 1, unit)
+    for _ in range(RC6_MODE_BITS):
+        _manchester_bit(buffer, start, 0, unit)
+    _manchester_bit(buffer, start, toggle, 2 * unit)
+    for k in range(bits):
+        _manchester_bit(buffer, start, _data_bit(protocol, address, command, bits, k), unit)
+    if (len(buffer) - start) % 2 == 0:
+        buffer.pop()  # The second half of a final 1 bit is idle
+
+
+def encode_frame(protocol, address: int, command: int, bits: int, toggle: int, buffer: list, scale: int = 1):
+    """Append the durations of one frame to buffer.
+    Args:
+        protocol (tuple): an IR_PROTOCOLS entry.
+        address (int): address field, as ir_decoder.py decodes it.
+        command (int): command field, as ir_decoder.py decodes it.
+        bits (int): number of data bits; 0 for a short repeat code.
+        toggle (int): toggle bit for RC5/RC6 (ignored by other protocols).
+        buffer (list): list to append to.
+        scale (int): microseconds per unit of the appended durations (e.g. SCALE_FACTOR for RMT ticks).
+    Returns:
+        list: buffer
+    Raises:
+        ValueError: if the protocol's encoding isn't supported.
+    """
+    flags = protocol[12]
+    if flags is None:
+        _encode_pulse_distance(protocol, address, command, bits, buffer, scale)
+    elif flags == "RC5":
+        _encode_rc5(protocol, address, command, bits, toggle, buffer, scale)
+    elif flags.startswith("RC6"):
+        _encode_rc6(protocol, address, command, bits, toggle, buffer, scale)
+    else:
+        raise ValueError(f"{protocol[0]}: {flags} encoding isn't supported")
+    return buffer
+
+
+def encode(protocol, address: int, command: int, bits: int = None, toggle: int = 0, repeats: int = 0,
+           gap: int = DEFAULT_GAP_US, repeat_code: bool = False):
+    """Return the durations (microseconds) of a code: a frame followed by repeats of it.
+    Args:
+        protocol (tuple): an IR_PROTOCOLS entry.
+        address (int): address field.
+        command (int): command field.
+        bits (int): number of data bits (default: the protocol's address and command bits).
+        toggle (int): toggle bit for RC5/RC6.
+        repeats (int): number of frames after the first.
+        gap (int): pause between frames in microseconds.
+        repeat_code (bool): send the repeats as short repeat codes (as NEC does) rather than whole frames.
+    Returns:
+        list: mark/space durations, starting and ending with a mark.
+    """
+    if bits is None:
+        bits = protocol[8] + protocol[9]
+    durations = encode_frame(protocol, address, command, bits, toggle, [])
+    for _ in range(repeats):
+        durations.append(gap)
+        encode_frame(protocol, address, command, 0 if repeat_code else bits, toggle, durations)
+    return durations
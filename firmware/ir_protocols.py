@@ -0,0 +1,132 @@
+"""
+Timings of the IR protocols that the analyzer and the firmware know.
+
+Shared by analyze_signal.py, ir_decoder.py and build_code_bank.py on the host,
+and by the firmware to check captured codes (capture_quality.py). Both match
+a code's timings to protocols with ProtocolIndex, so they agree on what a
+code is.
+
+Works under both MicroPython and CPython.
+"""
+
+# Define IR protocols based on irmpSelectMain15Protocols.h from IRMP GitHub repository
+# Format: (protocol_name, carrier_frequency, pulse_1, pause_1, pulse_0, pause_0, header_pulse, header_pause, address_bits, command_bits, stop_bit, lsb_first, flags)
+# All times in microseconds
+IR_PROTOCOLS = [
+    # Protocol name, carrier, pulse1, pause1, pulse0, pause0, header_pulse, header_pause, address_bits, command_bits, stop_bit, lsb_first, flags
+    ("SIRCS", 40000, 1200, 600, 600, 600, 2400, 600, 12, 12, False, False, None),  # Corrected SIRCS (Sony) values
+    ("NEC", 38000, 560, 1690, 560, 560, 9000, 4500, 16, 16, True, True, None),
+    ("APPLE", 38000, 560, 1690, 560, 560, 9000, 4500, 8, 16, True, False, None),
+    ("SAMSUNG", 38000, 550, 1650, 550, 550, 4500, 4500, 16, 16, True, True, None),
+    ("MATSUSHITA", 36000, 400, 1200, 400, 400, 3500, 3500, 12, 12, True, False, None),
+    ("KASEIKYO", 37000, 500, 1500, 500, 500, 3400, 1700, 16, 16, True, False, None),
+    ("RECS80", 38000, 158, 7432, 158, 4902, 0, 0, 4, 6, False, False, None),
+    ("RC5", 36000, 889, 889, 889, 889, 889, 889, 5, 6, False, False, "RC5"),
+    ("DENON", 38000, 275, 1900, 275, 775, 0, 0, 5, 10, False, False, None),
+    ("RC6", 36000, 444, 444, 444, 444, 2666, 889, 8, 8, True, True, "RC6"),
+    ("SAMSUNG32", 38000, 500, 1500, 500, 500, 4500, 4500, 16, 16, True, True, None),
+    ("RECS80EXT", 38000, 158, 7432, 158, 4902, 0, 0, 4, 6, False, False, None),
+    # ("NUBERT", 38000, 340, 1700, 340, 680, 0, 0, 0, 10, False, False, None),
+    # ("BANG_OLUFSEN", 38000, 200, 3125, 200, 9375, 0, 0, 16, 8, False, False, None),
+    # ("GRUNDIG", 38000, 528, 528, 528, 1056, 6336, 3168, 0, 8, True, False, None),
+    # added protocols
+    # ("THOMSON", 36000, 500, 1500, 500, 500, 8000, 2500, 8, 8, True, True, None),
+    ("NEC16", 38000, 560, 1690, 560, 560, 9000, 4500, 8, 8, True, True, None),
+]
+
+
+def _bisect(keys, key, right=False):
+    """Return where key would go in the sorted list keys (MicroPython has no bisect module)"""
+    lo, hi = 0, len(keys)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if keys[mid] < key or (right and keys[mid] == key):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+class ProtocolIndex:
+    """Precompiled tolerance windows for a protocol table at one variation percentage.
+
+    Every window is reference * (1 +/- variation), so for a measured value x the
+    references whose windows contain x form a contiguous run of the sorted
+    references. Candidates are found by bisection on the header and bit timings,
+    then confirmed against the exact windows, so a lookup touches only the
+    protocols that can possibly match.
+    """
+
+    def __init__(self, protocols, variation_pct):
+        self.protocols = protocols
+        self.variation_pct = variation_pct
+        self.by_name = {protocol[0]: protocol for protocol in protocols}
+        self.lower = 1 - variation_pct / 100
+        self.upper = 1 + variation_pct / 100
+
+        # Per protocol: (name, pulse1, pulse0, pause1, pause0, header) windows
+        self.windows = []
+        for protocol in protocols:
+            name, _, pulse1, pause1, pulse0, pause0, hp, hpa, _, _, _, _, _ = protocol
+            header = None
+            if hp > 0 and hpa > 0:
+                header = (hp * self.lower, hp * self.upper, hpa * self.lower, hpa * self.upper)
+            self.windows.append((
+                name,
+                (pulse1 * self.lower, pulse1 * self.upper),
+                (pulse0 * self.lower, pulse0 * self.upper),
+                (pause1 * self.lower, pause1 * self.upper),
+                (pause0 * self.lower, pause0 * self.upper),
+                header,
+            ))
+
+        # Sorted (reference, protocol index) keys for the bisection lookups
+        self.by_pulse1 = sorted((p[2], i) for i, p in enumerate(protocols))
+        self.by_pulse0 = sorted((p[4], i) for i, p in enumerate(protocols))
+        self.by_header_pulse = sorted((p[6], i) for i, p in enumerate(protocols) if self.windows[i][5])
+        self.headerless = set(i for i, w in enumerate(self.windows) if w[5] is None)
+
+    def _near(self, keys, low, high):
+        """Return the protocol indices whose reference could have a window overlapping [low, high]"""
+        if self.lower <= 0:
+            return [i for _, i in keys]  # Windows reach down to zero; nothing to prune
+        # Slightly widened so that rounding never drops a candidate; the exact check follows
+        lo = _bisect(keys, (low / self.upper * 0.999999, -1))
+        hi = _bisect(keys, (high / self.lower * 1.000001, len(keys)), True)
+        return [i for _, i in keys[lo:hi]]
+
+    def candidates(self, pulse_min, pulse_max, header_pulse=None):
+        """Return the sorted indices of protocols worth checking exactly"""
+        found = set(self._near(self.by_pulse1, pulse_min, pulse_max))
+        found.update(self._near(self.by_pulse0, pulse_min, pulse_max))
+        if header_pulse is not None:
+            found &= self.headerless.union(self._near(self.by_header_pulse, header_pulse, header_pulse))
+        return sorted(found)
+
+    def match(self, pulse_min, pulse_max, pause_min, pause_max, header_pulse=None, header_pause=None):
+        """Return the names of the protocols whose timings a code's marks and spaces fit, in table order.
+
+        A protocol matches if the range of the marks overlaps the window of
+        either bit's mark, and the range of the spaces the window of either
+        bit's space. If the header is given, protocols that have one must match it too.
+        Args:
+            pulse_min, pulse_max: the shortest and longest mark after the header (us).
+            pause_min, pause_max: the shortest and longest space after the header (us).
+            header_pulse, header_pause: the header's mark and space (us), or None if unknown.
+        """
+        matches = []
+        check_header = header_pulse is not None and header_pause is not None
+        for i in self.candidates(pulse_min, pulse_max, header_pulse if check_header else None):
+            name, pulse1_w, pulse0_w, pause1_w, pause0_w, header = self.windows[i]
+            if not ((pulse_min <= pulse1_w[1] and pulse_max >= pulse1_w[0]) or
+                    (pulse_min <= pulse0_w[1] and pulse_max >= pulse0_w[0])):
+                continue
+            if not ((pause_min <= pause1_w[1] and pause_max >= pause1_w[0]) or
+                    (pause_min <= pause0_w[1] and pause_max >= pause0_w[0])):
+                continue
+            if check_header and header is not None:
+                hp_min, hp_max, hpa_min, hpa_max = header
+                if not (hp_min <= header_pulse <= hp_max and hpa_min <= header_pause <= hpa_max):
+                    continue
+            matches.append(name)
+        return matches
@@ -9,21 +9,22 @@ Thanks to Mitch Altman for the TV-B-Gone idea.
 import sys
 import os
 import gc
-from time import sleep_ms
+from time import sleep_ms, ticks_ms, ticks_diff
 from esp32 import RMT, wake_on_ext1, WAKEUP_ANY_HIGH, WAKEUP_ALL_LOW
 from machine import Pin, deepsleep, reset_cause
 from micropython import const
 
 from config import *
 from leds import shine, sleep_leds
-from codes import CODES
 from capture import capture_all_codes
+from codebank import CodeBank
+from scheduler import load_hits, record_hit, schedule
+from transmit import SCALE_FACTOR, carrier_groups, new_buffer, send_frame
 
 
 # Configurable constants
-SCALE_FACTOR = const(3)  # Scale factor for pulse durations
-CARRIER_FREQ = const(38_000)  # Carrier frequency in Hz
-DUTY_CYCLE = const(25)  # Duty cycle as a percentage. 10 to 50% is typical.
+CARRIER_FREQ = const(38_000)  # Carrier frequency in Hz, for codes without their own
+DUTY_CYCLE = const(25)  # Duty cycle as a percentage, for codes without their own. 10 to 50% is typical.
 
 IDLE_LEVEL = int(not ACTIVE_LEVEL)  # Inverted active level
 
@@ -31,21 +32,64 @@ IDLE_LEVEL = int(not ACTIVE_LEVEL)  # Inverted active level
 output_pin = Pin(OUTPUT_PIN, Pin.OUT, value=IDLE_LEVEL, drive=Pin.DRIVE_3, hold=False)
 button_pin = Pin(BUTTON_PIN, Pin.IN, BUTTON_PULL, hold=False)
 
-# 1MHz/SCALE_FACTOR channel resolution (80MHz clock)
-rmt = RMT(0, pin=output_pin, clock_div=80 * SCALE_FACTOR, idle_level=IDLE_LEVEL,
-          tx_carrier=(CARRIER_FREQ, DUTY_CYCLE, ACTIVE_LEVEL))
 
+def make_rmt(carrier: tuple):
+    """Set up the RMT channel for a (frequency in Hz, duty cycle in percent) carrier"""
+    # 1MHz/SCALE_FACTOR channel resolution (80MHz clock)
+    return RMT(0, pin=output_pin, clock_div=80 * SCALE_FACTOR, idle_level=IDLE_LEVEL,
+               tx_carrier=(carrier[0], carrier[1], ACTIVE_LEVEL))
 
-def load_captured_codes():
-    """Load every captured code from CAPTURE_DIRECTORY and add to CODES"""
+
+rmt_carrier = (CARRIER_FREQ, DUTY_CYCLE)
+rmt = make_rmt(rmt_carrier)
+
+
+def set_carrier(carrier: tuple, wait_ms: int):
+    """Reconfigure the RMT channel for a (frequency, duty cycle) carrier, if it isn't already.
+    Args:
+        carrier (tuple): (frequency in Hz, duty cycle in percent)
+        wait_ms (int): how long to wait for a code that is still being sent
+    """
+    global rmt, rmt_carrier
+    if carrier == rmt_carrier:
+        return
+    rmt.wait_done(timeout=wait_ms)  # Don't cut off the code being sent
+    rmt.deinit()
+    rmt = make_rmt(carrier)
+    rmt_carrier = carrier
+
+
+def load_codes():
+    """Load the code bank from CODE_BANK_FILE.
+    If there is no code bank, fall back to compiling CODES from codes.py.
+    Returns:
+        CodeBank: the codes.
+    """
+    try:
+        bank = CodeBank.load(CODE_BANK_FILE)
+        print(f"Loaded {len(bank)} codes from {CODE_BANK_FILE}")
+        return bank
+    except (OSError, ValueError) as e:
+        print(f"Can't load {CODE_BANK_FILE} ({e}), using codes.py")
+    from codes import CODES
+    bank = CodeBank()
+    bank.extend(CODES)
+    del CODES, sys.modules["codes"]  # Free the tuples once they are in the bank
+    return bank
+
+
+def load_captured_codes(bank):
+    """Load every captured code from CAPTURE_DIRECTORY that isn't already in the bank and add it"""
     try:
         filenames = os.listdir(CAPTURE_DIRECTORY)
         for filename in filenames:
+            if filename[:-3] in bank.names:
+                continue  # Already converted into the code bank
             print(f"Loading {filename}")
             with open(f"{CAPTURE_DIRECTORY}/{filename}", "r") as f:
                 code_text = f.read()
             code = eval(code_text)
-            CODES.append(code)
+            bank.add(code)
     except OSError:
         return False
     except Exception as e:
@@ -54,61 +98,88 @@ def load_captured_codes():
     return True
 
 
-def send_code(code: tuple):
-    """Send a single sequence of pulses to the RMT peripheral.
-    Args:
-        code (tuple): A tuple containing the pulse durations in microseconds.
-                      The first element can be a string representing the name of the code.
-    Returns:
-        int: The total duration of the code in microseconds.
-    """
-    name = "unknown"
-    if isinstance(code[0], str):
-        name = code[0]
-        code = code[1:]
-    print(f"Sending {name} code")
-    shine(BLUE, 50)
-    # scale each pulse by SCALE_FACTOR
-    scaled = [round(p / SCALE_FACTOR) for p in code]
-    if len(scaled) % 2 == 1:
-        scaled.append(RMT.PULSE_MAX)
-    rmt.write_pulses(scaled, True)
-    gc.collect()
-    return sum(scaled) * SCALE_FACTOR
+def button_pressed():
+    """Return True while the button is held down"""
+    return button_pin.value() == BUTTON_ACTIVE_LEVEL
 
 
-def send_all_codes(codes: tuple):
-    """Send a sequence of codes to the RMT peripheral.
+def send_all_codes(bank, order: list):
+    """Send codes to the RMT peripheral.
+    Codes are sent grouped by carrier, so that the RMT is reconfigured as few times as possible.
+    Holding the button down for LONG_PRESS_MS stops the sweep: the code that was
+    being sent when the button went down is taken to be the one that worked.
     Args:
-        codes (tuple): A tuple containing tuples of pulse durations in microseconds.
-                       Each tuple can optionally start with a string representing the name of the code.
+        bank (CodeBank): the codes.
+        order (list): indices of the codes to send, most likely first (see schedule()).
+    Returns:
+        int: the index of the code that worked, or None.
     """
-    print(f"Sending {len(codes)} codes...")
+    print("Sending", len(order), "codes...")
+    buffer = new_buffer(bank)
     duration = 0
-    for code in codes:
-        duration += send_code(code)
+    frame_duration = 0
+    sent = 0
+    previous = None  # The last code that has been sent completely
+    armed = not button_pressed()  # Ignore the press that woke us up until it is released
+    press_start = None
+    worked = None
+    stop = False
+    for carrier, indices in carrier_groups(bank, CARRIER_FREQ, DUTY_CYCLE, order):
+        set_carrier(carrier, frame_duration // 1000 + 1)
+        for i in indices:
+            print("Sending", bank.names[i], "code at", carrier[0], "Hz")
+            for frame in range(bank.frame_count(i)):
+                # Starts as soon as the previous frame has finished, and returns without waiting
+                frame_duration = send_frame(rmt, bank, i, frame, buffer)
+                duration += frame_duration
+                if frame == 0:
+                    shine(BLUE if sent % 2 == 0 else BLACK)  # Blink once per code, without pausing
+                    sent += 1
+                # A press seen now began while the previous frame was being sent
+                if not button_pressed():
+                    armed = True
+                    press_start = None
+                elif armed and press_start is None:
+                    press_start = ticks_ms()
+                    worked = i if frame > 0 else previous
+                elif armed and ticks_diff(ticks_ms(), press_start) >= LONG_PRESS_MS:
+                    stop = True
+                    break
+            if stop:
+                break
+            previous = i
+        if stop:
+            break
+    # Let the last frame finish before anything (like deep sleep) stops the RMT
+    rmt.wait_done(timeout=frame_duration // 1000 + 1)
+    shine(BLACK)
     print(f"Total duration: {duration / 1_000_000} s")
+    return worked if stop else None
 
 
-def check_codes():
-    """Check all the pulse durations in CODES to ensure
-    that none are > RMT.PULSE_MAX when scaled by SCALE_FACTOR.
+def check_codes(bank):
+    """Check all the pulse durations in the bank to ensure
+    that none are > RMT.PULSE_MAX ticks.
     Returns:
         bool: True if all codes are valid, False otherwise.
     """
     max_pulse = 0
     max_period = RMT.PULSE_MAX * SCALE_FACTOR
     retval = True
-    for i, code in enumerate(CODES):
-        name = f"{i}"
-        if isinstance(code[0], str):
-            name = code[0]
-            code = code[1:]
-        for pulse in code:
-            max_pulse = max(pulse, max_pulse)
-            if pulse > max_period:
-                print(f"code {name}: Pulse {pulse} exceeds {max_period}")
-                retval = False
+    buffer = new_buffer(bank)
+    for i, name in enumerate(bank.names):
+        frames = bank.frame_count(i)
+        for frame in range(frames):
+            pulses = bank.fill_frame(i, frame, buffer)
+            # The last pulse of the last frame is the gap (or padding) after the code
+            last = len(pulses) - 1 if frame == frames - 1 else len(pulses)
+            for j, pulse in enumerate(pulses):
+                pulse *= SCALE_FACTOR
+                if j < last:
+                    max_pulse = max(pulse, max_pulse)
+                if pulse > max_period:
+                    print(f"code {name}: Pulse {pulse} exceeds {max_period}")
+                    retval = False
     print(f"Max pulse: {max_pulse}, max delay = {max_period}")
     return retval
 
@@ -140,11 +211,18 @@ def wake():
 # Run from boot.py
 try:
     wake()
-    load_captured_codes()
+    bank = load_codes()
+    load_captured_codes(bank)
+    gc.collect()
 
-    if check_codes():
+    if check_codes(bank):
         print(f"Codes are valid. Ready to output to pin {OUTPUT_PIN}.")
-        send_all_codes(CODES)
+        hits = load_hits(HITS_FILE, bank)
+        worked = send_all_codes(bank, schedule(bank, hits, SWEEP_BUDGET_MS))
+        if worked is not None:
+            print(f"Code {bank.names[worked]} worked")
+            record_hit(HITS_FILE, bank, hits, worked)
+            shine(GREEN, 500)
 
     if INPUT_PIN is not None:
         print("Hit Ctrl-C to capture codes")
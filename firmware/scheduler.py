@@ -0,0 +1,93 @@
+"""
+Decide which codes to send, and in what order.
+
+Codes that have worked before go first (most hits first), then codes by
+their prior likelihood (the bank's priorities, from brand market share),
+then the rest in bank order. A time budget can cut the sweep short once the
+most likely codes have been sent.
+
+Hit counters are kept in a small file in flash, keyed by code name so that
+they survive rebuilding the code bank:
+    per code with hits: a length byte, the UTF-8 name, then the count (uint16, little-endian)
+"""
+import os
+import struct
+from array import array
+
+HIT_FORMAT = "<H"
+HIT_SIZE = struct.calcsize(HIT_FORMAT)
+MAX_HITS = 0xFFFF
+# A truncated or garbled hits file raises one of these (MicroPython's struct has no error, it raises ValueError)
+HIT_FILE_ERRORS = (ValueError, UnicodeError, getattr(struct, "error", ValueError))
+
+
+def load_hits(filename: str, bank):
+    """Read the hit counters for the codes in the bank.
+    Returns:
+        array: a hit count per code in the bank (all 0 if there is no hits
+               file, or it can't be read: the counters are only a hint).
+    """
+    hits = array("H", (0 for _ in range(len(bank))))
+    try:
+        with open(filename, "rb") as f:
+            data = f.read()
+    except OSError:
+        return hits
+    pos = 0
+    try:
+        while pos < len(data):
+            length = data[pos]
+            name = data[pos + 1:pos + 1 + length].decode()
+            pos += 1 + length
+            count = struct.unpack(HIT_FORMAT, data[pos:pos + HIT_SIZE])[0]
+            pos += HIT_SIZE
+            if name in bank.names:
+                hits[bank.names.index(name)] = count
+    except HIT_FILE_ERRORS:
+        print(f"Ignoring corrupt hits file {filename}")
+        return array("H", (0 for _ in range(len(bank))))
+    return hits
+
+
+def save_hits(filename: str, bank, hits):
+    """Write the hit counters of the codes that have any.
+    The file is replaced in one step, so a reset while writing can't corrupt it.
+    """
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "wb") as f:
+        for i, count in enumerate(hits):
+            if count:
+                name = bank.names[i].encode()
+                f.write(bytes([len(name)]))
+                f.write(name)
+                f.write(struct.pack(HIT_FORMAT, count))
+    os.rename(tmp_filename, filename)
+
+
+def record_hit(filename: str, bank, hits, index: int):
+    """Count one more success for a code, and save the counters"""
+    hits[index] = min(hits[index] + 1, MAX_HITS)
+    save_hits(filename, bank, hits)
+
+
+def schedule(bank, hits, budget_ms=None):
+    """Order the codes by likelihood of working.
+    Args:
+        bank (CodeBank): the codes.
+        hits (array): hit count per code, from load_hits().
+        budget_ms (int): stop adding codes once they would take longer than this
+                         to send (None: send every code). The first code is always sent.
+    Returns:
+        list: indices of the codes to send, most likely first.
+    """
+    priorities = bank.priorities
+    order = sorted(range(len(bank)), key=lambda i: (-hits[i], -priorities[i], i))
+    if budget_ms is None:
+        return order
+    budget_us = budget_ms * 1000
+    total_us = 0
+    for n, i in enumerate(order):
+        total_us += bank.duration(i)
+        if total_us > budget_us and n > 0:
+            return order[:n]
+    return order
@@ -0,0 +1,79 @@
+"""
+Send IR codes from a CodeBank to the RMT peripheral.
+
+The bank already holds each code as RMT ticks. Codes made of repeated frames
+are sent one frame at a time, each frame followed by its gap, so the repeats
+are only stored once. RMT.write_pulses() only accepts a list or tuple, so
+each frame is copied into one reusable list (see new_buffer()) just before it
+is sent. Sending a code then allocates nothing, and the list only has to hold
+the longest frame rather than the longest code.
+
+RMT.write_pulses() waits for the previous pulses to finish, copies the new
+ones into the driver's own buffer, starts them and returns. So while one frame
+is on the air, the caller is free to prepare the next one in the same list:
+the list and the driver's buffer form a double buffer, and frames and codes
+follow each other with no gap beyond their own trailing pause.
+"""
+from codebank import SCALE_FACTOR
+
+
+def new_buffer(bank):
+    """Return a list big enough to hold any frame of any code in bank"""
+    return [0] * bank.max_frame_length()
+
+
+def carrier_groups(bank, default_carrier: int, default_duty: int, indices=None):
+    """Group codes by carrier, so that the RMT only has to be set up once per
+    carrier in a sweep.
+    Groups are in order of their first code, and keep their codes in the given order.
+    Args:
+        bank (CodeBank): the codes.
+        default_carrier (int): carrier frequency (Hz) for codes that don't have one.
+        default_duty (int): duty cycle (percent) for codes that don't have one.
+        indices: the codes to send, in order (default: every code in bank order).
+    Returns:
+        list: ((carrier, duty), [index, ...]) for each carrier.
+    """
+    keys = []
+    groups = {}
+    for i in (range(len(bank)) if indices is None else indices):
+        key = (bank.carriers[i] or default_carrier, bank.duties[i] or default_duty)
+        if key not in groups:
+            keys.append(key)
+            groups[key] = []
+        groups[key].append(i)
+    return [(key, groups[key]) for key in keys]
+
+
+def send_frame(rmt, bank, index: int, frame: int, buffer: list):
+    """Send one frame of a code to the RMT peripheral.
+    Args:
+        rmt: the RMT channel to send on.
+        bank (CodeBank): the codes.
+        index (int): which code in bank to send.
+        frame (int): which frame of the code to send (0 to bank.frame_count(index) - 1).
+        buffer (list): a list from new_buffer(), reused for every frame.
+    Returns:
+        int: The duration of the frame and its gap in microseconds. The frame is
+             still being sent when this returns.
+    """
+    pulses = bank.fill_frame(index, frame, buffer)
+    rmt.write_pulses(pulses, True)  # Starts when the previous frame has finished
+    return sum(pulses) * SCALE_FACTOR
+
+
+def send_code(rmt, bank, index: int, buffer: list):
+    """Send a single code to the RMT peripheral.
+    Args:
+        rmt: the RMT channel to send on.
+        bank (CodeBank): the codes.
+        index (int): which code in bank to send.
+        buffer (list): a list from new_buffer(), reused for every code.
+    Returns:
+        int: The total duration of the code in microseconds. The last frame is
+             still being sent when this returns; use rmt.wait_done() to wait for it.
+    """
+    duration = 0
+    for frame in range(bank.frame_count(index)):
+        duration += send_frame(rmt, bank, index, frame, buffer)
+    return duration
@@ -0,0 +1,264 @@
+"""
+Table-driven IR frame decoder.
+
+Decodes the repetitions of a packet into (protocol, address, command, repeat)
+frames using the fields of an IR_PROTOCOLS entry (see firmware/ir_protocols.py):
+    (protocol_name, carrier_frequency, pulse_1, pause_1, pulse_0, pause_0,
+     header_pulse, header_pause, address_bits, command_bits, stop_bit, lsb_first, flags)
+
+Pulse-distance and pulse-width protocols (NEC, SAMSUNG, SIRCS, DENON, ...) are
+decoded one mark/space pair at a time. Protocols with an "RC5" or "RC6" flag
+are biphase (Manchester) coded and are decoded from their half-bit levels.
+Each repetition is decoded in a single pass over its durations.
+"""
+from collections import namedtuple
+
+# One decoded repetition.
+#   protocol: protocol name
+#   address, command: decoded values (None if the frame had no bits for them)
+#   repeat: True if this frame repeats the previous one (a short repeat code,
+#           or the same data and toggle bit as the previous frame)
+#   bits: number of data bits decoded
+#   toggle: the toggle bit for RC5/RC6, otherwise None
+Frame = namedtuple("Frame", ("protocol", "address", "command", "repeat", "bits", "toggle"))
+
+RC6_MODE_BITS = 3
+
+
+def _within(value, reference, tolerance):
+    """True if value is within +/- tolerance (a fraction) of reference"""
+    return reference * (1 - tolerance) <= value <= reference * (1 + tolerance)
+
+
+def bits_to_int(bits, lsb_first=False):
+    """Convert a list of bits to an integer, in the given bit order"""
+    value = 0
+    if lsb_first:
+        for i, bit in enumerate(bits):
+            value |= bit << i
+    else:
+        for bit in bits:
+            value = (value << 1) | bit
+    return value
+
+
+def _split_fields(protocol, bits, toggle=None, repeat=False):
+    """Build a Frame, splitting the data bits into address and command fields"""
+    name, _, _, _, _, _, _, _, address_bits, command_bits, _, lsb_first, _ = protocol
+    address = bits[:address_bits]
+    command = bits[address_bits:address_bits + command_bits]
+    return Frame(name,
+                 bits_to_int(address, lsb_first) if address else None,
+                 bits_to_int(command, lsb_first) if command else None,
+                 repeat, len(bits), toggle)
+
+
+def _decode_pulse_distance(durations, protocol, tolerance):
+    """Decode a repetition of a pulse-distance or pulse-width protocol.
+
+    Returns:
+        A Frame, or None if the durations don't fit the protocol.
+    """
+    _, _, pulse1, pause1, pulse0, pause0, hp, hpa, _, _, stop_bit, _, _ = protocol
+    n = len(durations)
+    i = 0
+    if hp > 0 and hpa > 0:
+        if n < 2 or not _within(durations[0], hp, tolerance):
+            return None
+        if _within(durations[1], hpa, tolerance):
+            i = 2
+        elif n <= 3 and _within(durations[1], hpa / 2, tolerance):
+            # Short repeat code (header pulse, half-length pause, stop pulse), as sent by NEC
+            return _split_fields(protocol, [], repeat=True)
+        else:
+            return None
+
+    # Bits are told apart by whichever of pulse or pause differs between 0 and 1
+    by_pause = pause1 != pause0
+    by_pulse = pulse1 != pulse0
+    pulse_range = (min(pulse1, pulse0) * (1 - tolerance), max(pulse1, pulse0) * (1 + tolerance))
+    pause_range = (min(pause1, pause0) * (1 - tolerance), max(pause1, pause0) * (1 + tolerance))
+
+    bits = []
+    while i < n:
+        pulse = durations[i]
+        pause = durations[i + 1] if i + 1 < n else None
+        if not pulse_range[0] <= pulse <= pulse_range[1]:
+            return None
+        if pause is None and (stop_bit or not by_pulse):
+            break  # Trailing stop pulse
+        if pause is not None and pause > pause_range[1] and bits:
+            break  # A long pause ends the frame; what follows is another frame
+        if pause is not None and not pause_range[0] <= pause <= pause_range[1]:
+            return None
+        # Pick whichever symbol is closer, relative to its size
+        error1 = error0 = 0.0
+        if by_pulse:
+            error1 += abs(pulse - pulse1) / pulse1
+            error0 += abs(pulse - pulse0) / pulse0
+        if by_pause and pause is not None:
+            error1 += abs(pause - pause1) / pause1
+            error0 += abs(pause - pause0) / pause0
+        bits.append(1 if error1 < error0 else 0)
+        i += 2
+
+    if not bits:
+        if i == 2:
+            # Header and stop pulse only: a repeat code
+            return _split_fields(protocol, [], repeat=True)
+        return None
+    return _split_fields(protocol, bits)
+
+
+def _half_bit_levels(durations, unit, tolerance, level=1):
+    """Expand durations into a list of half-bit levels.
+
+    Each duration must be one or two units long (three for the RC6 trailer bit
+    boundaries), within tolerance. Levels alternate, starting with `level`.
+
+    Returns:
+        The list of levels, or None if a duration doesn't fit.
+    """
+    levels = []
+    for duration in durations:
+        units = round(duration / unit)
+        if units < 1 or units > 3 or not _within(duration, units * unit, tolerance):
+            return None
+        levels.extend([level] * units)
+        level ^= 1
+    return levels
+
+
+def _decode_rc5(durations, protocol, tolerance):
+    """Decode an RC5 repetition: 2 start bits, a toggle bit, then address and command.
+
+    RC5 sends a 1 as off-then-on. The first start bit is always 1, so the capture
+    begins halfway through it.
+    """
+    unit = protocol[2]
+    levels = _half_bit_levels(durations, unit, tolerance)
+    if levels is None:
+        return None
+    levels = [0] + levels
+    if len(levels) % 2:
+        levels.append(0)  # The second half of a final 0 bit is idle
+    bits = []
+    for k in range(0, len(levels), 2):
+        first, second = levels[k], levels[k + 1]
+        if first == second:
+            return None
+        bits.append(second)
+    if len(bits) < 3:
+        return None
+    return _split_fields(protocol, bits[3:], toggle=bits[2])
+
+
+def _decode_rc6(durations, protocol, tolerance):
+    """Decode an RC6 repetition: header, start bit, mode bits, double-length toggle bit, then data.
+
+    RC6 sends a 1 as on-then-off.
+    """
+    _, _, unit, _, _, _, hp, hpa, _, _, _, _, _ = protocol
+    if len(durations) < 3 or not _within(durations[0], hp, tolerance) or not _within(durations[1], hpa, tolerance):
+        return None
+    levels = _half_bit_levels(durations[2:], unit, tolerance)
+    if levels is None:
+        return None
+    levels.append(0)  # The second half of a final 1 bit is idle
+
+    def cell(position, width):
+        """Decode one Manchester bit made of two halves of `width` units"""
+        if position + 2 * width > len(levels):
+            return None
+        first, second = levels[position], levels[position + width]
+        if first == second:
+            return None
+        return first
+
+    position = 0
+    start = cell(position, 1)
+    if start != 1:
+        return None
+    position += 2 * (1 + RC6_MODE_BITS)  # The mode bits aren't reported
+    toggle = cell(position, 2)
+    if toggle is None:
+        return None
+    position += 4
+    bits = []
+    while True:
+        bit = cell(position, 1)
+        if bit is None:
+            break
+        bits.append(bit)
+        position += 2
+    return _split_fields(protocol, bits, toggle=toggle)
+
+
+def decode_repetition(durations, protocol, variation_pct=25):
+    """Decode one repetition.
+
+    Args:
+        durations: mark/space durations in microseconds, starting with a mark
+        protocol: an IR_PROTOCOLS entry
+        variation_pct: allowable timing variation percentage
+    Returns:
+        A Frame, or None if the durations can't be decoded as this protocol.
+    """
+    if len(durations) % 2 == 0:
+        durations = durations[:-1]  # Drop a trailing pause (e.g. idle time to the end of the capture)
+    flags = protocol[12]
+    tolerance = variation_pct / 100.0
+    if flags == "RC5":
+        return _decode_rc5(durations, protocol, tolerance)
+    if flags is not None and flags.startswith("RC6"):
+        return _decode_rc6(durations, protocol, tolerance)
+    if flags is not None:
+        return None  # Other special encodings (e.g. RCMM) aren't supported
+    return _decode_pulse_distance(durations, protocol, tolerance)
+
+
+def decode_packet(durations, repetition_starts, protocol, variation_pct=25):
+    """Decode every repetition of a packet.
+
+    Args:
+        durations: edge durations of the whole packet in microseconds
+        repetition_starts: edge indices at which each repetition begins
+        protocol: an IR_PROTOCOLS entry
+        variation_pct: allowable timing variation percentage
+    Returns:
+        A list with a Frame (or None if it couldn't be decoded) per repetition.
+        Short repeat codes take their address and command from the previous frame.
+    """
+    frames = []
+    previous = None
+    for j, start in enumerate(repetition_starts):
+        # The duration just before the next repetition is the gap between them
+        end = repetition_starts[j + 1] - 1 if j + 1 < len(repetition_starts) else len(durations)
+        frame = decode_repetition(durations[start:end], protocol, variation_pct)
+        if frame is not None and previous is not None:
+            if frame.repeat:
+                frame = frame._replace(address=previous.address, command=previous.command,
+                                       bits=previous.bits, toggle=previous.toggle)
+            elif frame[1:3] == previous[1:3] and frame.toggle == previous.toggle:
+                frame = frame._replace(repeat=True)
+        frames.append(frame)
+        if frame is not None:
+            previous = frame
+    return frames
+
+
+def format_frame(frame):
+    """Format a decoded Frame for display"""
+    if frame is None:
+        return "undecoded"
+    parts = []
+    if frame.address is not None:
+        parts.append(f"address=0x{frame.address:x}")
+    if frame.command is not None:
+        parts.append(f"command=0x{frame.command:x}")
+    if frame.toggle is not None:
+        parts.append(f"toggle={frame.toggle}")
+    parts.append(f"{frame.bits} bits")
+    if frame.repeat:
+        parts.append("repeat")
+    return " ".join(parts)
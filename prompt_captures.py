@@ -1,25 +1,58 @@
 import re
 import os
-import sys
+import signal
 
 LINE_RE = re.compile(r"^(-?)\s*(\d+)(\*?)\s+(.*)")
 CAPTURES = os.getcwd() + "/captures/"
-captured_files = os.listdir(CAPTURES)
-
-for line in open("processed_codes.txt", "r"):
-    m = LINE_RE.match(line)
-    # print(m.groups())
-    if m.groups()[0] == "-":
-        print("Skip")
-        continue
-    number = m.groups()[1]
-    filename = number + ".csv"
-    if filename in captured_files:
-        print(f"File {filename} exists")
-        continue
-    print(f"Setup for capturing {number}")
-    try:
-        os.system(f"python3 2>/dev/null capture_saleae.py {number}")
-        os.system(f"python3 analyze_signal.py captures/{number}.csv")
-    except KeyboardInterrupt:
-        sys.exit(1)
\ No newline at end of file
+CODES_FILE = "processed_codes.txt"
+
+
+def pending_codes(codes_file=CODES_FILE, captures=CAPTURES):
+    """Return the (number, description) of each code in codes_file that still needs capturing.
+
+    Lines starting with "-" are skipped, and so are codes already captured
+    (captures/N.bin or captures/N.csv).
+    """
+    captured_files = os.listdir(captures) if os.path.isdir(captures) else []
+    pending = []
+    for line in open(codes_file, "r"):
+        m = LINE_RE.match(line)
+        if m is None:
+            continue
+        # print(m.groups())
+        if m.groups()[0] == "-":
+            print("Skip")
+            continue
+        number = m.groups()[1]
+        if number + ".bin" in captured_files or number + ".csv" in captured_files:
+            print(f"File {number} exists")
+            continue
+        pending.append((number, m.groups()[3].strip()))
+    return pending
+
+
+def main():
+    new_captures = []
+    for number, _ in pending_codes():
+        print(f"Setup for capturing {number}")
+        try:
+            status = os.system(f"python3 2>/dev/null capture_saleae.py {number}")
+        except KeyboardInterrupt:
+            break
+        if os.waitstatus_to_exitcode(status) in (-signal.SIGINT, 128 + signal.SIGINT):
+            print("Capture cancelled")
+            break
+        # Only analyze captures that were actually saved
+        filename = f"captures/{number}.bin"
+        if status != 0 or not os.path.exists(filename):
+            print(f"Capture of {number} failed; it is left out of the analysis")
+            continue
+        new_captures.append(filename)
+
+    # Analyze all the new captures in one batch run
+    if new_captures:
+        os.system(f"python3 analyze_signal.py {' '.join(new_captures)}")
+
+
+if __name__ == "__main__":
+    main()
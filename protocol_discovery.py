@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Propose IR_PROTOCOLS entries for packets that match no known protocol.
+
+The marks and spaces after the header of each packet's first repetition are
+clustered into symbol lengths with a one-dimensional k-means (the smallest
+number of clusters, up to MAX_SYMBOLS, that keeps every duration within
+CLUSTER_VARIATION_PCT of its cluster's centre). A pulse-distance or pulse-width
+code has one kind of mark and two kinds of space, or two kinds of mark and
+one kind of space, so its bit timings and bit count can be read off the
+clusters:
+  - two space lengths (NEC style): a bit is a mark and the space after it,
+    and the trailing mark is a stop pulse
+  - two mark lengths (SIRCS style): a bit is a mark, and the code has no
+    stop pulse
+Codes that cluster any other way (e.g. biphase codes, whose marks and spaces
+are one or two units long) are reported with their clusters but not
+proposed.
+
+Proposals of packets whose timings agree within CLUSTER_VARIATION_PCT, with
+the same header and bit count, are merged into one entry (with the median
+timings), and each entry is checked by decoding its packets with
+ir_decoder.py at the analyzer's timing variation. The
+address/command split, bit order and carrier can't be seen in a demodulated
+capture; the proposal splits the bits in half, LSB first, at 38kHz.
+
+Usage: python3 protocol_discovery.py captures/ [--all] [--variation 25]
+Also run by `analyze_signal.py --propose` on the packets it can't identify.
+"""
+import argparse
+import sys
+from bisect import bisect_left
+from time import perf_counter
+
+from analyze_signal import analyze_files, expand_csv_paths, first_repetition_durations
+from ir_decoder import decode_repetition
+import analyze_signal
+
+MAX_SYMBOLS = 4  # Most symbol lengths tried for the marks or the spaces of a code
+KMEANS_ITERATIONS = 20
+CLUSTER_VARIATION_PCT = 25  # Durations this close to a cluster's centre are the same symbol
+DEFAULT_CARRIER = 38000  # Carrier frequency of proposed protocols; a demodulated capture doesn't show it
+
+
+def kmeans_1d(values, k, iterations=KMEANS_ITERATIONS):
+    """Cluster numbers into k groups with Lloyd's algorithm.
+
+    In one dimension each cluster is a run of the sorted values, so every
+    iteration only needs a bisect per boundary and prefix sums.
+
+    Args:
+        values: the numbers, sorted
+        k: number of clusters (at most len(values))
+    Returns:
+        list of (centre, start, end) per cluster, ascending; start/end index into values
+    """
+    n = len(values)
+    prefix = [0.0]
+    for value in values:
+        prefix.append(prefix[-1] + value)
+    # Start from evenly spaced quantiles
+    centres = [values[min(n - 1, (2 * j + 1) * n // (2 * k))] for j in range(k)]
+    for _ in range(iterations):
+        starts = [0] + [bisect_left(values, (centres[j] + centres[j + 1]) / 2) for j in range(k - 1)] + [n]
+        updated = [(prefix[starts[j + 1]] - prefix[starts[j]]) / (starts[j + 1] - starts[j])
+                   if starts[j + 1] > starts[j] else centres[j] for j in range(k)]
+        if updated == centres:
+            break
+        centres = updated
+    starts = [0] + [bisect_left(values, (centres[j] + centres[j + 1]) / 2) for j in range(k - 1)] + [n]
+    return [(centres[j], starts[j], starts[j + 1]) for j in range(k) if starts[j + 1] > starts[j]]
+
+
+def cluster_durations(durations, variation_pct=CLUSTER_VARIATION_PCT):
+    """Group durations into symbol lengths.
+
+    Returns:
+        list of (centre, count) ascending, from the fewest clusters that keep every
+        duration within variation_pct of its centre, or None if MAX_SYMBOLS aren't enough.
+    """
+    values = sorted(durations)
+    if not values:
+        return []
+    tolerance = variation_pct / 100
+    for k in range(1, min(MAX_SYMBOLS, len(values)) + 1):
+        clusters = kmeans_1d(values, k)
+        if all(values[start] >= centre * (1 - tolerance) and values[end - 1] <= centre * (1 + tolerance)
+               for centre, start, end in clusters):
+            return [(centre, end - start) for centre, start, end in clusters]
+    return None
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+
+def _nearest(value, clusters):
+    """Return the index of the cluster centre nearest to value"""
+    return min(range(len(clusters)), key=lambda j: abs(value - clusters[j][0]))
+
+
+def _fits(value, clusters, tolerance):
+    """True if value is within tolerance of one of the cluster centres"""
+    return any(abs(value - centre) <= centre * tolerance for centre, _ in clusters)
+
+
+def _is_biphase(marks, spaces, tolerance):
+    """True if the marks and spaces are all one or two (or three) of the same unit long, as in RC5 and RC6"""
+    unit = marks[0][0]
+    return all(abs(centre - round(centre / unit) * unit) <= unit * tolerance and 1 <= round(centre / unit) <= 3
+               for centre, _ in marks + spaces)
+
+
+def describe_code(durations, variation_pct=CLUSTER_VARIATION_PCT):
+    """Cluster the marks and spaces of one repetition and work out its encoding.
+
+    The first mark and space are a header if either doesn't fit the symbol
+    lengths of the rest of the repetition.
+
+    Args:
+        durations: mark/space durations (µs) of the repetition, starting with a mark
+        variation_pct: largest difference of a duration from its symbol length, in percent
+    Returns:
+        dict with 'encoding' ('pulse_distance', 'pulse_width', 'biphase' or 'unsupported'),
+        'marks' and 'spaces' (cluster lists, None if there were too many), and for
+        pulse_distance and pulse_width 'timings' (pulse1, pause1, pulse0, pause0,
+        header_pulse, header_pause) and 'bits'.
+    """
+    tolerance = variation_pct / 100
+    marks = cluster_durations(durations[2::2], variation_pct)
+    spaces = cluster_durations(durations[3::2], variation_pct)
+    has_header = bool(marks and spaces) and not (_fits(durations[0], marks, tolerance) and
+                                                 _fits(durations[1], spaces, tolerance))
+    data = durations[2:] if has_header else durations
+    if not has_header:
+        marks = cluster_durations(data[0::2], variation_pct)
+        spaces = cluster_durations(data[1::2], variation_pct)
+    description = {'encoding': 'unsupported', 'marks': marks, 'spaces': spaces}
+    if not marks or not spaces:
+        return description
+    header = (round(durations[0]), round(durations[1])) if has_header else (0, 0)
+    if len(marks) == 2 and len(spaces) >= 2 and _is_biphase(marks, spaces, tolerance):
+        description['encoding'] = 'biphase'
+    elif len(marks) == 1 and len(spaces) == 2:
+        # The space carries the bit; the mark before each kind of space is its pulse
+        pulses = ([], [])
+        for k in range(1, len(data), 2):
+            pulses[_nearest(data[k], spaces)].append(data[k - 1])
+        if not pulses[0] or not pulses[1]:
+            return description
+        description.update(encoding='pulse_distance', bits=len(data) // 2, timings=(
+            round(_median(pulses[1])), round(spaces[1][0]), round(_median(pulses[0])), round(spaces[0][0])) + header)
+    elif len(marks) == 2 and len(spaces) == 1:
+        description.update(encoding='pulse_width', bits=(len(data) + 1) // 2, timings=(
+            round(marks[1][0]), round(spaces[0][0]), round(marks[0][0]), round(spaces[0][0])) + header)
+    return description
+
+
+def _agrees(timings, other, tolerance):
+    return all(abs(a - b) <= b * tolerance for a, b in zip(timings, other))
+
+
+def propose_protocols(packets, variation_pct=None):
+    """Propose IR_PROTOCOLS entries for analyzed packets (result dicts from analyze_signal()).
+
+    Args:
+        packets: the packets to propose entries for
+        variation_pct: timing variation allowed when checking that an entry decodes its packets
+                       (default: analyze_signal.TIMING_VARIATION_PCT)
+    Returns:
+        (proposals, unsupported): proposals is a list of dicts with 'entry' (an
+        IR_PROTOCOLS tuple), 'encoding', 'packets' (the packets it was made from)
+        and 'decoded' (how many of them it decodes), most packets first;
+        unsupported lists (packet, description) for codes that couldn't be proposed.
+    """
+    if variation_pct is None:
+        variation_pct = analyze_signal.TIMING_VARIATION_PCT
+    tolerance = CLUSTER_VARIATION_PCT / 100
+    groups = []  # [encoding, bits, has_header, first timings, [timings], [packets]]
+    unsupported = []
+    for packet in packets:
+        durations = first_repetition_durations(packet)
+        if len(durations) % 2 == 0:
+            durations = durations[:-1]  # Drop the idle time to the end of the capture
+        description = describe_code(durations)
+        if 'timings' not in description:
+            unsupported.append((packet, description))
+            continue
+        key = (description['encoding'], description['bits'], description['timings'][4] > 0)
+        for group in groups:
+            if group[:3] == list(key) and _agrees(description['timings'], group[3], tolerance):
+                group[4].append(description['timings'])
+                group[5].append((packet, durations))
+                break
+        else:
+            groups.append(list(key) + [description['timings'], [description['timings']], [(packet, durations)]])
+
+    proposals = []
+    for number, (encoding, bits, _, _, timings, members) in enumerate(
+            sorted(groups, key=lambda group: -len(group[5])), 1):
+        median = tuple(round(_median(column)) for column in zip(*timings))
+        pulse1, pause1, pulse0, pause0, hp, hpa = median
+        entry = (f"NEW{number}", DEFAULT_CARRIER, pulse1, pause1, pulse0, pause0, hp, hpa,
+                 bits // 2, bits - bits // 2, encoding == 'pulse_distance', True, None)
+        decoded = 0
+        for _, durations in members:
+            frame = decode_repetition(durations, entry, variation_pct)
+            if frame is not None and frame.bits == bits:
+                decoded += 1
+        proposals.append({'entry': entry, 'encoding': encoding, 'packets': [packet for packet, _ in members],
+                          'decoded': decoded})
+    return proposals, unsupported
+
+
+def print_proposals(proposals, unsupported):
+    """Print proposed IR_PROTOCOLS entries, ready to paste into firmware/ir_protocols.py"""
+    for proposal in proposals:
+        packets = proposal['packets']
+        sources = sorted({packet['csv_file'] for packet in packets})
+        print(f"    {proposal['entry']},  # {proposal['encoding']}, {len(packets)} packets "
+              f"({proposal['decoded']} decode), e.g. {', '.join(sources[:3])}")
+    for packet, description in unsupported:
+        clusters = {side: ', '.join(f"{centre:.0f}µs" for centre, _ in description[side])
+                    if description[side] else 'too many lengths' for side in ('marks', 'spaces')}
+        print(f"    # {packet['csv_file']} packet {packet['packet']}: no proposal ({description['encoding']}), "
+              f"marks {clusters['marks']}, spaces {clusters['spaces']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Propose IR_PROTOCOLS entries for codes of unknown protocols')
+    parser.add_argument('csv_files', nargs='+', metavar='csv_file',
+                        help='Saleae CSV exports, directories or glob patterns')
+    parser.add_argument('--all', '-a', action='store_true',
+                        help='Propose entries for every packet, not just those of unknown protocols')
+    parser.add_argument('--variation', '-v', type=int, default=analyze_signal.TIMING_VARIATION_PCT,
+                        help='Allowable timing variation percentage (default: %(default)s%%)')
+    args = parser.parse_args()
+    analyze_signal.TIMING_VARIATION_PCT = args.variation
+
+    packets = [packet for _, results in analyze_files(expand_csv_paths(args.csv_files)) for packet in results or ()]
+    if not args.all:
+        packets = [packet for packet in packets if not packet['possible_protocols']]
+    start = perf_counter()
+    proposals, unsupported = propose_protocols(packets, args.variation)
+    elapsed = perf_counter() - start
+    print_proposals(proposals, unsupported)
+    print(f"Clustered {len(packets)} packets into {len(proposals)} proposed protocols in {elapsed * 1000:.1f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Read and write Logic 2 binary exports of a digital channel.
+
+capture_saleae.py exports captures with Capture.export_raw_data_binary(),
+which writes one `digital_<channel>.bin` file per channel in this layout
+(little-endian, see https://support.saleae.com/faq/technical-faq/binary-export-format-logic-2):
+    identifier: 8 bytes, b"<SALEAE>"
+    version: int32, 0
+    type: int32, 0 for digital
+    initial_state: uint32, the level at begin_time
+    begin_time, end_time: float64 seconds
+    num_transitions: uint64
+    transition_times: num_transitions float64 seconds; the level toggles at each
+
+The edges are read as analyze_signal.read_edges() reads a CSV export: a row
+at begin_time with the initial state, a row per transition, and a row at
+end_time with the final state (where the CSV export ends), with rows before
+the trigger (negative times) dropped. Row numbers count the header as
+row 0, as in a CSV export of the same capture. The NumPy reader maps the
+file and views the transition times in place, so nothing is parsed.
+
+Run as a script, it writes a synthetic multi-minute capture (the packets of
+some CSV exports, replayed with gaps and jitter) as both a binary and a CSV
+export, checks that both analyze the same, and times their ingest.
+
+Usage: python3 saleae_binary.py good [--minutes 5] [-o synthetic]
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+from time import perf_counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BINARY_SUFFIX = ".bin"
+IDENTIFIER = b"<SALEAE>"
+FORMAT_VERSION = 0
+DIGITAL_TYPE = 0
+HEADER_FORMAT = "<8siiIddQ"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+
+def is_binary_export(path):
+    """True if path is named like a binary export rather than a CSV export"""
+    return path.endswith(BINARY_SUFFIX)
+
+
+def _read_header(mm, path):
+    """Return (initial_state, begin_time, end_time, num_transitions) from a mapped export"""
+    if len(mm) < HEADER_SIZE:
+        raise ValueError(f"{path}: too short for a Logic 2 binary export")
+    identifier, version, data_type, initial_state, begin_time, end_time, count = \
+        struct.unpack_from(HEADER_FORMAT, mm)
+    if identifier != IDENTIFIER or version != FORMAT_VERSION or data_type != DIGITAL_TYPE:
+        raise ValueError(f"{path}: not a version {FORMAT_VERSION} Logic 2 binary export of a digital channel")
+    if len(mm) < HEADER_SIZE + 8 * count:
+        raise ValueError(f"{path}: truncated ({count} transitions expected)")
+    return initial_state, begin_time, end_time, count
+
+
+def _map(path):
+    """Map a file read-only; an empty file can't be mapped, so it is returned as bytes"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_binary_header(path):
+    """Return (initial_state, begin_time, end_time, num_transitions) of a binary export"""
+    mm = _map(path)
+    try:
+        return _read_header(mm, path)
+    finally:
+        if isinstance(mm, mmap.mmap):
+            mm.close()
+
+
+def read_binary_edges(path):
+    """Yield (row_index, time, state) for each edge in a binary export, like analyze_signal.read_edges()"""
+    mm = _map(path)
+    try:
+        state, begin_time, end_time, count = _read_header(mm, path)
+        if begin_time >= 0:
+            yield 1, begin_time, state
+        last = begin_time
+        records = memoryview(mm)[HEADER_SIZE:HEADER_SIZE + 8 * count]
+        unpacker = struct.iter_unpack("<d", records)
+        try:
+            for row_index, (time,) in enumerate(unpacker, 2):
+                state ^= 1
+                last = time
+                if time >= 0:
+                    yield row_index, time, state
+        finally:
+            del unpacker  # Drop the buffer export so the map can be closed
+            records.release()
+        if end_time > last and end_time >= 0:
+            yield count + 2, end_time, state
+    finally:
+        if isinstance(mm, mmap.mmap):
+            mm.close()
+
+
+def load_binary_edges_numpy(path):
+    """Load a binary export into NumPy arrays without parsing it.
+
+    Returns:
+        (rows, times, states) arrays, like analyze_signal.load_edges_numpy() returns for a CSV export.
+    """
+    mm = _map(path)
+    try:
+        initial_state, begin_time, end_time, count = _read_header(mm, path)
+        # Copied out of the map, so that it can be closed (a view would keep it and the file open)
+        transitions = np.frombuffer(mm, dtype='<f8', count=count, offset=HEADER_SIZE).copy()
+    finally:
+        if isinstance(mm, mmap.mmap):
+            mm.close()
+    first = np.searchsorted(transitions, 0.0)  # Transition times are in order; skip those before the trigger
+    times = transitions[first:]
+    rows = np.arange(first + 2, count + 2)
+    states = ((rows & 1) ^ (initial_state ^ 1)).astype(np.int8)  # Row 2 is the first transition
+    if begin_time >= 0:
+        times = np.concatenate(([begin_time], times))
+        rows = np.concatenate(([1], rows))
+        states = np.concatenate(([initial_state], states)).astype(np.int8)
+    if end_time > (transitions[-1] if count else begin_time) and end_time >= 0:
+        times = np.append(times, end_time)
+        rows = np.append(rows, count + 2)
+        states = np.append(states, np.int8(initial_state ^ (count & 1)))
+    return rows, times, states
+
+
+def write_binary_export(path, transitions, initial_state=1, begin_time=None, end_time=None):
+    """Write transition times (seconds, ascending) as a Logic 2 binary export of a digital channel"""
+    transitions = list(transitions)
+    if begin_time is None:
+        begin_time = transitions[0] if transitions else 0.0
+    if end_time is None:
+        end_time = transitions[-1] if transitions else begin_time
+    with open(path, "wb") as f:
+        f.write(struct.pack(HEADER_FORMAT, IDENTIFIER, FORMAT_VERSION, DIGITAL_TYPE,
+                            initial_state, begin_time, end_time, len(transitions)))
+        if np is not None:
+            np.asarray(transitions, dtype='<f8').tofile(f)
+        else:
+            f.write(struct.pack(f"<{len(transitions)}d", *transitions))
+
+
+def write_csv_export(path, transitions, initial_state=1, begin_time=None, end_time=None):
+    """Write transition times as a Saleae CSV export of channel 2, as Logic 2 writes it"""
+    if begin_time is None:
+        begin_time = transitions[0] if transitions else 0.0
+    state = initial_state
+    with open(path, "w") as f:
+        f.write("Time [s],Channel 2\n")
+        f.write(f"{begin_time:.9f},{state}\n")
+        for time in transitions:
+            state ^= 1
+            f.write(f"{time:.9f},{state}\n")
+        if end_time is not None and end_time > (transitions[-1] if transitions else begin_time):
+            f.write(f"{end_time:.9f},{state}\n")
+
+
+def synthesize(codes, seconds, seed=0, jitter_us=5, gap_s=(0.3, 2.0)):
+    """Make the transitions of a long capture of an IR receiver (idle high) from a few codes.
+
+    Args:
+        codes: mark/space durations (µs) of each code, starting with a mark
+        seconds: length of the capture
+        seed: random seed for the order, gaps and jitter
+        jitter_us: standard deviation of the jitter added to each duration
+        gap_s: range of the idle time between codes
+    Returns:
+        list of transition times in seconds, starting with the first falling edge at 0
+    """
+    rng = random.Random(seed)
+    transitions = []
+    time = 0.0
+    while time < seconds:
+        code = rng.choice(codes)
+        transitions.append(time)
+        for duration in code:
+            time += max(1.0, duration + rng.gauss(0, jitter_us)) / 1_000_000
+            transitions.append(time)
+        time += rng.uniform(*gap_s)
+    if len(transitions) % 2:
+        transitions.pop()  # End idle (high)
+    return [round(t, 9) for t in transitions]  # As precise as a CSV export
+
+
+def main():
+    import analyze_signal
+
+    parser = argparse.ArgumentParser(description='Write a synthetic long capture as binary and CSV exports, '
+                                                 'and time their ingest')
+    parser.add_argument('csv_files', nargs='+', metavar='csv_file',
+                        help='CSV exports, directories or glob patterns whose packets are replayed')
+    parser.add_argument('--minutes', '-m', type=float, default=5, help='Length of the capture (default: 5)')
+    parser.add_argument('--output', '-o', default='synthetic',
+                        help='Name of the exports, without .bin or .csv (default: synthetic)')
+    args = parser.parse_args()
+
+    codes = [[int(duration) for duration in packet['durations_us'][:-1]]
+             for csv_file in analyze_signal.expand_csv_paths(args.csv_files)
+             if not is_binary_export(csv_file)
+             for packet in analyze_signal.analyze_signal(csv_file, use_cache=False)]
+    transitions = synthesize(codes, args.minutes * 60)
+    binary_file = args.output + BINARY_SUFFIX
+    csv_file = args.output + ".csv"
+    begin_time = -0.5  # Logic 2 starts the capture before the trigger
+    end_time = transitions[-1] + 0.5
+    write_binary_export(binary_file, transitions, begin_time=begin_time, end_time=end_time)
+    write_csv_export(csv_file, transitions, begin_time=begin_time, end_time=end_time)
+    print(f"Wrote {len(transitions)} transitions ({args.minutes} minutes) to {binary_file} "
+          f"({os.path.getsize(binary_file)} bytes) and {csv_file} ({os.path.getsize(csv_file)} bytes)")
+
+    loaders = [("CSV, python", lambda: list(analyze_signal.read_edges(csv_file))),
+               ("binary, python", lambda: list(read_binary_edges(binary_file)))]
+    if np is not None:
+        loaders += [("CSV, numpy", lambda: analyze_signal.load_edges_numpy(csv_file)),
+                    ("binary, numpy", lambda: load_binary_edges_numpy(binary_file))]
+    for name, load in loaders:
+        start = perf_counter()
+        load()
+        print(f"  {name:15s}: {(perf_counter() - start) * 1000:8.1f}ms to load the edges")
+
+    results = {path: analyze_signal.analyze_signal(path, use_cache=False) for path in (csv_file, binary_file)}
+    same = [{k: v for k, v in packet.items() if k != 'csv_file'} for packet in results[csv_file]] == \
+           [{k: v for k, v in packet.items() if k != 'csv_file'} for packet in results[binary_file]]
+    print(f"  {len(results[binary_file])} packets, results identical: {same}")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark finding similar codes (firmware/code_compare.py) on a large code set.
+
+Makes --codes synthetic codes from firmware/codes.py, as a big remote
+database would have them: each is one of the captured codes with a few of its
+spaces swapped for others (different data bits, so the same header and
+leading values) and every value jittered by --jitter percent. Times
+find_similar_codes() with the pure-Python engine (signature grouping) and the
+NumPy engine (similarity matrix), checks that they find the same pairs, and
+checks the matrix against is_similar() on a sample of pairs.
+
+Usage: python3 sim/benchmark_code_compare.py [--codes 1000] [--jitter 3] [--repeat 3]
+"""
+import argparse
+import os
+import random
+import sys
+from time import perf_counter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "firmware"))
+from code_compare import find_similar_codes, is_similar, np, similarity_matrix  # noqa: E402
+from codes import CODES  # noqa: E402
+
+TOLERANCE_PERCENT = 10
+MAX_GAP_US = 20000
+SWAPPED_SPACES = (0, 3)  # Range of the number of spaces swapped in each synthetic code
+SAMPLE_PAIRS = 20000  # Pairs checked against is_similar()
+
+
+def synthetic_codes(count, jitter_percent, seed=0):
+    """Make count codes from the captured ones, named after the code they came from"""
+    rng = random.Random(seed)
+    codes = []
+    for number in range(count):
+        base = rng.choice(CODES)
+        values = list(base[1:])
+        spaces = range(3, len(values), 2)  # After the header
+        for _ in range(rng.randint(*SWAPPED_SPACES)):
+            values[rng.choice(spaces)] = values[rng.choice(spaces)]
+        codes.append((f"{base[0]}-{number}",) +
+                     tuple(max(1, round(v * (1 + rng.gauss(0, jitter_percent / 100)))) for v in values))
+    return codes
+
+
+def timed(function, repeat):
+    """Return (result, seconds per call) of the fastest of repeat calls"""
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        result = function()
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark finding similar codes on a large synthetic code set')
+    parser.add_argument('--codes', '-n', type=int, default=1000, help='Number of codes (default: 1000)')
+    parser.add_argument('--jitter', '-j', type=float, default=3,
+                        help='Standard deviation of the jitter of each value, in percent (default: 3)')
+    parser.add_argument('--repeat', '-r', type=int, default=3, help='Runs of each engine (default: 3)')
+    args = parser.parse_args()
+    if np is None:
+        print("NumPy is not installed; only the python engine is available")
+        return 1
+
+    codes = synthetic_codes(args.codes, args.jitter)
+    print(f"{len(codes)} codes of up to {max(len(code) - 1 for code in codes)} values, "
+          f"{len(codes) * (len(codes) - 1) // 2} pairs")
+    results = {}
+    timings = {}
+    for backend in ('python', 'numpy'):
+        results[backend], timings[backend] = timed(
+            lambda: find_similar_codes(codes, TOLERANCE_PERCENT, MAX_GAP_US, backend), args.repeat)
+        print(f"  {backend:6s}: {timings[backend] * 1000:8.1f}ms, {len(results[backend])} similar pairs")
+    print(f"  speedup: {timings['python'] / timings['numpy']:.2f}x")
+    same = results['python'] == results['numpy']
+    print(f"  pairs identical: {same}")
+
+    matrix = similarity_matrix(codes, TOLERANCE_PERCENT, MAX_GAP_US)
+    rng = random.Random(1)
+    pairs = [(rng.randrange(len(codes)), rng.randrange(len(codes))) for _ in range(SAMPLE_PAIRS)]
+    agree = all(matrix[i, j] == is_similar(codes[i], codes[j], TOLERANCE_PERCENT, MAX_GAP_US) for i, j in pairs)
+    print(f"  matrix agrees with is_similar() on {len(pairs)} sampled pairs: {agree}")
+    return 0 if same and agree else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark a full sweep of the firmware on the host simulator.
+
+Boots firmware/main.py (see harness.py) and reports, on the virtual clock,
+how long the sweep through all the codes takes and how much of it is dead
+time between codes, plus the host CPU time spent setting up each code.
+Virtual times depend only on the firmware's logic and the codes, so they are
+reproducible and can be compared between versions. Host CPU times are only
+a relative guide: the ESP32 is much slower.
+
+Usage: python3 sim/benchmark_sweep.py [--bank firmware/codes.bin] [--captured captured] [--budget-ms MS]
+                                      [--repeat 5] [-v]
+"""
+import argparse
+import os
+import sys
+
+from harness import run_firmware
+
+
+def sweep_stats(run):
+    """Summarize the codes sent on the IR transmitter's RMT channel(s) during a run.
+    Returns:
+        dict: virtual times in microseconds and host times in seconds.
+    """
+    writes = sorted((w for channel in run.channels for w in channel.writes), key=lambda w: w.start_us)
+    dead = [b.start_us - a.end_us for a, b in zip(writes, writes[1:])]
+    setup = [b.host_s - a.host_s for a, b in zip(writes, writes[1:])]
+    return {
+        'codes': sum(1 for line in run.output.splitlines() if line.startswith("Sending ") and line.endswith(" Hz")),
+        'writes': len(writes),
+        'max_write': max((len(w.pulses) for w in writes), default=0),
+        'first_code_us': writes[0].start_us if writes else None,
+        'sweep_us': writes[-1].end_us - writes[0].start_us if writes else 0,
+        'ir_us': sum(w.end_us - w.start_us for w in writes),
+        'dead_us': sum(dead),
+        'max_dead_us': max(dead, default=0),
+        'mean_dead_us': sum(dead) / len(dead) if dead else 0,
+        'carriers': [channel.tx_carrier[:2] for channel in run.channels],
+        'cut_us': max(0, writes[-1].end_us - run.end_us) if writes else 0,
+        'sleep_us': run.end_us,
+        'mean_setup_s': sum(setup) / len(setup) if setup else 0,
+        'max_setup_s': max(setup, default=0),
+        'boot_host_s': run.host_s,
+    }
+
+
+def print_stats(stats, repeat):
+    print(f"Codes sent: {stats['codes']}")
+    if not stats['codes']:
+        return
+    print(f"RMT writes: {stats['writes']} (frames), longest {stats['max_write']} pulses")
+    print(f"Boot to first code: {stats['first_code_us'] / 1000:.1f} ms")
+    print(f"Sweep duration: {stats['sweep_us'] / 1_000_000:.3f} s (first code start to last code end)")
+    print(f"IR frame time: {stats['ir_us'] / 1_000_000:.3f} s")
+    print(f"Dead time between writes: {stats['dead_us'] / 1_000_000:.3f} s total, "
+          f"{stats['mean_dead_us'] / 1000:.1f} ms mean, {stats['max_dead_us'] / 1000:.1f} ms max")
+    print(f"RMT set-ups: {len(stats['carriers'])} "
+          f"({', '.join(f'{carrier} Hz/{duty}%' for carrier, duty in stats['carriers'])})")
+    print(f"Boot to deep sleep: {stats['sleep_us'] / 1_000_000:.3f} s")
+    if stats['cut_us']:
+        print(f"Warning: deep sleep cut off the last {stats['cut_us'] / 1000:.1f} ms of the last code")
+    print(f"Per-write setup (host CPU, best of {repeat}): {stats['mean_setup_s'] * 1e6:.0f} us mean, "
+          f"{stats['max_setup_s'] * 1e6:.0f} us max")
+    print(f"Boot to deep sleep (host CPU, best of {repeat}): {stats['boot_host_s'] * 1000:.1f} ms")
+
+
+def benchmark(config, repeat=5, verbose=False):
+    """Boot the firmware repeat times; return the stats with the best host times"""
+    best = None
+    for i in range(repeat):
+        stats = sweep_stats(run_firmware(config, quiet=not (verbose and i == 0)))
+        if best is None:
+            best = stats
+        else:
+            for key in ('mean_setup_s', 'max_setup_s', 'boot_host_s'):
+                best[key] = min(best[key], stats[key])
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark a firmware sweep on the host simulator')
+    parser.add_argument('--bank', default=os.path.join('firmware', 'codes.bin'),
+                        help='Code bank to load (default firmware/codes.bin; codes.py is used if it is missing)')
+    parser.add_argument('--captured', default='captured',
+                        help='Directory of captured codes (.py files) to send as well (default captured)')
+    parser.add_argument('--budget-ms', type=int, default=None,
+                        help='Sweep time budget (SWEEP_BUDGET_MS; default: send every code)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of runs; host times are the best of them (default 5)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Show what the firmware prints')
+    args = parser.parse_args()
+
+    config = {'CODE_BANK_FILE': args.bank, 'CAPTURE_DIRECTORY': args.captured, 'SWEEP_BUDGET_MS': args.budget_ms}
+    print_stats(benchmark(config, args.repeat, args.verbose), args.repeat)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
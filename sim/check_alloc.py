@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Check on the host that sending codes from the code bank allocates no memory.
+
+Loads firmware/codes.py into a CodeBank as build_code_bank.py does (so codes
+of known protocols are synthesized) and sends every frame of every code with
+firmware/transmit.py, twice: once to warm up and once measured. While each
+measured frame is sent, tracemalloc records the peak memory in use, so
+temporary objects are caught even though they are freed before the frame is
+sent. The RMT is a stub that only checks the pulses it is given: the fake in
+sim/esp32.py records every write, which allocates.
+
+CPython boxes ints that MicroPython stores in the object pointer, so on the
+host every duration computed or copied into the buffer is allocated, and the
+ones it replaces are freed. Sending a frame into a buffer that already holds
+the same frame therefore peaks at a few ints above where it started; anything
+more is reported.
+
+Usage: python3 sim/check_alloc.py
+"""
+import os
+import sys
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, "..", "firmware"), os.path.join(HERE, "..")]
+
+import codebank  # noqa: E402
+import transmit  # noqa: E402
+from build_code_bank import add_codes  # noqa: E402
+from codes import CODES  # noqa: E402
+
+BOXED_INTS = 8  # Ints CPython may hold at once while making a frame (MicroPython allocates none)
+
+
+class StubRMT:
+    """Accepts pulses as esp32.RMT does, without keeping or copying them"""
+
+    def write_pulses(self, duration, data=True):
+        if not isinstance(duration, (list, tuple)):
+            raise TypeError("duration must be a list or tuple")
+
+
+def main():
+    rmt = StubRMT()
+    bank = codebank.CodeBank()
+    add_codes(bank, CODES)
+    buffer = transmit.new_buffer(bank)
+    allowance = BOXED_INTS * sys.getsizeof(1 << 20)
+
+    tracemalloc.start()
+    worst = (0, None, None)
+    frames = 0
+    duration = 0
+    for i in range(len(bank)):
+        for frame in range(bank.frame_count(i)):
+            transmit.send_frame(rmt, bank, i, frame, buffer)  # Fills the buffer and anything made lazily
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            duration += transmit.send_frame(rmt, bank, i, frame, buffer)
+            peak = tracemalloc.get_traced_memory()[1] - before
+            worst = max(worst, (peak, i, frame))
+            frames += 1
+    tracemalloc.stop()
+
+    peak, i, frame = worst
+    print(f"Sent {frames} frames of {len(bank)} codes ({duration / 1_000_000} s of IR)")
+    print(f"Most memory allocated while sending a frame: {peak} bytes "
+          f"(code {bank.names[i]} frame {frame}; allowed {allowance} for {BOXED_INTS} boxed ints)")
+    return 0 if peak <= allowance else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Check the firmware's IR capture backends on the host simulator.
+
+Synthesizes the edge streams of a few codes with firmware/ir_encoder.py,
+including short RECS80 pulses and an air conditioner style code longer than
+the old 300 edge limit, and replays each one into the input pin (see
+harness.EdgeStream) for both CAPTURE_BACKEND settings of capture.py:
+  - "irq": the pin interrupt handler is called at every edge plus a random
+    dispatch latency (a rough model of MicroPython's soft IRQs on an ESP32)
+  - "i2s": the fake machine.I2S samples the pin on the virtual clock
+Then compares what was captured with what was sent, and checks the
+capture quality report (firmware/capture_quality.py), to check that:
+  - every backend captures every edge of every code
+  - the "i2s" backend's durations are within two samples of the truth
+  - codes of known protocols are matched to their protocol on the device
+  - codes are reported clean, except a code with pulses too short for the
+    "irq" backend, which that backend flags
+
+Usage: python3 sim/check_capture.py
+"""
+import contextlib
+import io
+import random
+import sys
+
+from harness import EdgeStream, configure
+
+configure()
+from ir_encoder import encode  # noqa: E402
+
+INPUT_PIN = 5
+START_US = 50_000.4  # Virtual time at which each code starts, between two I2S samples
+I2S_TOLERANCE_US = 2  # Two samples at the default CAPTURE_SAMPLE_RATE
+
+# Rough dispatch model for a soft IRQ handler on an ESP32 running MicroPython
+IRQ_LATENCY_US = (30, 100)  # Range of the delay from an edge to the handler reading ticks_us()
+IRQ_SERVICE_US = 25  # Time the handler takes, so the earliest the next one can run
+IRQ_QUEUE_DEPTH = 8  # Edges that can wait for their handler before more are lost
+
+# IR_PROTOCOLS entries (see firmware/ir_protocols.py), and a 144-bit air conditioner protocol
+NEC = ("NEC", 38000, 560, 1690, 560, 560, 9000, 4500, 16, 16, True, True, None)
+RC5 = ("RC5", 36000, 889, 889, 889, 889, 889, 889, 5, 6, False, False, "RC5")
+SIRCS = ("SIRCS", 40000, 1200, 600, 600, 600, 2400, 600, 12, 12, False, False, None)
+RECS80 = ("RECS80", 38000, 158, 7432, 158, 4902, 0, 0, 4, 6, False, False, None)
+AC = ("AC", 38000, 450, 1300, 450, 420, 3400, 1750, 72, 72, True, True, None)
+
+CODES = {
+    "NEC": encode(NEC, 0x40BF, 0xF20D, repeats=2, repeat_code=True),
+    "RC5": encode(RC5, 0x05, 0x0C, bits=11, toggle=1, repeats=2, gap=90_000),
+    "SIRCS": encode(SIRCS, 0xA90, 0, bits=12, repeats=2, gap=25_000),
+    "RECS80": encode(RECS80, 0x5, 0x2A, repeats=1, gap=50_000),
+    "AC": encode(AC, 0x1234_5678_9ABC_DEF0_12, 0x3456_789A_BCDE_F012_34, repeats=1, gap=10_000),
+    "FAST": [60, 80] * 20 + [60],  # Shorter than the "irq" backend can time
+}
+TOO_FAST_FOR_IRQ = {"FAST"}
+PROTOCOLS = {"NEC", "RC5", "SIRCS", "RECS80"}  # Codes that should match their protocol in IR_PROTOCOLS
+
+
+def capture(durations, backend, seed=0):
+    """Replay a code into the input pin and capture it with a backend.
+    Returns:
+        (captured durations or None if the capture failed, quality report or None)
+    """
+    config = configure({
+        'INPUT_PIN': INPUT_PIN,
+        'CAPTURE_BACKEND': backend,
+        'CAPTURE_SCK_PIN': 6,
+        'CAPTURE_WS_PIN': 7,
+    })
+    import machine
+
+    rng = random.Random(seed)
+    machine.inputs[INPUT_PIN] = EdgeStream(
+        durations, START_US, config.INPUT_ACTIVE_LEVEL,
+        latency_us=lambda edge: rng.uniform(*IRQ_LATENCY_US),
+        service_us=IRQ_SERVICE_US, queue_depth=IRQ_QUEUE_DEPTH)
+    import capture
+    with contextlib.redirect_stdout(io.StringIO()):
+        captured = capture.capture_code()
+    return captured, captured and capture.capture_quality(captured)
+
+
+def check(condition, message):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    return condition
+
+
+def main():
+    from capture_quality import problems
+
+    ok = True
+    for backend in ("irq", "i2s"):
+        for name, durations in CODES.items():
+            captured, quality = capture(durations, backend)
+            if backend == "irq" and name in TOO_FAST_FOR_IRQ:
+                reasons = quality and problems(quality)
+                ok &= check(captured is None or bool(reasons), f"{backend}: {name}: flagged: {reasons}")
+                continue
+            if captured is None or len(captured) != len(durations):
+                ok &= check(False, f"{backend}: {name}: captured {captured and len(captured)} "
+                                   f"of {len(durations)} durations")
+                continue
+            errors = [abs(c - d) for c, d in zip(captured, durations)]
+            summary = (f"{backend}: {name}: {len(durations)} durations, "
+                       f"error {sum(errors) / len(errors):.1f} us mean, {max(errors):.0f} us max")
+            if backend == "i2s":
+                ok &= check(max(errors) <= I2S_TOLERANCE_US, summary)
+            else:
+                ok &= check(True, summary)
+            summary = (f"{backend}: {name}: jitter {quality['jitter_us']:.1f} us, "
+                       f"protocols {quality['protocols']}, problems {problems(quality)}")
+            known = name in PROTOCOLS
+            ok &= check(not problems(quality) and (not known or name in quality['protocols']), summary)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
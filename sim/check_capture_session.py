@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Check continuous capture (capture_session.py) against the fake Logic 2 API
+in sim/saleae/.
+
+Plays the button presses of a simulated user to a CaptureSession on the
+virtual clock. The user is asked for the codes of good/*.csv in order, one
+chunk at a time, and presses the button asked for in one of these ways:
+  - whole: well inside the chunk
+  - anywhere: at a random time, so it may be cut off by either edge of the
+    chunk, or missed between chunks
+  - cut then next: just before the chunk starts, so it is cut off, followed
+    by a whole press of the next button in the same chunk (too soon)
+  - between: entirely between two chunks, so nothing is recorded
+  - impatient: a whole press, followed by the next button in the same chunk
+After each chunk the user presses the same button again unless it was saved,
+as capture_session.py asks. Checks that:
+  - one connection is made for the whole session
+  - every code is saved, in order, under its own number, and nothing else
+  - each saved .bin analyzes to the same frames and durations as the code it came from
+  - the session counts the cut off and ignored packets the user made, and
+    every way of pressing happened
+and reports how many codes were captured per (virtual) minute.
+
+Usage: python3 sim/check_capture_session.py
+"""
+import contextlib
+import glob
+import io
+import os
+import random
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)  # The fake saleae package comes first
+from saleae import automation  # noqa: E402
+from analyze_signal import PACKET_GAP_S, analyze_signal  # noqa: E402
+from capture_session import CHUNK_SECONDS, CaptureSession  # noqa: E402
+
+PRESS_GAP_S = 0.15  # Shortest time between the end of a press and the next one (more than PACKET_GAP_S)
+SCENARIOS = (("whole", 5), ("anywhere", 2), ("cut then next", 1), ("between", 1), ("impatient", 1))
+DURATION_TOLERANCE_US = 1
+
+
+def check(condition, message):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    return condition
+
+
+def chunk_window(k, chunk_seconds):
+    """Return the (start, end) virtual time (s) of the k-th chunk of a session"""
+    start = automation.START_SECONDS + k * (chunk_seconds + automation.START_SECONDS)
+    return start, start + chunk_seconds
+
+
+class User:
+    """Presses buttons on the virtual clock, recording the signal and what the session should make of it"""
+
+    def __init__(self, codes, rng, chunk_seconds):
+        self.codes = codes
+        self.rng = rng
+        self.chunk_seconds = chunk_seconds
+        self.presses = []  # (start, end, code index, transitions) in time order
+        self.chunks = 0
+        self.cut = 0
+        self.ignored = 0
+        self.scenarios = {name: 0 for name, _ in SCENARIOS}
+
+    def press(self, i, start):
+        """Press code i at start, or as soon after it as the last press allows; return (start, end)"""
+        if self.presses:
+            start = max(start, self.presses[-1][1] + PRESS_GAP_S)
+        time = start
+        transitions = [round(time, 9)]
+        for duration in self.codes[i]:
+            time += duration / 1_000_000
+            transitions.append(round(time, 9))
+        self.presses.append((start, time, i, transitions))
+        return start, time
+
+    def length(self, i):
+        return sum(self.codes[i]) / 1_000_000
+
+    def record_chunk(self, i):
+        """Press code i (and maybe the next one) for the next chunk.
+
+        Returns:
+            True if the session saves a packet of code i from this chunk
+        """
+        cs, ce = chunk_window(self.chunks, self.chunk_seconds)
+        self.chunks += 1
+        scenario = self.rng.choices([name for name, _ in SCENARIOS], [weight for _, weight in SCENARIOS])[0]
+        length = self.length(i)
+        has_next = i + 1 < len(self.codes)
+        if scenario == "whole":
+            start, end = self.press(i, cs + self.rng.uniform(PACKET_GAP_S + 0.05,
+                                                             self.chunk_seconds - length - PACKET_GAP_S - 0.05))
+        elif scenario == "cut then next":
+            start, end = self.press(i, cs - length / 2)
+        elif scenario == "between":
+            start, end = self.press(i, cs - automation.START_SECONDS + 0.01)
+        else:
+            start, end = self.press(i, cs + self.rng.uniform(-automation.START_SECONDS, self.chunk_seconds))
+        # A second button is only pressed while the first press is in this chunk:
+        # a press the session never saw is indistinguishable from the next button's
+        if scenario in ("cut then next", "impatient") and has_next and end >= cs and start < ce:
+            next_start = end + self.rng.uniform(0.3, 0.6)
+            if next_start + self.length(i + 1) < ce - PACKET_GAP_S - 0.05:
+                self.press(i + 1, next_start)
+
+        # What the session sees: the presses with edges in the chunk, the first of which counts
+        seen = [press for press in self.presses if press[1] >= cs and press[0] < ce]
+        if not seen:
+            if scenario == "between" and end < cs:
+                self.scenarios[scenario] += 1
+            return False
+        self.ignored += len(seen) - 1
+        first_start, first_end, first_code, _ = seen[0]
+        if first_start - cs <= PACKET_GAP_S or ce - first_end <= PACKET_GAP_S:
+            self.cut += 1
+            if scenario == "cut then next" and first_code == i and first_start < cs and len(seen) > 1:
+                self.scenarios[scenario] += 1
+            elif scenario == "anywhere":
+                self.scenarios[scenario] += 1
+            return False
+        if scenario in ("whole", "anywhere") or (scenario == "impatient" and len(seen) > 1):
+            self.scenarios[scenario] += 1
+        return first_code == i
+
+    def transitions(self):
+        return [t for _, _, _, transitions in self.presses for t in transitions]
+
+
+def main():
+    rng = random.Random(0)
+    sources = []
+    for csv_file in sorted(glob.glob(os.path.join(HERE, "..", "good", "*.csv"))):
+        for packet in analyze_signal(csv_file, use_cache=False):
+            sources.append(packet)
+    codes = [[int(d) for d in packet['durations_us'][:-1]] for packet in sources]
+    user = User(codes, rng, CHUNK_SECONDS)
+    i = 0
+    while i < len(codes):
+        if user.record_chunk(i):
+            i += 1
+    automation.play(user.transitions())
+    labels = [(f"{number:04d}", f"{os.path.basename(packet['csv_file'])} packet {packet['packet']}")
+              for number, packet in enumerate(sources, 1)]
+
+    ok = True
+    with tempfile.TemporaryDirectory() as output_dir:
+        with automation.Manager.connect() as manager:
+            session = CaptureSession(manager, output_dir=output_dir, chunk_seconds=CHUNK_SECONDS)
+            with contextlib.redirect_stdout(io.StringIO()):
+                saved = session.run(labels, max_chunks=user.chunks + 10)
+        ok &= check(automation.connections == 1, f"{automation.connections} connection for {session.chunks} captures")
+        expected = [os.path.join(output_dir, number + ".bin") for number, _ in labels]
+        ok &= check(saved == expected and sorted(os.listdir(output_dir)) == sorted(map(os.path.basename, expected)),
+                    f"saved {len(saved)} of {len(labels)} codes in order, in {session.chunks} "
+                    f"of the user's {user.chunks} captures")
+        ok &= check((session.cut, session.ignored) == (user.cut, user.ignored),
+                    f"{len(user.presses)} presses for {len(codes)} codes: {session.cut} captures started with "
+                    f"a packet cut off ({user.cut} expected), {session.ignored} packets ignored "
+                    f"({user.ignored} expected)")
+        ok &= check(all(user.scenarios.values()),
+                    "presses: " + ", ".join(f"{count} {name}" for name, count in user.scenarios.items()))
+        for filename, source, code in zip(saved, sources, codes):
+            results = analyze_signal(filename, use_cache=False)
+            name = f"{os.path.basename(filename)} ({source['csv_file']} packet {source['packet']})"
+            if len(results) != 1:
+                ok &= check(False, f"{name}: {len(results)} packets")
+                continue
+            durations = results[0]['durations_us'][:-1]
+            error = max(abs(a - b) for a, b in zip(durations, code)) if len(durations) == len(code) else None
+            ok &= check(results[0]['decoded_frames'] == source['decoded_frames'] and
+                        error is not None and error <= DURATION_TOLERANCE_US,
+                        f"{name}: {len(results[0]['decoded_frames'])} frames, "
+                        f"durations within {error if error is None else round(error, 3)} us")
+    minutes = automation.now / 60
+    print(f"Captured {len(saved)} codes in {minutes:.1f} virtual minutes ({len(saved) / minutes:.1f} per minute)")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Check that combining several captures of a button (firmware/consensus.py)
+gives a cleaner code than any single capture.
+
+For every code in good/*.csv, makes shots of it with random receiver jitter,
+plus a shot with one space changed (as a different bit would), a shot with an
+extra repetition (the button held longer) and a shot that missed its last
+edges, and checks that:
+  - the changed and short shots are rejected, and the others kept
+  - the consensus is closer to the code than every jittered shot
+Then captures a code several times on the host simulator with
+CAPTURE_SHOTS (see harness.py), one press with a changed space, and checks
+that the saved code is the consensus of the good presses.
+
+Usage: python3 sim/check_consensus.py
+"""
+import contextlib
+import glob
+import io
+import os
+import random
+import sys
+import tempfile
+
+from harness import EdgeStream, configure
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+configure()
+from analyze_signal import analyze_signal  # noqa: E402
+from consensus import consensus  # noqa: E402
+
+JITTER_US = 40  # Standard deviation of the receiver jitter added to each shot
+SHOTS = 5  # Jittered shots per code
+REPETITION_GAP_US = 40_000
+INPUT_PIN = 5
+PRESS_INTERVAL_US = 1_000_000  # Time from one simulated press to the next
+
+
+def jittered(durations, rng):
+    return [max(1, round(d + rng.gauss(0, JITTER_US))) for d in durations]
+
+
+def changed(durations, rng):
+    """Return durations with one space in the middle made three times longer"""
+    shot = jittered(durations, rng)
+    k = 2 * (len(shot) // 4) + 1
+    shot[k] *= 3
+    return shot
+
+
+def mean_error(shot, truth):
+    return sum(abs(s - t) for s, t in zip(shot, truth)) / len(truth)
+
+
+def check(condition, message):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    return condition
+
+
+def check_code(name, truth, rng):
+    shots = [jittered(truth, rng) for _ in range(SHOTS)]
+    shots.append(jittered(truth + [REPETITION_GAP_US] + truth, rng))  # Extra repetition
+    good = len(shots)
+    shots.append(changed(truth, rng))
+    shots.append(jittered(truth[:-4], rng))  # Missed edges
+    result = consensus(shots)
+    if result is None:
+        return check(False, f"{name}: no consensus")
+    durations, kept = result
+    worst = [mean_error(shot, truth) for shot in shots[:good]]
+    error = mean_error(durations, truth)
+    return check(kept == list(range(good)) and len(durations) == len(truth) and error < min(worst),
+                 f"{name}: kept {len(kept)} of {len(shots)} shots, error {error:.1f} us, "
+                 f"shots {min(worst):.1f}..{max(worst):.1f} us")
+
+
+def check_firmware(truth, workdir):
+    """Capture truth with CAPTURE_SHOTS presses, the second of them with a changed space"""
+    rng = random.Random(1)
+    presses = [jittered(truth, rng) for _ in range(SHOTS)]
+    presses[1] = changed(truth, rng)
+    durations = []
+    for press in presses:
+        if durations:
+            durations.append(PRESS_INTERVAL_US - sum(durations) % PRESS_INTERVAL_US)
+        durations.extend(press)
+    config = configure({
+        'INPUT_PIN': INPUT_PIN,
+        'CAPTURE_BACKEND': 'i2s',
+        'CAPTURE_SCK_PIN': 6,
+        'CAPTURE_WS_PIN': 7,
+        'CAPTURE_SHOTS': SHOTS,
+    })
+    import machine
+    machine.inputs[INPUT_PIN] = EdgeStream(durations, 50_000, config.INPUT_ACTIVE_LEVEL)
+    import capture
+    filename = os.path.join(workdir, "code.py")
+    with contextlib.redirect_stdout(io.StringIO()):
+        saved = capture.capture_ir_code(filename, "code")
+    if not saved:
+        return check(False, "firmware: capture failed")
+    with open(filename) as f:
+        code = eval(f.read())
+    expected, _ = consensus([p for k, p in enumerate(presses) if k != 1])
+    error = max(abs(c - e) for c, e in zip(code[1:], expected))
+    return check(code[0] == "code" and len(code) - 1 == len(truth) and error <= 2,
+                 f"firmware: saved the consensus of {SHOTS - 1} of {SHOTS} presses, "
+                 f"{error} us from the host's")
+
+
+def main():
+    rng = random.Random(0)
+    ok = True
+    truths = []
+    for csv_file in sorted(glob.glob(os.path.join(HERE, "..", "good", "*.csv"))):
+        for packet in analyze_signal(csv_file):
+            truth = [int(d) for d in packet['durations_us'][:-1]]
+            truths.append(truth)
+            ok &= check_code(f"{os.path.basename(csv_file)} packet {packet['packet']}", truth, rng)
+    with tempfile.TemporaryDirectory() as workdir:
+        ok &= check_firmware(truths[0], workdir)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Check the sweep scheduler on the host simulator.
+
+Builds a code bank from firmware/codes.py with a few codes prioritized, then
+boots the firmware (see harness.py) to check that:
+  - prioritized codes are sent first, the rest in bank order
+  - a long button press during the sweep stops it and counts a hit for the
+    code that was being sent when the button went down
+  - on the next boot, that code is sent first
+  - SWEEP_BUDGET_MS limits the sweep to the most likely codes
+  - a truncated or garbled hits file (e.g. after power loss while it was
+    written) is ignored: every code is still sent, in priority order
+
+Usage: python3 sim/check_schedule.py
+"""
+import os
+import sys
+import tempfile
+
+from harness import install, run_firmware
+
+install()
+from codebank import CodeBank  # noqa: E402
+from codes import CODES  # noqa: E402
+from scheduler import load_hits  # noqa: E402
+
+PRIORITIES = {"4261": 200, "1121": 100}
+PRESS_AT = 4  # Press the button while the code at this position in the sweep is being sent
+BUDGET_MS = 2000
+
+
+def sent_codes(run, bank):
+    """Return the names of the codes sent during a run, in order, and the first write of each"""
+    first_frames = {tuple(bank.fill_frame(i, 0, [])): i for i in range(len(bank))}
+    writes = sorted((w for channel in run.channels for w in channel.writes), key=lambda w: w.start_us)
+    names = []
+    code_writes = []
+    k = 0
+    while k < len(writes):
+        i = first_frames[writes[k].pulses]
+        names.append(bank.names[i])
+        code_writes.append(writes[k])
+        k += bank.frame_count(i)
+    return names, code_writes
+
+
+def check(condition, message):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    return condition
+
+
+def main():
+    with tempfile.TemporaryDirectory() as workdir:
+        return check_schedule(workdir)
+
+
+def check_schedule(workdir):
+    bank = CodeBank()
+    for code in CODES:
+        bank.add(code, priority=PRIORITIES.get(code[0], 0))
+    bank_file = os.path.join(workdir, "codes.bin")
+    bank.save(bank_file)
+    config = {
+        'CODE_BANK_FILE': bank_file,
+        'CAPTURE_DIRECTORY': os.path.join(workdir, "captured"),
+        'HITS_FILE': os.path.join(workdir, "hits.bin"),
+    }
+    ok = True
+
+    names, writes = sent_codes(run_firmware(config), bank)
+    expected = sorted(PRIORITIES, key=PRIORITIES.get, reverse=True)
+    expected += [name for name in bank.names if name not in PRIORITIES]
+    ok &= check(names == expected, f"prioritized codes first: {names[:4]}...")
+
+    # Hold the button for twice LONG_PRESS_MS, starting during the code at PRESS_AT
+    press_ms = writes[PRESS_AT].start_us // 1000 + 10
+    run = run_firmware(config, presses=[(press_ms, press_ms + 2000)])
+    names_pressed, _ = sent_codes(run, bank)
+    worked = names[PRESS_AT]
+    hits = load_hits(config['HITS_FILE'], bank)
+    ok &= check(len(names_pressed) < len(names), f"long press stopped the sweep after {len(names_pressed)} codes")
+    ok &= check(hits[bank.names.index(worked)] == 1 and sum(hits) == 1, f"hit counted for {worked}")
+
+    names_after, _ = sent_codes(run_firmware(config), bank)
+    ok &= check(names_after[0] == worked, f"{worked} sent first on the next boot")
+
+    run = run_firmware(dict(config, SWEEP_BUDGET_MS=BUDGET_MS))
+    names_budget, writes_budget = sent_codes(run, bank)
+    sweep_ms = (run.channels[-1].busy_until_us - writes_budget[0].start_us) / 1000
+    ok &= check(names_budget == names_after[:len(names_budget)] and sweep_ms <= BUDGET_MS,
+                f"budget of {BUDGET_MS} ms: {len(names_budget)} most likely codes in {sweep_ms:.0f} ms")
+
+    with open(config['HITS_FILE'], "rb") as f:
+        data = f.read()
+    for problem, corrupt in (("truncated", data[:-1]), ("garbled", b"\x02\xff\xfe" + data[3:])):
+        with open(config['HITS_FILE'], "wb") as f:
+            f.write(corrupt)
+        hits = load_hits(config['HITS_FILE'], bank)
+        names_corrupt, _ = sent_codes(run_firmware(config), bank)
+        ok &= check(sum(hits) == 0 and names_corrupt == names,
+                    f"{problem} hits file ignored: {len(names_corrupt)} codes sent in priority order")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
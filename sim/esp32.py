@@ -0,0 +1,80 @@
+"""
+Host-side stand-in for the MicroPython `esp32` module.
+
+Only what the firmware uses is provided. The fake RMT records every
+write_pulses() call instead of driving a pin, and keeps the channel busy for
+as long as the pulses would take on the virtual clock (see vtime.py).
+"""
+from collections import namedtuple
+from time import perf_counter
+
+import vtime
+
+# One write_pulses() call.
+#   start_us, end_us: virtual time at which the pulses start and finish
+#   pulses, data: the arguments (pulses copied, as the caller may reuse its buffer)
+#   host_s: host perf_counter() when the call was made
+Write = namedtuple("Write", ("start_us", "end_us", "pulses", "data", "host_s"))
+
+channels = []  # Every RMT created, so a harness can find them
+
+
+class RMT:
+    """Fake esp32.RMT that records the pulse trains written to it."""
+
+    PULSE_MAX = 32767
+
+    def __init__(self, channel, *, pin=None, clock_div=8, idle_level=False, tx_carrier=None):
+        self.channel = channel
+        self.pin = pin
+        self.clock_div = clock_div
+        self.idle_level = idle_level
+        self.tx_carrier = tx_carrier
+        self.writes = []  # A Write for every write_pulses() call
+        self.busy_until_us = 0
+        self.record_pulses = True  # False to record None instead of copying the pulses
+        channels.append(self)
+
+    def source_freq(self):
+        return 80_000_000
+
+    def write_pulses(self, duration, data=True):
+        # Like the real RMT, only lists and tuples are accepted as sequences
+        if not isinstance(duration, (int, list, tuple)):
+            raise TypeError("duration must be an int, list or tuple")
+        host_s = perf_counter()
+        # Like the real driver, wait for the previous pulses to finish first
+        vtime.advance_to_us(self.busy_until_us)
+        if isinstance(duration, int):
+            ticks = duration * len(data)
+        else:
+            ticks = sum(duration)
+            duration = tuple(duration) if self.record_pulses else None
+        if isinstance(data, list):
+            data = tuple(data)
+        start = vtime.now_us()
+        self.busy_until_us = start + round(ticks * self.tick_us())
+        self.writes.append(Write(start, self.busy_until_us, duration, data, host_s))
+
+    def tick_us(self):
+        """Return the length of one tick in microseconds"""
+        return self.clock_div * 1_000_000 / self.source_freq()
+
+    def wait_done(self, *, timeout=0):
+        if timeout:
+            vtime.advance_to_us(min(self.busy_until_us, vtime.now_us() + timeout * 1000))
+        return vtime.now_us() >= self.busy_until_us
+
+    def loop(self, enable_loop):
+        pass
+
+    def deinit(self):
+        pass
+
+
+WAKEUP_ALL_LOW = False
+WAKEUP_ANY_HIGH = True
+
+
+def wake_on_ext1(pins, level):
+    pass
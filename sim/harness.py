@@ -0,0 +1,148 @@
+"""
+Run the firmware on the host, against the fakes in this directory.
+
+The firmware's main.py does all its work when it is imported, until it calls
+deepsleep(). run_firmware() imports it on the virtual clock (see vtime.py)
+with the fake esp32, machine and neopixel modules, and returns what the fakes
+recorded. configure() sets up the same environment for importing other
+firmware modules (e.g. capture.py), and EdgeStream replays an IR signal into
+an input pin.
+"""
+import bisect
+import contextlib
+import importlib
+import io
+import os
+import sys
+import traceback
+from collections import namedtuple
+from time import perf_counter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIRMWARE = os.path.normpath(os.path.join(HERE, "..", "firmware"))
+FIRMWARE_MODULES = ("main", "config", "leds", "capture", "capture_quality", "ir_protocols", "codebank", "ir_encoder",
+                    "transmit", "scheduler", "codes", "code_compare", "consensus")
+
+# The result of one simulated run.
+#   channels: every fake esp32.RMT the firmware created
+#   end_us: virtual time at which the firmware went to deep sleep
+#   host_s: host time taken by the run, in seconds
+#   output: what the firmware printed
+Run = namedtuple("Run", ("channels", "end_us", "host_s", "output"))
+
+
+def install():
+    """Put the fakes and the firmware on sys.path and patch the host's time and sys modules"""
+    for path in (FIRMWARE, HERE):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    import vtime
+    vtime.install()
+    if not hasattr(sys.implementation, "_machine"):
+        sys.implementation._machine = "Host simulator with ESP32"
+    if not hasattr(sys, "print_exception"):
+        sys.print_exception = traceback.print_exception
+
+
+def button_presses(presses, active_level):
+    """Return an input function for a button held down during each (start_ms, end_ms) of presses"""
+    def level(time_us):
+        for start_ms, end_ms in presses:
+            if start_ms * 1000 <= time_us < end_ms * 1000:
+                return active_level
+        return int(not active_level)
+    return level
+
+
+class EdgeStream:
+    """An IR receiver's output: a code's marks and spaces from start_us on, idle before and after.
+
+    Call it with a virtual time to get the level (as a machine.inputs
+    function). Pin.irq() handlers are called at each edge plus a latency, as
+    MicroPython dispatches them: in order, no sooner than service_us after the
+    previous one, and an edge is lost if queue_depth edges are already waiting.
+    """
+
+    def __init__(self, durations_us, start_us, active_level=0, latency_us=None, service_us=0, queue_depth=None):
+        self.times = [start_us]
+        for duration in durations_us:
+            self.times.append(self.times[-1] + duration)
+        self.active_level = active_level
+        self.latency_us = latency_us  # function(edge index) returning the dispatch latency in us
+        self.service_us = service_us
+        self.queue_depth = queue_depth
+        self.lost = 0  # Edges lost by the last irq_times()
+
+    def __call__(self, time_us):
+        edges = bisect.bisect_right(self.times, time_us)
+        return self.active_level if edges % 2 else int(not self.active_level)
+
+    def irq_times(self, after_us):
+        """Return the virtual times at which an IRQ handler is called for the edges after after_us"""
+        dispatched = []
+        self.lost = 0
+        for k, time_us in enumerate(self.times):
+            if time_us < after_us:
+                continue
+            waiting = len(dispatched) - bisect.bisect_right(dispatched, time_us)
+            if self.queue_depth is not None and waiting >= self.queue_depth:
+                self.lost += 1
+                continue
+            when_us = time_us + (self.latency_us(k) if self.latency_us else 0)
+            if dispatched:
+                when_us = max(when_us, dispatched[-1] + self.service_us)
+            dispatched.append(when_us)
+        return dispatched
+
+
+def configure(config=None):
+    """Set up a fresh simulated boot: forget the firmware modules, reset the fakes
+    and the virtual clock, and override config.py settings.
+    Args:
+        config (dict): config.py settings to override,
+                       e.g. {"CODE_BANK_FILE": "firmware/codes.bin"}
+    Returns:
+        module: the firmware's config module.
+    """
+    install()
+    import esp32
+    import machine
+    import vtime
+
+    for name in FIRMWARE_MODULES:
+        sys.modules.pop(name, None)
+    del esp32.channels[:]
+    vtime.reset()
+    firmware_config = importlib.import_module("config")
+    for key, value in (config or {}).items():
+        setattr(firmware_config, key, value)
+    machine.inputs.clear()
+    return firmware_config
+
+
+def run_firmware(config=None, quiet=True, presses=()):
+    """Boot the firmware once, until it goes into deep sleep.
+    Args:
+        config (dict): config.py settings to override (see configure())
+        quiet (bool): don't print what the firmware printed (it is in Run.output either way)
+        presses: (start_ms, end_ms) virtual times at which the button is held down
+    Returns:
+        Run: what happened.
+    """
+    firmware_config = configure(config)
+    import esp32
+    import machine
+    import vtime
+
+    machine.inputs[firmware_config.BUTTON_PIN] = button_presses(presses, firmware_config.BUTTON_ACTIVE_LEVEL)
+
+    output = io.StringIO()
+    start = perf_counter()
+    with contextlib.redirect_stdout(output):
+        try:
+            importlib.import_module("main")
+        except machine.DeepSleep:
+            pass
+    if not quiet:
+        print(output.getvalue(), end="")
+    return Run(list(esp32.channels), vtime.now_us(), perf_counter() - start, output.getvalue())
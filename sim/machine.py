@@ -0,0 +1,157 @@
+"""
+Host-side stand-in for the MicroPython `machine` module.
+
+Only what the firmware uses is provided. Pins record every level they are
+set to, with the virtual time (see vtime.py). Input pins read their level
+from `inputs`, so a harness can script e.g. button presses. An input that
+also has an irq_times(after_us) method (see harness.EdgeStream) calls a
+pin's irq() handler at the virtual times it returns, and the fake I2S
+samples its sd pin's input on the virtual clock.
+"""
+import struct
+
+import vtime
+
+inputs = {}  # pin id -> function(time_us) returning the level of an input pin
+
+PWRON_RESET = 1
+HARD_RESET = 2
+WDT_RESET = 3
+DEEPSLEEP_RESET = 4
+SOFT_RESET = 5
+
+_reset_cause = PWRON_RESET
+
+
+class DeepSleep(BaseException):
+    """Raised by deepsleep() to end a simulated run.
+
+    It is a BaseException so that the firmware's `except Exception` handlers
+    don't catch it.
+    """
+
+
+class Pin:
+    """Fake machine.Pin that records its output levels."""
+
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 2
+    PULL_DOWN = 1
+    DRIVE_0 = 0
+    DRIVE_1 = 1
+    DRIVE_2 = 2
+    DRIVE_3 = 3
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+    WAKE_LOW = 4
+    WAKE_HIGH = 5
+
+    def __init__(self, id, mode=-1, pull=-1, *, value=None, drive=None, hold=None):
+        self.id = id
+        self.mode = None
+        self.pull = None
+        self.hold = False
+        self.handler = None
+        self.level = 0
+        self.history = []  # (time_us, level) for every output change
+        self.init(mode, pull, value=value, drive=drive, hold=hold)
+
+    def init(self, mode=-1, pull=-1, *, value=None, drive=None, hold=None):
+        if mode != -1:
+            self.mode = mode
+        if pull != -1:
+            self.pull = pull
+        if hold is not None:
+            self.hold = hold
+        if value is not None:
+            self.value(value)
+
+    def value(self, x=None):
+        if x is None:
+            if self.mode == Pin.IN and self.id in inputs:
+                return inputs[self.id](vtime.now_us())
+            return self.level
+        self.level = int(bool(x))
+        self.history.append((vtime.now_us(), self.level))
+
+    def __call__(self, x=None):
+        return self.value(x)
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, *, hard=False):
+        vtime.cancel(self)
+        self.handler = handler
+        source = inputs.get(self.id)
+        if handler is not None and hasattr(source, "irq_times"):
+            for when_us in source.irq_times(vtime.now_us()):
+                vtime.schedule(when_us, lambda: handler(self), self)
+
+
+class I2S:
+    """Fake machine.I2S receiver that samples its sd pin on the virtual clock.
+
+    Sampling starts when it is created and continues as if into a DMA ring
+    buffer of ibuf bytes: readinto() returns the oldest samples not yet read
+    (waiting for them if need be), and samples older than ibuf are lost.
+    Each sample is one bit of a word, most significant bit first.
+    """
+
+    RX = 1
+    TX = 0
+    MONO = 0
+    STEREO = 1
+
+    def __init__(self, id, *, sck, ws, sd, mode, bits, format, rate, ibuf, mck=None):
+        self.id = id
+        self.sd = sd
+        self.bits = bits
+        self.channels = 2 if format == I2S.STEREO else 1
+        self.sample_us = 1_000_000 / (rate * bits * self.channels)
+        self.ibuf = ibuf
+        self.next_us = vtime.now_us()  # Virtual time of the next sample to read
+        self.active = True
+
+    def readinto(self, buf):
+        view = memoryview(buf).cast("B")
+        words = len(view) // 4
+        read_us = words * 32 * self.sample_us
+        ring_us = self.ibuf * 8 * self.sample_us
+        if vtime.now_us() - self.next_us > ring_us:
+            self.next_us = vtime.now_us() - ring_us  # Overrun: the oldest samples were overwritten
+        vtime.advance_to_us(self.next_us + read_us)
+        level = inputs.get(self.sd.id, lambda time_us: self.sd.level)
+        t = self.next_us
+        for k in range(words):
+            word = 0
+            for _ in range(32):
+                word = (word << 1) | level(t)
+                t += self.sample_us
+            struct.pack_into("<I", view, 4 * k, word)
+        self.next_us = t
+        return 4 * words
+
+    def deinit(self):
+        self.active = False
+
+
+def deepsleep(time_ms=0):
+    raise DeepSleep(time_ms)
+
+
+def lightsleep(time_ms=0):
+    vtime.advance_us(time_ms * 1000)
+
+
+def reset_cause():
+    return _reset_cause
+
+
+def freq(hz=None):
+    return 240_000_000
@@ -0,0 +1,14 @@
+"""
+Host-side stand-in for the MicroPython `micropython` module.
+"""
+
+
+def const(value):
+    return value
+
+
+def native(function):
+    return function
+
+
+viper = native
@@ -0,0 +1,30 @@
+"""
+Host-side stand-in for the MicroPython `neopixel` module.
+"""
+import vtime
+
+
+class NeoPixel:
+    """Fake neopixel.NeoPixel that records the colors written to it."""
+
+    def __init__(self, pin, n, bpp=3, timing=1):
+        self.pin = pin
+        self.n = n
+        self.pixels = [(0,) * bpp for _ in range(n)]
+        self.writes = []  # (time_us, colors) for every write() call
+
+    def __len__(self):
+        return self.n
+
+    def __setitem__(self, index, color):
+        self.pixels[index] = tuple(color)
+
+    def __getitem__(self, index):
+        return self.pixels[index]
+
+    def fill(self, color):
+        for i in range(self.n):
+            self.pixels[i] = tuple(color)
+
+    def write(self):
+        self.writes.append((vtime.now_us(), tuple(self.pixels)))
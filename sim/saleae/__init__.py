@@ -0,0 +1 @@
+"""Host-side stand-in for the `saleae` package of logic2-automation (see automation.py)."""
@@ -0,0 +1,171 @@
+"""
+Host-side stand-in for `saleae.automation` (logic2-automation), the Logic 2 automation API.
+
+Only what capture_saleae.py and capture_session.py use is provided. Instead
+of a Logic analyzer, an IR receiver's output is played on a virtual clock in
+seconds: play() sets the times at which the input channel toggles (idle high
+before the first). Each capture records a window of that signal and moves
+the clock on, as a real capture would take that long:
+  - TimedCaptureMode records duration_seconds from the current time
+  - DigitalTriggerCaptureMode waits for the next edge of the trigger type and
+    records after_trigger_seconds after it (times relative to the trigger)
+Starting a capture takes START_SECONDS, during which nothing is recorded.
+The exports are written as Logic 2 writes them: `digital_<channel>.bin`
+binary files (see saleae_binary.py) or `digital.csv`.
+
+`connections` counts Manager.connect() and launch() calls, and `captures`
+records the (start, end) virtual time of every capture.
+"""
+import bisect
+import enum
+import os
+
+from saleae_binary import write_binary_export, write_csv_export
+
+START_SECONDS = 0.3  # Virtual time from start_capture() to the first sample
+PRE_TRIGGER_SECONDS = 0.5  # Recorded before the trigger in DigitalTriggerCaptureMode
+
+signal = []  # Times (s) at which the input channel toggles, idle high before the first
+now = 0.0  # Virtual time (s)
+connections = 0
+captures = []  # (start, end) virtual time of every capture
+
+
+def play(transitions):
+    """Reset the virtual clock and play an input signal from time 0.
+
+    Args:
+        transitions: ascending times (s) at which the input toggles; it is high (idle) before the first.
+    """
+    global signal, now, connections
+    signal = list(transitions)
+    now = 0.0
+    connections = 0
+    del captures[:]
+
+
+class DigitalTriggerType(enum.Enum):
+    RISING = 0
+    FALLING = 1
+    PULSE_HIGH = 2
+    PULSE_LOW = 3
+
+
+class LogicDeviceConfiguration:
+    def __init__(self, enabled_digital_channels=(), enabled_analog_channels=(), digital_sample_rate=None,
+                 analog_sample_rate=None, digital_threshold_volts=None, glitch_filters=()):
+        self.enabled_digital_channels = list(enabled_digital_channels)
+        self.digital_sample_rate = digital_sample_rate
+        self.digital_threshold_volts = digital_threshold_volts
+
+
+class TimedCaptureMode:
+    def __init__(self, duration_seconds, trim_data_seconds=None):
+        self.duration_seconds = duration_seconds
+        self.trim_data_seconds = trim_data_seconds
+
+
+class DigitalTriggerCaptureMode:
+    def __init__(self, trigger_type, trigger_channel_index, min_pulse_width_seconds=None,
+                 max_pulse_width_seconds=None, after_trigger_seconds=None, trim_data_seconds=None,
+                 linked_channels=()):
+        self.trigger_type = trigger_type
+        self.trigger_channel_index = trigger_channel_index
+        self.after_trigger_seconds = after_trigger_seconds or 0.0
+
+
+class CaptureConfiguration:
+    def __init__(self, buffer_size_megabytes=None, capture_mode=None):
+        self.buffer_size_megabytes = buffer_size_megabytes
+        self.capture_mode = capture_mode
+
+
+class Capture:
+    """A finished capture of the window [start, end) of the signal, with times relative to origin"""
+
+    def __init__(self, channels, start, end, origin):
+        self.channels = channels
+        self.start = start
+        self.end = end
+        self.origin = origin
+
+    def _window(self):
+        """Return (initial level, transition times relative to origin) of the captured window"""
+        first = bisect.bisect_left(signal, self.start)
+        last = bisect.bisect_left(signal, self.end)
+        initial_state = 1 ^ (first & 1)
+        return initial_state, [round(t - self.origin, 9) for t in signal[first:last]]
+
+    def wait(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def close(self):
+        pass
+
+    def export_raw_data_binary(self, directory, *, analog_channels=None, digital_channels=None,
+                               analog_downsample_ratio=1):
+        initial_state, transitions = self._window()
+        for channel in digital_channels if digital_channels is not None else self.channels:
+            write_binary_export(os.path.join(directory, f"digital_{channel}.bin"), transitions, initial_state,
+                                self.start - self.origin, self.end - self.origin)
+
+    def export_raw_data_csv(self, directory, *, analog_channels=None, digital_channels=None,
+                            analog_downsample_ratio=1, iso8601_timestamp=False):
+        initial_state, transitions = self._window()
+        write_csv_export(os.path.join(directory, "digital.csv"), transitions, initial_state,
+                         self.start - self.origin, self.end - self.origin)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Manager:
+    @classmethod
+    def connect(cls, *, address="127.0.0.1", port=10430, connect_timeout_seconds=None, grpc_channel_arguments=None):
+        global connections
+        connections += 1
+        return cls()
+
+    @classmethod
+    def launch(cls, application_path=None, connect_timeout_seconds=None, grpc_channel_arguments=None, port=None):
+        return cls.connect()
+
+    def start_capture(self, *, device_configuration, device_id=None, capture_configuration=None):
+        """Record the signal as capture_configuration says, moving the virtual clock to the end of the capture"""
+        global now
+        channels = device_configuration.enabled_digital_channels
+        mode = capture_configuration.capture_mode
+        now += START_SECONDS
+        if isinstance(mode, TimedCaptureMode):
+            start = origin = now
+            end = now + mode.duration_seconds
+        elif isinstance(mode, DigitalTriggerCaptureMode):
+            level = 0 if mode.trigger_type == DigitalTriggerType.FALLING else 1
+            k = bisect.bisect_left(signal, now)
+            while k < len(signal) and (1 ^ ((k + 1) & 1)) != level:
+                k += 1
+            if k >= len(signal):
+                raise RuntimeError("The trigger never came (nothing left in the played signal)")
+            origin = signal[k]
+            start = max(now, origin - PRE_TRIGGER_SECONDS)
+            end = origin + mode.after_trigger_seconds
+        else:
+            raise NotImplementedError(f"{type(mode).__name__} isn't faked")
+        now = end
+        captures.append((start, end))
+        return Capture(channels, start, end, origin)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,102 @@
+"""
+Virtual clock for running firmware code on the host.
+
+Nothing really sleeps: sleep_ms() and friends just move the clock forward, and
+the fakes in this directory (RMT, Pin, NeoPixel) timestamp what they record
+with it. Callbacks can be scheduled at virtual times (e.g. pin interrupts,
+see machine.Pin.irq()); they run, in order, as the clock passes them. install() adds MicroPython's extra `time` functions (sleep_ms,
+ticks_us, ...) to the host's `time` module, backed by this clock, so firmware
+code that does `from time import sleep_ms` runs unchanged.
+"""
+import heapq
+import itertools
+import time
+
+_now_us = 0
+_events = []  # Heap of (time_us, sequence number, owner, callback)
+_sequence = itertools.count()
+
+
+def now_us():
+    """Return the virtual time in microseconds"""
+    return _now_us
+
+
+def advance_us(us):
+    """Move the virtual clock forward by us microseconds, running any callbacks scheduled on the way"""
+    global _now_us
+    if us <= 0:
+        return
+    end_us = _now_us + int(us)
+    while _events and _events[0][0] <= end_us:
+        when_us, _, _, callback = heapq.heappop(_events)
+        _now_us = max(_now_us, when_us)
+        callback()
+    _now_us = max(_now_us, end_us)
+
+
+def schedule(when_us, callback, owner=None):
+    """Call callback() when the virtual clock reaches when_us.
+    Args:
+        owner: anything, to cancel() the callback by.
+    """
+    heapq.heappush(_events, (int(when_us), next(_sequence), owner, callback))
+
+
+def cancel(owner):
+    """Forget the scheduled callbacks of owner"""
+    _events[:] = [event for event in _events if event[2] is not owner]
+    heapq.heapify(_events)
+
+
+def advance_to_us(when_us):
+    """Move the virtual clock forward to when_us (never backwards)"""
+    advance_us(when_us - _now_us)
+
+
+def reset():
+    """Set the virtual clock back to zero, and forget any scheduled callbacks"""
+    global _now_us
+    _now_us = 0
+    del _events[:]
+
+
+def sleep_ms(ms):
+    advance_us(ms * 1000)
+
+
+def sleep_us(us):
+    advance_us(us)
+
+
+def sleep(seconds):
+    advance_us(seconds * 1_000_000)
+
+
+def ticks_us():
+    return _now_us
+
+
+def ticks_ms():
+    return _now_us // 1000
+
+
+def ticks_add(ticks, delta):
+    return ticks + delta
+
+
+def ticks_diff(ticks1, ticks2):
+    return ticks1 - ticks2
+
+
+MICROPYTHON_TIME = ("sleep_ms", "sleep_us", "ticks_us", "ticks_ms", "ticks_add", "ticks_diff")
+
+
+def install():
+    """Add the MicroPython-only time functions to the host's time module.
+
+    time.sleep() and the host's own clocks are left alone, so host-side timing
+    (e.g. time.perf_counter()) still works.
+    """
+    for name in MICROPYTHON_TIME:
+        setattr(time, name, globals()[name])